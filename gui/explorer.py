@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+from PyQt5.QtCore import Qt, pyqtSignal
+import time
+from rules.database import signedKey
+
+
+class Explorer(QTreeWidget):
+    """Opening explorer. Shows the continuations of a position with number of games, team score and average rating,
+    as aggregated in the explorer table of a game database."""
+    moveActivated = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.database = None
+        self.itemDoubleClicked.connect(self.emitMove)
+
+    def setDatabase(self, database):
+        """Sets game database to read the statistics from."""
+        if self.database:
+            self.database.close()
+        self.database = database
+
+    def showPosition(self, position, toAlgebraic):
+        """Shows the continuations of position (a Position), using toAlgebraic to convert move codes for display.
+        Returns lookup time in milliseconds, or None if there is no database."""
+        self.clear()
+        if not self.database:
+            return None
+        start = time.perf_counter()
+        rows = self.database.exploreKey(signedKey(position.key()))
+        milliseconds = (time.perf_counter() - start) * 1000
+        for row in rows:
+            move = position.findMoveName(row['move'])
+            if move is None:
+                continue  # Zobrist key collision
+            games = row['games']
+            item = QTreeWidgetItem([toAlgebraic(position.encodeMove(move)), str(games),
+                                    '%d%%' % (100 * row['team1Wins'] // games),
+                                    '%d%%' % (100 * row['team2Wins'] // games),
+                                    '%d%%' % (100 * row['draws'] // games),
+                                    str(row['averageRating'] or '-')])
+            item.setData(0, Qt.UserRole, row['move'])
+            self.addTopLevelItem(item)
+        return milliseconds
+
+    def emitMove(self, item):
+        """Emits the move of the double-clicked row."""
+        self.moveActivated.emit(item.data(0, Qt.UserRole))
@@ -18,13 +18,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from PyQt5.QtWidgets import QWidget, QMainWindow, QSizePolicy, QLayout, QListWidget, QListWidgetItem, QListView, \
-    QFrame, QAbstractItemView, QFileDialog, QPushButton, QLineEdit
-from PyQt5.QtCore import Qt, QObject, QSize, QRect, QPoint, pyqtSignal, QEvent
-from PyQt5.QtGui import QPainter, QPalette, QIcon, QColor, QFont, QFontMetrics
-from collections import deque
-from datetime import date
+from PyQt5.QtWidgets import QWidget, QMainWindow, QSizePolicy, QLayout, QFileDialog, QPushButton, QLineEdit, \
+    QInputDialog
+from PyQt5.QtCore import Qt, QObject, QSize, QRect, QPoint, QPointF, pyqtSignal, QEvent, QAbstractListModel, \
+    QModelIndex, QThread, pyqtSlot, QProcess, QTimer
+from PyQt5.QtGui import QPainter, QPalette, QIcon, QColor, QTextLayout, QPixmap
 from ui.mainwindow import Ui_mainWindow
+import os
+import shlex
+from collections import deque
+import rules.board
+import rules.algorithm
+import rules.analysis
+import rules.engines
+import rules.movelist
+import rules.protocol
+import rules.search
+from rules.bitboard import FILES
+from rules.database import GameDatabase
+from rules.movegen import decodeMove, moveFromCode, moveName, parseMoveName
 
 
 class MainWindow(QMainWindow, Ui_mainWindow):
@@ -38,6 +50,11 @@ class MainWindow(QMainWindow, Ui_mainWindow):
         self.gridLayout.addWidget(self.view, 0, 0, 3, 1)
         self.algorithm = Teams()
 
+        # Move list, updated incrementally as moves are added to the move tree
+        self.moveListModel = MoveListModel(self.algorithm.toAlgebraic)
+        self.moveListView.setModel(self.moveListModel)
+        self.moveListView.viewport().installEventFilter(self)  # Clicking a move goes to it
+
         # Set piece icons
         pieces = ['rP', 'rN', 'rR', 'rB', 'rQ', 'rK',
                   'bP', 'bN', 'bR', 'bB', 'bQ', 'bK',
@@ -57,8 +74,8 @@ class MainWindow(QMainWindow, Ui_mainWindow):
         self.algorithm.currentPlayerChanged.connect(self.view.highlightPlayer)
         self.algorithm.fen4Generated.connect(self.fenField.setPlainText)
         self.algorithm.pgn4Generated.connect(self.pgnField.setPlainText)
-        self.algorithm.moveTreeChanged.connect(self.updateMoveTree)
-        self.algorithm.moveTreeChanged.connect(self.algorithm.updateMoves)
+        self.algorithm.moveAdded.connect(self.moveListModel.addNode)
+        self.algorithm.moveTreeReset.connect(self.moveListModel.reset)
         self.algorithm.removeHighlight.connect(self.view.removeHighlightsOfColor)
         self.view.playerNameEdited.connect(self.algorithm.updatePlayerNames)
         self.algorithm.addHighlight.connect(self.addHighlight)
@@ -66,7 +83,6 @@ class MainWindow(QMainWindow, Ui_mainWindow):
         # Connect actions
         self.actionQuit.triggered.connect(self.close)
         self.actionNew_Game.triggered.connect(self.algorithm.newGame)
-        self.actionNew_Game.triggered.connect(self.moveListWidget.clear)
         self.actionCopy_FEN4.triggered.connect(self.fenField.selectAll)
         self.actionCopy_FEN4.triggered.connect(self.fenField.copy)
         self.actionPaste_FEN4.triggered.connect(self.fenField.clear)
@@ -74,8 +90,6 @@ class MainWindow(QMainWindow, Ui_mainWindow):
 
         self.boardResetButton.clicked.connect(self.algorithm.newGame)
         self.boardResetButton.clicked.connect(self.view.repaint)  # Forced repaint
-        self.boardResetButton.clicked.connect(self.moveListWidget.clear)
-        self.boardResetButton.clicked.connect(self.resetMoves)
         self.getFenButton.clicked.connect(self.algorithm.getBoardState)
         self.getFenButton.clicked.connect(self.fenField.repaint)
         self.setFenButton.clicked.connect(self.setFen4)
@@ -90,18 +104,71 @@ class MainWindow(QMainWindow, Ui_mainWindow):
         self.lastMoveButton.clicked.connect(self.algorithm.lastMove)
         self.lastMoveButton.clicked.connect(self.view.repaint)
 
+        # Opening explorer next to the move list, updated after every position change (queued, so that castling and
+        # en passant state are up to date)
+        self.explorer.moveActivated.connect(self.playExplorerMove)
+        self.algorithm.currentPlayerChanged.connect(self.updateExplorer, Qt.QueuedConnection)
+        self.actionNew_Game.triggered.connect(self.updateExplorer)
+        self.boardResetButton.clicked.connect(self.updateExplorer)
+        self.actionOpen_Database.triggered.connect(self.openDatabaseDialog)
+        if os.path.exists('data/games.db'):
+            self.explorer.setDatabase(GameDatabase('data/games.db'))
+
+        # Search engine, running in a worker thread so that the view stays responsive while it thinks. Its lines are
+        # shown in the status bar.
+        self.engine = Engine()
+        self.engineThread = QThread()
+        self.engine.moveToThread(self.engineThread)
+        self.engineThread.start()
+        self.engineTime = 5.0  # Seconds per engine move
+        self.engineRequest = None  # Number of the search request whose best move is to be played
+        self.engine.info.connect(self.showEngineInfo)
+        self.engine.bestMove.connect(self.playEngineMove)
+        self.actionEngine_Move.triggered.connect(self.requestEngineMove)
+        self.actionAnalyze.toggled.connect(self.analyze)
+        self.actionMax_N.toggled.connect(self.analyze)
+        self.actionSearch_Threads.triggered.connect(self.searchThreadsDialog)
+        self.actionExternal_Engine.triggered.connect(self.externalEngineDialog)
+        self.externalEngine = None  # Used instead of the built-in engine if set
+        self.algorithm.currentPlayerChanged.connect(self.analyze, Qt.QueuedConnection)
+        self.actionNew_Game.triggered.connect(self.analyze)
+        self.boardResetButton.clicked.connect(self.analyze)
+
+        # Whole-game analysis in worker processes, driven from a thread of its own. The annotations are added to the
+        # move list as they arrive; editing the move tree cancels the analysis.
+        self.gameAnalysis = GameAnalysis()
+        self.gameAnalysisThread = QThread()
+        self.gameAnalysis.moveToThread(self.gameAnalysisThread)
+        self.gameAnalysisThread.start()
+        self.gameAnalysis.annotated.connect(self.moveListModel.annotate)
+        self.gameAnalysis.finished.connect(self.gameAnalysisFinished)
+        self.actionAnalyze_Game.triggered.connect(self.analyzeGame)
+        self.algorithm.gameOver.connect(self.analyzeGame)
+        self.algorithm.moveAdded.connect(self.cancelGameAnalysis)
+        self.algorithm.moveTreeReset.connect(self.cancelGameAnalysis)
+
         # Start new game
         self.algorithm.newGame()
+        self.updateExplorer()
 
         # Initialize variables
         self.clickPoint = QPoint()
         self.selectedSquare = 0
         self.moveHighlight = 0
-        self.moves = []
 
-    def resetMoves(self):
-        """Clears the list of moves if the board is reset."""
-        self.moves = []
+    def closeEvent(self, event):
+        """Overrides QWidget closeEvent() method. Stops the engine and game analysis threads."""
+        self.engine.stop()
+        self.engineThread.quit()
+        self.engineThread.wait()
+        self.engine.shutdown()
+        if self.externalEngine:
+            self.externalEngine.shutdown()
+        self.gameAnalysis.cancel()
+        self.gameAnalysisThread.quit()
+        self.gameAnalysisThread.wait()
+        self.gameAnalysis.shutdown()
+        super().closeEvent(event)
 
     def addHighlight(self, fromFile, fromRank, toFile, toRank, color):
         fromSquare = self.view.SquareHighlight(fromFile, fromRank, color)
@@ -152,6 +219,37 @@ class MainWindow(QMainWindow, Ui_mainWindow):
                 self.moveHighlight = 0
             self.selectedSquare = 0
 
+    def eventFilter(self, obj, event):
+        """Overrides QObject eventFilter() method. Goes to the move clicked in the move list."""
+        if obj is self.moveListView.viewport() and event.type() == QEvent.MouseButtonRelease:
+            index = self.moveListView.indexAt(event.pos())
+            if index.isValid():
+                node = self.moveListModel.nodeAt(index.row(), self.moveListColumn(index, event.pos()))
+                self.algorithm.seekNode(node)
+        return super().eventFilter(obj, event)
+
+    def moveListColumn(self, index, point):
+        """Returns the character column of the text of the move list row at index under point (viewport coordinates),
+        laid out with word wrap the same as in the view."""
+        rect = self.moveListView.visualRect(index)
+        text = self.moveListModel.rowText(index.row())
+        layout = QTextLayout(text, self.moveListView.font())
+        layout.beginLayout()
+        height = 0
+        while True:
+            line = layout.createLine()
+            if not line.isValid():
+                break
+            line.setLineWidth(rect.width())
+            line.setPosition(QPointF(0, height))
+            height += line.height()
+        layout.endLayout()
+        for number in range(layout.lineCount()):
+            line = layout.lineAt(number)
+            if point.y() - rect.top() < line.y() + line.height():
+                return line.xToCursor(point.x() - rect.left())
+        return len(text)
+
     def keyPressEvent(self, event):
         """Handles arrow key press events to go to previous, next, first or last move."""
         if event.key() == Qt.Key_Left:
@@ -179,850 +277,482 @@ class MainWindow(QMainWindow, Ui_mainWindow):
         fen4 = self.fenField.toPlainText()
         self.algorithm.setBoardState(fen4)
         self.view.repaint()  # Forced repaint
+        self.updateExplorer()
+        self.analyze()
 
-    def updateMoveTree(self, node):
-        """Constructs the move list based on the move tree."""
-        # Custom QListWidget class for rows in main list
-        class Row(QListWidget):
-            def __init__(self):
-                super().__init__()
-                self.setFlow(QListView.LeftToRight)
-                self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-                self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-                self.setWrapping(True)
-                self.setFrameShape(QFrame.NoFrame)
-                self.setSelectionMode(QAbstractItemView.NoSelection)
-                self.setFocusPolicy(Qt.NoFocus)
-                self.setStyleSheet("color: rgb(0, 0, 0); font-family: Arial; font-weight: bold; font-size: 12; "
-                                   "padding: 2px; margin: 0px;")
-
-            def sizeHint(self):
-                """Overrides sizeHint() method."""
-                fm = QFontMetrics(QFont('Arial', 12))  # 12pt = 16px
-                spacing = 17  # Guess
-                rowWidth = sum(fm.width(self.item(index).text()) + spacing for index in range(self.count()))
-                width = 295
-                height = 22 * (rowWidth // width + 1)
-                return QSize(width, height)
-
-        # List moves with move number and variation root and number (tuple), i.e. [(moveNum, move, rootNum, root, var)]
-        moves = self.traverse(node, self.moves)
-        self.moves = moves
-        self.moveListWidget.clear()
-        mainLineRoot = (0, 'root')
-        mainline = [move[:2] for move in moves if move[-3:] == (mainLineRoot[0], mainLineRoot[1], 0)]
-        prevVar = 0
-        prevRoot = mainLineRoot
-        roots = [prevRoot]
-        row = Row()
-        for move in moves:
-            root = move[-3:-1]
-            var = move[-1]
-            # Same variation root
-            if root == prevRoot:
-                # Same variation number
-                if var == prevVar:
-                    flag = (move[0] - 1) % 4
-                    if flag == 0:
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. '
-                    else:
-                        moveNum = ''
-                    if root == mainLineRoot and var == 0:
-                        sep = ' '
-                    else:
-                        # Remove closing bracket from previous move, if present
-                        if row.item(row.count() - 1).text()[-2] == ')':
-                            row.item(row.count() - 1).setText(row.item(row.count() - 1).text()[:-2] + ' ')
-                        sep = ') '
-                    moveItem = QListWidgetItem(moveNum + move[1] + sep)
-                    row.addItem(moveItem)
-                # Higher variation number = new variation from same root
-                elif var > prevVar:
-                    item = QListWidgetItem(self.moveListWidget)
-                    item.setSizeHint(row.sizeHint())
-                    self.moveListWidget.addItem(item)
-                    self.moveListWidget.setItemWidget(item, row)
-                    # Start of variation -> prepend opening bracket and add 1, 2 or 3 dots, depending on current player
-                    flag = ((move[0] - 1) % 4)
-                    if flag == 0:  # Red's move
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. '
-                    elif flag == 1:  # Blue's move, add one dot
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. . '
-                    elif flag == 2:  # Yellow's move, add two dots
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. .. '
-                    else:  # Green's move, add three dots
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. ... '
-                    if root == mainLineRoot and var == 0:
-                        sep = ' '
-                    else:
-                        sep = ') '
-                    moveItem = QListWidgetItem('(' + moveNum + move[1] + sep)
-                    row = Row()
-                    if root in mainline or root == mainLineRoot:
-                        row.setStyleSheet("color: rgb(100, 100, 100); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    else:
-                        row.setStyleSheet("color: rgb(150, 150, 150); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    row.addItem(moveItem)
-                # Lower variation number = returning to previous variation with same root
-                elif var < prevVar:
-                    item = QListWidgetItem(self.moveListWidget)
-                    item.setSizeHint(row.sizeHint())
-                    self.moveListWidget.addItem(item)
-                    self.moveListWidget.setItemWidget(item, row)
-                    flag = ((move[0] - 1) % 4 == 0)
-                    if flag:
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. '
-                    else:
-                        moveNum = ''
-                    if root == mainLineRoot and var == 0:
-                        sep = ' '
-                    else:
-                        sep = ') '
-                    moveItem = QListWidgetItem(moveNum + move[1] + sep)
-                    row = Row()
-                    if root == mainLineRoot:
-                        pass
-                    elif root in mainline:
-                        row.setStyleSheet("color: rgb(100, 100, 100); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    else:
-                        row.setStyleSheet("color: rgb(150, 150, 150); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    row.addItem(moveItem)
-            # Different variation root
-            else:
-                if root not in roots:
-                    roots.append(root)
-                    roots.sort()
-                # If variation root has higher move number than previous, start new variation
-                if root[0] > prevRoot[0]:
-                    # Remove closing bracket from previous move, if present
-                    if row.item(row.count() - 1).text()[-2] == ')':
-                        row.item(row.count() - 1).setText(row.item(row.count() - 1).text()[:-2] + ' ')
-                    item = QListWidgetItem(self.moveListWidget)
-                    item.setSizeHint(row.sizeHint())
-                    self.moveListWidget.addItem(item)
-                    self.moveListWidget.setItemWidget(item, row)
-                    # Start of variation -> prepend opening bracket and add 1, 2 or 3 dots, depending on current player
-                    flag = ((move[0] - 1) % 4)
-                    if flag == 0:  # Red's move
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. '
-                    elif flag == 1:  # Blue's move, add one dot
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. . '
-                    elif flag == 2:  # Yellow's move, add two dots
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. .. '
-                    else:  # Green's move, add three dots
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. ... '
-                    moveItem = QListWidgetItem('(' + moveNum + move[1] + ') ')
-                    row = Row()
-                    if root in mainline:
-                        row.setStyleSheet("color: rgb(100, 100, 100); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    else:
-                        row.setStyleSheet("color: rgb(150, 150, 150); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    row.addItem(moveItem)
-                # If variation root has lower move number than previous, return to previous variation
-                else:
-                    # Add closing bracket(s) if moving out of multiple variations
-                    step = roots.index(prevRoot) - roots.index(root)
-                    if step > 1 and roots.index(root) != 0:
-                        row.item(row.count() - 1).setText(row.item(row.count() - 1).text()[:-1] + ')'*(step - 1) + ' ')
-                    item = QListWidgetItem(self.moveListWidget)
-                    item.setSizeHint(row.sizeHint())
-                    self.moveListWidget.addItem(item)
-                    self.moveListWidget.setItemWidget(item, row)
-                    flag = ((move[0] - 1) % 4 == 0)
-                    if flag:
-                        moveNum = str((move[0] - 1) // 4 + 1) + '. '
-                    else:
-                        moveNum = ''
-                    if root == mainLineRoot and var == 0:
-                        sep = ' '
-                    else:
-                        sep = ') '
-                    moveItem = QListWidgetItem(moveNum + move[1] + sep)
-                    row = Row()
-                    if root == mainLineRoot:
-                        pass
-                    elif root in mainline:
-                        row.setStyleSheet("color: rgb(100, 100, 100); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    else:
-                        row.setStyleSheet("color: rgb(150, 150, 150); font-weight: bold; font-size: 12; "
-                                          "background-color: rgb(240, 240, 240); padding: 2px; margin: 0px;")
-                    row.addItem(moveItem)
-                prevRoot = root
-            prevVar = var
-        # End of move list -> append rest of main line moves
-        item = QListWidgetItem(self.moveListWidget)
-        item.setSizeHint(row.sizeHint())
-        self.moveListWidget.addItem(item)
-        self.moveListWidget.setItemWidget(item, row)
-
-    def traverse(self, node, moves=None, moveNum=0, rootNum=0, root=None, var=0, rootNode=None):
-        """Traverses move tree to create list of moves, sorted by move number and variation (incl. variation root)."""
-        # The tree is represented as a nested list with move strings, i.e. node = ['parent', [children]]
-        parent = node[0]
-        if not root:
-            root = parent
-        if not rootNode:
-            rootNode = node
-        if not moves:
-            moves = self.moves
-        children = node[1]
-        if children:
-            for child in children:
-                self.traverse(child, moves, moveNum + 1, rootNum, root, var, rootNode)
-                var += 1
-                # Root should be first element of previous level -> go back to previous node with multiple children
-                root = parent  # FIXME root of variation is not necessarily previous move
-                rootNum = moveNum
-        elif not moves.count((moveNum, parent, rootNum, root, var)):
-            moves.append((moveNum, parent, rootNum, root, var))
-        # Sort moves: insert variations after the main move
-        prevVars = []
-        i = 0
-        while i < len(moves):
-            varMoves = [var for var in moves if var[-2] == moves[i][1]]
-            varMoves = sorted(varMoves, key=lambda element: (element[-1], element[0]))
-            if prevVars:
-                shift = 2 + len(prevVars)
-            else:
-                shift = 2
-            moves = moves[:i+shift] + varMoves + moves[i+shift:]
-            # Remove duplicate elements from the back
-            moves.reverse()
-            for move in moves:
-                while moves.count(move) > 1:
-                    moves.remove(move)
-            moves.reverse()
-            prevVars = varMoves
-            i += 1
-        return moves
-
-
-class Board(QObject):
-    """The Board is the actual chess board and is the data structure shared between the View and the Algorithm."""
-    boardReset = pyqtSignal()
-    dataChanged = pyqtSignal(int, int)
+    def openDatabaseDialog(self):
+        """Opens a game database (created with tools.pgn4import --database) for the opening explorer."""
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        # noinspection PyTypeChecker,PyCallByClass
+        fileName, _ = QFileDialog.getOpenFileName(self, "Open Game Database", "data/",
+                                                  "Game Databases (*.db)", options=options)
+        if fileName:
+            self.explorer.setDatabase(GameDatabase(fileName))
+            self.updateExplorer()
+
+    def updateExplorer(self):
+        """Shows the continuations of the current position in the opening explorer."""
+        milliseconds = self.explorer.showPosition(self.algorithm.getPosition(), self.algorithm.toAlgebraic)
+        if milliseconds is not None:
+            self.statusbar.showMessage('Explorer: %.1f ms' % milliseconds)
+
+    def engineMode(self):
+        """Returns the search mode chosen in the engine menu."""
+        return rules.search.MAX_N if self.actionMax_N.isChecked() else rules.search.PARANOID
+
+    def startEngine(self, timeLimit):
+        """Starts a search of the current position for timeLimit seconds (0 = until stopped) with the external engine,
+        if one is set, or the built-in engine. Returns the number of the request, which is sent with its best
+        move."""
+        if self.externalEngine:
+            return self.externalEngine.startSearch(
+                self.algorithm.getRootPosition().getFen4(),
+                [moveName(moveFromCode(code)) for code in self.algorithm.getLine()],
+                self.algorithm.getPosition(), timeLimit, self.engineMode())
+        return self.engine.start(self.algorithm.getPosition(), timeLimit, self.engineMode())
+
+    def stopEngine(self):
+        """Stops the search of the engine in use."""
+        if self.externalEngine:
+            self.externalEngine.stop()
+        else:
+            self.engine.stop()
 
-    def __init__(self, files, ranks):
-        super().__init__()
-        self.files = files
-        self.ranks = ranks
-        self.boardData = []
-        self.initBoard()
-
-    def initBoard(self):
-        """Initializes board with empty squares."""
-        self.boardData = [' '] * self.files * self.ranks
-        self.boardReset.emit()
+    def analyze(self):
+        """(Re)starts analysis of the current position if it is switched on, or stops the engine."""
+        self.engineRequest = None
+        if self.actionAnalyze.isChecked() and self.algorithm.currentPlayer != self.algorithm.NoPlayer:
+            self.startEngine(0)
+        else:
+            self.stopEngine()
 
-    def getData(self, file, rank):
-        """Gets board data from square (file, rank)."""
-        return self.boardData[file+rank*self.files]
+    def requestEngineMove(self):
+        """Lets the engine play a move in the current position."""
+        if self.algorithm.currentPlayer == self.algorithm.NoPlayer:
+            return
+        self.actionAnalyze.setChecked(False)
+        self.engineRequest = self.startEngine(self.engineTime)
 
-    def setData(self, file, rank, data):
-        """Sets board data at square (file, rank) to data."""
-        index = file+rank*self.files
-        if self.boardData[index] == data:
+    def searchThreadsDialog(self):
+        """Asks for the number of CPU cores the engine searches on."""
+        # noinspection PyTypeChecker,PyCallByClass
+        threads, accepted = QInputDialog.getInt(self, 'Search Threads', 'CPU cores to search on:',
+                                                self.engine.threads, 1, os.cpu_count() or 1)
+        if accepted:
+            self.engine.threads = threads
+            if self.externalEngine and 'Threads' in self.externalEngine.options:
+                self.externalEngine.setOption('Threads', threads)
+            self.analyze()
+
+    def externalEngineDialog(self):
+        """Asks for the command line of an external engine speaking the engine protocol (see rules/protocol.py), or
+        none to switch back to the built-in engine."""
+        current = self.externalEngine.command if self.externalEngine else rules.engines.REFERENCE_ENGINE
+        command = ' '.join(shlex.quote(argument) for argument in current)
+        # noinspection PyTypeChecker,PyCallByClass
+        command, accepted = QInputDialog.getText(self, 'External Engine',
+                                                 'Engine command (empty for the built-in engine):', text=command)
+        if not accepted:
             return
-        self.boardData[index] = data
-        self.dataChanged.emit(file, rank)
+        self.stopEngine()
+        if self.externalEngine:
+            self.externalEngine.shutdown()
+            self.externalEngine = None
+        if command.strip():
+            self.externalEngine = ExternalEngine(shlex.split(command))
+            self.externalEngine.info.connect(self.showEngineInfo)
+            self.externalEngine.bestMove.connect(self.playEngineMove)
+            self.externalEngine.failed.connect(self.statusbar.showMessage)
+            self.externalEngine.launch()
+        self.analyze()
+
+    def showEngineInfo(self, depth, score, nodes, milliseconds, pv):
+        """Shows the line found by the engine in the status bar."""
+        self.statusbar.showMessage('Depth %d  %s  %d kN/s  %s' % (
+            depth, rules.search.scoreToString(score), nodes // max(milliseconds, 1),
+            ' '.join(self.algorithm.toAlgebraic(code) for code in pv)))
+
+    def analyzeGame(self):
+        """Starts analysis of all moves of the game in the background."""
+        root = self.algorithm.currentMove.getRoot()
+        if root.children:
+            self.gameAnalysis.start(root, self.algorithm.getRootPosition())
+            self.statusbar.showMessage('Analyzing game...')
+
+    def cancelGameAnalysis(self):
+        """Cancels the game analysis, since the move tree has changed. Annotations of the moves analyzed so far are
+        kept, unless the tree was replaced."""
+        self.gameAnalysis.cancel()
+
+    def gameAnalysisFinished(self, complete):
+        """Reports the end of the game analysis in the status bar."""
+        self.statusbar.showMessage('Game analysis complete' if complete else 'Game analysis cancelled')
+
+    def playEngineMove(self, code, request):
+        """Plays the best move of the engine, if it is the result of the latest engine move request (the position
+        did not change since, otherwise the request would have been cancelled)."""
+        if not code or request != self.engineRequest:
+            return
+        self.engineRequest = None
+        fromSquare, toSquare, piece, captured, flag, promotion = decodeMove(code)
+        self.algorithm.makeMove(fromSquare % FILES, fromSquare // FILES, toSquare % FILES, toSquare // FILES,
+                                promotion or 'Q')
+        self.view.repaint()
+
+    def playExplorerMove(self, name):
+        """Plays move in coordinate notation chosen in the opening explorer."""
+        fromSquare, toSquare, promotion = parseMoveName(name)
+        self.algorithm.makeMove(fromSquare % FILES, fromSquare // FILES, toSquare % FILES, toSquare // FILES,
+                                promotion or 'Q')
+        self.view.repaint()
+
+
+class Board(rules.board.Board, QObject):
+    """Qt adapter of the headless Board. Emits signals whenever the board data changes."""
+    boardReset = pyqtSignal()
+    dataChanged = pyqtSignal(int, int)
+    boardDiff = pyqtSignal(list)
 
-    def movePiece(self, fromFile, fromRank, toFile, toRank):
-        """Moves piece from square (fromFile, fromRank) to square (toFile, toRank)."""
-        self.setData(toFile, toRank, self.getData(fromFile, fromRank))
-        self.setData(fromFile, fromRank, ' ')
-
-    def setFen4(self, fen4):
-        """Sets board position according to the FEN4 string fen4."""
-        index = 0
-        skip = 0
-        for rank in reversed(range(self.ranks)):
-            for file in range(self.files):
-                if skip > 0:
-                    char = ' '
-                    skip -= 1
-                else:
-                    # Pieces are always two characters, skip value can be single or double digit
-                    char = fen4[index]
-                    index += 1
-                    if char.isdigit():
-                        # Check if next is also digit. If yes, treat as single number
-                        next_ = fen4[index]
-                        if next_.isdigit():
-                            char += next_
-                            index += 1
-                        skip = int(char)
-                        char = ' '
-                        skip -= 1
-                    # If not digit, then it is a two-character piece. Add next character
-                    else:
-                        char += fen4[index]
-                        index += 1
-                self.setData(file, rank, char)
-            next_ = fen4[index]
-            if next_ != '/' and next_ != ' ':
-                # If no slash or space after rank, the FEN4 is invalid, so reset board
-                self.initBoard()
-                return
-            else:  # Skip the slash
-                index += 1
+    def boardResetEvent(self):
+        """Overrides Board boardResetEvent() method."""
         self.boardReset.emit()
 
-    def getFen4(self):
-        """Generates FEN4 from current board state."""
-        fen4 = ''
-        skip = 0
-        prev = ' '
-        for rank in reversed(range(self.ranks)):
-            for file in range(self.files):
-                char = self.getData(file, rank)
-                # If current square is empty, increment skip value
-                if char == ' ':
-                    skip += 1
-                    prev = char
-                else:
-                    # If current square is not empty, but previous square was empty, append skip value to FEN4 string,
-                    # unless the previous square was on the previous rank
-                    if prev == ' ' and file != 0:
-                        fen4 += str(skip)
-                        skip = 0
-                    # Append algebraic piece name to FEN4 string
-                    fen4 += char
-                    prev = char
-            # If skip is non-zero at end of rank, append skip and reset to zero
-            if skip > 0:
-                fen4 += str(skip)
-                skip = 0
-            # Append slash at end of rank and append space after last rank
-            if rank == 0:
-                fen4 += ' '
-            else:
-                fen4 += '/'
-        return fen4
+    def dataChangedEvent(self, file, rank):
+        """Overrides Board dataChangedEvent() method."""
+        self.dataChanged.emit(file, rank)
 
+    def boardDiffEvent(self, squares):
+        """Overrides Board boardDiffEvent() method."""
+        self.boardDiff.emit(squares)
 
-class Algorithm(QObject):
-    """The Algorithm is the underlying logic responsible for changing the current state of the board."""
+
+class Algorithm(rules.algorithm.Algorithm, QObject):
+    """Qt adapter of the headless Algorithm. Translates the notification hooks into signals for the GUI."""
     boardChanged = pyqtSignal(Board)
     gameOver = pyqtSignal(str)
     currentPlayerChanged = pyqtSignal(str)
     fen4Generated = pyqtSignal(str)
     pgn4Generated = pyqtSignal(str)
-    moveTreeChanged = pyqtSignal(list)
+    moveTreeChanged = pyqtSignal()
+    moveAdded = pyqtSignal(object)
+    moveTreeReset = pyqtSignal(object)
     removeHighlight = pyqtSignal(QColor)
     addHighlight = pyqtSignal(int, int, int, int, QColor)
 
-    NoResult, Team1Wins, Team2Wins, Draw = ['*', '1-0', '0-1', '1/2-1/2']  # Results
-    NoPlayer, Red, Blue, Yellow, Green = ['?', 'r', 'b', 'y', 'g']  # Players
-    playerQueue = deque([Red, Blue, Yellow, Green])
-
-    def __init__(self):
-        super().__init__()
-        self.variant = '?'
-        self.board = Board(14, 14)
-        self.result = self.NoResult
-        self.currentPlayer = self.NoPlayer
-        self.moveNumber = 0
-        self.currentMove = self.Node('root', [], None)
-        self.moves = []
-        self.redName = self.NoPlayer
-        self.blueName = self.NoPlayer
-        self.yellowName = self.NoPlayer
-        self.greenName = self.NoPlayer
-
-    class Node:
-        """Generic node class. Basic element of a tree."""
-        def __init__(self, name, children, parent):
-            self.name = name
-            self.children = children
-            self.parent = parent
-
-        def add(self, node):
-            """Adds node to children."""
-            self.children.append(node)
-
-        def pop(self):
-            """Removes last child from node."""
-            self.children.pop()
-
-        def getRoot(self):
-            """Backtracks tree and returns root node."""
-            if self.parent is None:
-                return self
-            return self.parent.getRoot()
-
-        def getTree(self):
-            """Returns the (sub)tree starting from the current node."""
-            tree = [self.name, [child.getTree() for child in self.children]]
-            return tree
-
-    def updatePlayerNames(self, red, blue, yellow, green):
-        self.redName = red if not (red == 'Player Name' or red == '') else '?'
-        self.blueName = blue if not (blue == 'Player Name' or blue == '') else '?'
-        self.yellowName = yellow if not (yellow == 'Player Name' or yellow == '') else '?'
-        self.greenName = green if not (green == 'Player Name' or green == '') else '?'
-
-    def resetMoves(self):
-        """Resets current move to root and move number to zero."""
-        self.moveNumber = 0
-        self.currentMove = self.Node('root', [], None)
-        self.moves = []
-
-    def setResult(self, value):
-        """Updates game result, if changed."""
-        if self.result == value:
-            return
-        if self.result == self.NoResult:
-            self.result = value
-            self.gameOver.emit(self.result)
+    def createBoard(self):
+        """Overrides Algorithm createBoard() method."""
+        return Board(14, 14)
+
+    def highlightColor(self, player):
+        """Returns the move highlight color of player."""
+        if player == self.Red:
+            return QColor('#66bf3b43')
+        elif player == self.Blue:
+            return QColor('#664185bf')
+        elif player == self.Yellow:
+            return QColor('#66c09526')
+        elif player == self.Green:
+            return QColor('#664e9161')
         else:
-            self.result = value
+            return QColor('#00000000')
 
-    def setCurrentPlayer(self, value):
-        """Updates current player, if changed."""
-        if self.currentPlayer == value:
-            return
-        self.currentPlayer = value
-        self.setPlayerQueue(self.currentPlayer)
-        self.currentPlayerChanged.emit(self.currentPlayer)
+    def boardChangedEvent(self, board):
+        """Overrides Algorithm boardChangedEvent() method."""
+        self.boardChanged.emit(board)
 
-    def setPlayerQueue(self, currentPlayer):
-        """Rotates player queue such that the current player is the first in the queue."""
-        while self.playerQueue[0] != currentPlayer:
-            self.playerQueue.rotate(-1)
+    def gameOverEvent(self, result):
+        """Overrides Algorithm gameOverEvent() method."""
+        self.gameOver.emit(result)
 
-    def setBoard(self, board):
-        """Updates board, if changed."""
-        if self.board == board:
-            return
-        self.board = board
-        self.boardChanged.emit(self.board)
-
-    def setupBoard(self):
-        """Initializes board."""
-        self.setBoard(Board(14, 14))
-
-    def newGame(self):
-        """Initializes board and sets starting position."""
-        self.setupBoard()
-        # Set starting position from FEN4
-        self.board.setFen4('3yRyNyByKyQyByNyR3/3yPyPyPyPyPyPyPyP3/14/bRbP10gPgR/bNbP10gPgN/bBbP10gPgB/bKbP10gPgQ/'
-                           'bQbP10gPgK/bBbP10gPgB/bNbP10gPgN/bRbP10gPgR/14/3rPrPrPrPrPrPrPrP3/3rRrNrBrQrKrBrNrR3 '
-                           'r rKrQbKbQyKyQgKgQ - 0 1')
-        self.setResult(self.NoResult)
-        self.setCurrentPlayer(self.Red)
-        self.setPlayerQueue(self.currentPlayer)
-        self.resetMoves()
-
-    def getBoardState(self):
-        """Gets FEN4 from current board state."""
-        fen4 = self.board.getFen4()
-        # Append character for current player
-        fen4 += self.currentPlayer + ' '
-        # TODO implement castling availability and en passant target square
-        fen4 += '- '  # "K" if kingside castling available, "Q" if queenside, "-" if no player can castle
-        fen4 += '- '  # En passant target square
-        fen4 += str(self.moveNumber) + ' '  # Number of quarter-moves
-        fen4 += str(self.moveNumber // 4 + 1) + ' '  # Number of full moves, starting from 1
+    def currentPlayerChangedEvent(self, player):
+        """Overrides Algorithm currentPlayerChangedEvent() method."""
+        self.currentPlayerChanged.emit(player)
+
+    def fen4GeneratedEvent(self, fen4):
+        """Overrides Algorithm fen4GeneratedEvent() method."""
         self.fen4Generated.emit(fen4)
-        return fen4
 
-    def setBoardState(self, fen4):
-        """Sets board according to FEN4."""
-        if not fen4:
-            return
-        self.board.setFen4(fen4)
-        self.setCurrentPlayer(fen4.split(' ')[1])
+    def pgn4GeneratedEvent(self, pgn4):
+        """Overrides Algorithm pgn4GeneratedEvent() method."""
+        self.pgn4Generated.emit(pgn4)
 
-    def treeToAlgebraic(self, tree):
-        if tree[0] == 'root':
-            newTree = ['root', [self.treeToAlgebraic(subtree) for subtree in tree[1]]]
-        else:
-            newTree = [self.toAlgebraic(tree[0]), [self.treeToAlgebraic(subtree) for subtree in tree[1]]]
-        return newTree
-
-    def toAlgebraic(self, moveString):
-        """Converts move string to algebraic notation."""
-        # moveString = moveString[1:]
-        moveString = moveString.split()
-        if moveString[0][1] == 'P':
-            moveString.pop(0)
-            if len(moveString) == 3:
-                moveString[0] = moveString[0][0]
-                moveString[1] = 'x'
-            else:
-                moveString.pop(0)
-        elif len(moveString) == 4:
-            # Castling move
-            if moveString[0][1] == 'K' and moveString[2][1] == 'R' and moveString[0][0] == moveString[2][0]:
-                fromFile = ord(moveString[1][0]) - 97
-                fromRank = int(moveString[1][1]) - 1
-                toFile = ord(moveString[3][0]) - 97
-                toRank = int(moveString[3][1]) - 1
-                if fromRank == toRank:
-                    # Kingside
-                    if abs(toFile - fromFile) == 3:
-                        moveString = 'O-O'
-                    # Queenside
-                    elif abs(toFile - fromFile) == 4:
-                        moveString = 'O-O-O'
-                elif fromFile == toFile:
-                    # Kingside
-                    if abs(toRank - fromRank) == 3:
-                        moveString = 'O-O'
-                    # Queenside
-                    elif abs(toRank - fromRank) == 4:
-                        moveString = 'O-O-O'
-            else:
-                moveString[0] = moveString[0][1]
-                moveString[2] = 'x'
-                moveString.remove(moveString[1])
-        else:
-            moveString.remove(moveString[1])
-            if moveString != 'O-O' and moveString != 'O-O-O':
-                moveString[0] = moveString[0][1]
-        moveString = ''.join(moveString)
-        return moveString
-
-    def strMove(self, fromFile, fromRank, toFile, toRank):
-        """Returns move in string form, separated by spaces, i.e. '<piece> <from> <captured piece> <to>'."""
-        piece: str = self.board.getData(fromFile, fromRank)
-        target: str = self.board.getData(toFile, toRank)
-        char = (piece + ' ' + chr(97+fromFile) + str(fromRank+1) + ' ' + target*(target != ' ') + ' ' + chr(97+toFile) +
-                str(toRank+1))  # chr(97) = 'a'
-        return char
-
-    def prevMove(self):
-        """Sets board state to previous move."""
-        if self.currentMove.name == 'root':
-            return
-        moveString = self.currentMove.name
-        moveString = moveString.split()
-        piece = moveString[0]
-        fromFile = ord(moveString[1][0]) - 97  # chr(97) = 'a'
-        fromRank = int(moveString[1][1:]) - 1
-        if len(moveString) == 4:
-            target = moveString[2]
-            toFile = ord(moveString[3][0]) - 97
-            toRank = int(moveString[3][1:]) - 1
-        else:
-            target = ' '
-            toFile = ord(moveString[2][0]) - 97
-            toRank = int(moveString[2][1:]) - 1
-        self.board.setData(fromFile, fromRank, piece)
-        self.board.setData(toFile, toRank, target)
-        self.currentMove = self.currentMove.parent
-        self.moveNumber -= 1
-        self.playerQueue.rotate(1)
-        self.setCurrentPlayer(self.playerQueue[0])
-        # Signal View to remove last move highlight
-        if self.currentPlayer == self.Red:
-            color = QColor('#66bf3b43')
-        elif self.currentPlayer == self.Blue:
-            color = QColor('#664185bf')
-        elif self.currentPlayer == self.Yellow:
-            color = QColor('#66c09526')
-        elif self.currentPlayer == self.Green:
-            color = QColor('#664e9161')
-        else:
-            color = QColor('#00000000')
-        self.removeHighlight.emit(color)
+    def moveTreeChangedEvent(self):
+        """Overrides Algorithm moveTreeChangedEvent() method."""
+        self.moveTreeChanged.emit()
 
-    def nextMove(self):
-        """Sets board state to next move."""
-        if not self.currentMove.children:
-            return
-        moveString = self.currentMove.children[-1].name  # Take last variation
-        moveString = moveString.split()
-        piece = moveString[0]
-        fromFile = ord(moveString[1][0]) - 97  # chr(97) = 'a'
-        fromRank = int(moveString[1][1:]) - 1
-        if len(moveString) == 4:
-            toFile = ord(moveString[3][0]) - 97
-            toRank = int(moveString[3][1:]) - 1
-        else:
-            toFile = ord(moveString[2][0]) - 97
-            toRank = int(moveString[2][1:]) - 1
-        self.board.setData(fromFile, fromRank, ' ')
-        self.board.setData(toFile, toRank, piece)
-        self.currentMove = self.currentMove.children[-1]
-        self.moveNumber += 1
-        # Signal View to add move highlight and remove highlights of next player
-        if self.currentPlayer == self.Red:
-            color = QColor('#66bf3b43')
-        elif self.currentPlayer == self.Blue:
-            color = QColor('#664185bf')
-        elif self.currentPlayer == self.Yellow:
-            color = QColor('#66c09526')
-        elif self.currentPlayer == self.Green:
-            color = QColor('#664e9161')
-        else:
-            color = QColor('#00000000')
-        self.addHighlight.emit(fromFile, fromRank, toFile, toRank, color)
-        self.playerQueue.rotate(-1)
-        self.setCurrentPlayer(self.playerQueue[0])
-        if self.currentPlayer == self.Red:
-            color = QColor('#66bf3b43')
-        elif self.currentPlayer == self.Blue:
-            color = QColor('#664185bf')
-        elif self.currentPlayer == self.Yellow:
-            color = QColor('#66c09526')
-        elif self.currentPlayer == self.Green:
-            color = QColor('#664e9161')
-        else:
-            color = QColor('#00000000')
-        self.removeHighlight.emit(color)
-
-    def firstMove(self):
-        while self.currentMove.name != 'root':
-            self.prevMove()
-
-    def lastMove(self):
-        while self.currentMove.children:
-            self.nextMove()
-
-    def makeMove(self, fromFile, fromRank, toFile, toRank):
-        """This method must be overridden to define the proper logic corresponding to the game type (Teams or FFA)."""
-        return False
-
-    def getPgn4(self):
-        """Generates PGN4 from current game."""
-        pgn4 = ''
-
-        # Standard tags, ("?" if data unknown, "-" if not applicable)
-        pgn4 += '[Event "Four-Player Chess ' + self.variant + '"]\n'
-        pgn4 += '[Site "chess.com"]\n'
-        pgn4 += '[Date "' + date.today().strftime('%Y.%m.%d') + '"]\n'
-        # pgn4 += '[Round "-"]\n'
-        pgn4 += '[Red "' + self.redName + '"]\n'
-        pgn4 += '[Blue "' + self.blueName + '"]\n'
-        pgn4 += '[Yellow "' + self.yellowName + '"]\n'
-        pgn4 += '[Green "' + self.greenName + '"]\n'
-        pgn4 += '[Result "' + self.result + '"]\n'  # 1-0 (r & y win), 0-1 (b & g win), 1/2-1/2 (draw), * (no result)
-
-        # Supplemental tags
-        # pgn4 += '[RedElo "?"]\n'
-        # pgn4 += '[BlueElo "?"]\n'
-        # pgn4 += '[YellowElo "?"]\n'
-        # pgn4 += '[GreenElo "?"]\n'
-        pgn4 += '[PlyCount "' + str(self.moveNumber) + '"]\n'  # Total number of quarter-moves
-        pgn4 += '[TimeControl "60 d15"]\n'  # 60 seconds sudden death with 15 seconds delay per move
-        pgn4 += '[Mode "ICS"]\n'  # ICS = Internet Chess Server, OTB = Over-The-Board
-        pgn4 += '[CurrentPosition "' + self.getBoardState() + '"]\n'
-        pgn4 += '\n'
-
-        # Movetext
-        moves = self.moves
-        moveList = []
-        row = []
-        prev = 0
-        i = 0
-        while i < len(moves):
-            # Same variation -> continue
-            if moves[i][-1] == prev:
-                flag = (moves[i][0] - 1) % 4
-                if flag == 0:
-                    moveNum = str((moves[i][0] - 1) // 4 + 1) + '. '
-                else:
-                    moveNum = ''
-                move = moveNum + moves[i][1] + ' '
-                row.append(move)
-            # New variation
-            elif moves[i][-1] > prev:
-                moveList.append(row)
-                # Start of variation -> prepend opening bracket and add 1, 2 or 3 dots, depending on current player
-                flag = ((moves[i][0] - 1) % 4)
-                if flag == 0:  # Red's move
-                    moveNum = str((moves[i][0] - 1) // 4 + 1) + '. '
-                elif flag == 1:  # Blue's move, add one dot
-                    moveNum = str((moves[i][0] - 1) // 4 + 1) + '. . '
-                elif flag == 2:  # Yellow's move, add two dots
-                    moveNum = str((moves[i][0] - 1) // 4 + 1) + '. .. '
-                else:  # Green's move, add three dots
-                    moveNum = str((moves[i][0] - 1) // 4 + 1) + '. ... '
-                move = '(' + moveNum + moves[i][1] + ' '
-                row = list()
-                row.append(move)
-            # End of variation, returning to previous variation
-            elif moves[i][-1] < prev:
-                # End of variation -> remove last space and append closing brackets
-                row[-1] = row[-1][:-1] + ') ' * (prev - moves[i][-1])
-                moveList.append(row)
-                flag = ((moves[i][0] - 1) % 4 == 0)
-                if flag:
-                    moveNum = str((moves[i][0] - 1) // 4 + 1) + '. '
-                else:
-                    moveNum = ''
-                move = moveNum + moves[i][1] + ' '
-                row = list()
-                row.append(move)
-            # End of move list -> append rest of main line moves
-            if i + 1 == len(moves):
-                moveList.append(row)
-            prev = moves[i][-1]
-            i += 1
-        for sublist in moveList:
-            for move in sublist:
-                pgn4 += move
-        # Append result
-        pgn4 += self.result
-        self.pgn4Generated.emit(pgn4)
+    def moveAddedEvent(self, node):
+        """Overrides Algorithm moveAddedEvent() method."""
+        self.moveAdded.emit(node)
 
-    def updateMoves(self, tree):
-        moves = self.traverse(tree)
-        self.moves = moves
-
-    # TODO copied from MainWindow class -> possible to integrate and get rid of duplicate method?
-    def traverse(self, node, moves=None, moveNum=0, root=None, var=0):
-        """Traverses move tree to create list of moves, sorted by move number and variation (incl. variation root)."""
-        # The tree is represented as a nested list with move strings, i.e. node = ['parent', [children]]
-        parent = node[0]
-        if not root:
-            root = parent
-        if not moves:
-            moves = self.moves
-        children = node[1]
-        if children:
-            for child in children:
-                self.traverse(child, moves, moveNum + 1, root, var)
-                var += 1
-                root = parent
-        elif not moves.count((moveNum, parent, root, var)):
-            moves.append((moveNum, parent, root, var))
-        # Sort moves: insert variations after the main line move
-        i = 0
-        while i < len(moves):
-            variations = [var for var in moves if var[2] == moves[i][1]]
-            # Sort variations by move and variation number
-            variations = sorted(variations, key=lambda element: (element[-1], element[0]))
-            moves = moves[:i+2] + variations + moves[i+2:]
-            # Remove duplicate elements from the back
-            moves.reverse()
-            for move in moves:
-                while moves.count(move) > 1:
-                    moves.remove(move)
-            moves.reverse()
-            i += 1
-        return moves
-
-
-class Teams(Algorithm):
-    """A subclass of Algorithm for the 4-player chess Teams variant."""
-    def __init__(self):
-        super().__init__()
-        self.variant = 'Teams'
+    def moveTreeResetEvent(self, root):
+        """Overrides Algorithm moveTreeResetEvent() method."""
+        self.moveTreeReset.emit(root)
 
-    def makeMove(self, fromFile, fromRank, toFile, toRank):
-        """Moves piece from square (fromFile, fromRank) to square (toFile, toRank), if the move is valid."""
-        if self.currentPlayer == self.NoPlayer:
-            return False
-        # Check if square contains piece of current player. (A player may only move his own pieces.)
-        fromData = self.board.getData(fromFile, fromRank)
-        if self.currentPlayer == self.Red and fromData[0] != 'r':
-            return False
-        if self.currentPlayer == self.Blue and fromData[0] != 'b':
-            return False
-        if self.currentPlayer == self.Yellow and fromData[0] != 'y':
-            return False
-        if self.currentPlayer == self.Green and fromData[0] != 'g':
-            return False
+    def addHighlightEvent(self, fromFile, fromRank, toFile, toRank, player):
+        """Overrides Algorithm addHighlightEvent() method."""
+        self.addHighlight.emit(fromFile, fromRank, toFile, toRank, self.highlightColor(player))
 
-        # Check if move is within board
-        if toFile < 0 or toFile > (self.board.files-1):
-            return False
-        if toRank < 0 or toRank > (self.board.ranks-1):
-            return False
-        if ((toFile < 3 and toRank < 3) or (toFile < 3 and toRank > 10) or
-                (toFile > 10 and toRank < 3) or (toFile > 10 and toRank > 10)):
-            return False
+    def removeHighlightEvent(self, player):
+        """Overrides Algorithm removeHighlightEvent() method."""
+        self.removeHighlight.emit(self.highlightColor(player))
 
-        # Check if target square is not occupied by friendly piece. (Castling move excluded.)
-        toData = self.board.getData(toFile, toRank)
-        if self.currentPlayer == self.Red and (toData[0] == 'r' or toData[0] == 'y'):
-            if not (fromData == 'rK' and toData == 'rR'):
-                return False
-        if self.currentPlayer == self.Blue and (toData[0] == 'b' or toData[0] == 'g'):
-            if not (fromData == 'bK' and toData == 'bR'):
-                return False
-        if self.currentPlayer == self.Yellow and (toData[0] == 'y' or toData[0] == 'r'):
-            if not (fromData == 'yK' and toData == 'yR'):
-                return False
-        if self.currentPlayer == self.Green and (toData[0] == 'g' or toData[0] == 'b'):
-            if not (fromData == 'gK' and toData == 'gR'):
-                return False
-
-        # TODO check if move is legal
-
-        # If move already exists (in case of variations), do not change the move tree
-        moveString = self.strMove(fromFile, fromRank, toFile, toRank)
-        if not (self.currentMove.children and (moveString in (child.name for child in self.currentMove.children))):
-            # Make move child of current move and update current move (i.e. previous move is parent of current move)
-            move = self.Node(moveString, [], self.currentMove)
-            self.currentMove.add(move)
-            self.currentMove = move
-
-            # Send signal to update the move list and pass the tree with moves in algebraic notation
-            tree = self.treeToAlgebraic(self.currentMove.getRoot().getTree())
-            self.moveTreeChanged.emit(tree)
-        else:
-            # Update current move, but do not change the move tree
-            for child in self.currentMove.children:
-                if child.name == moveString:
-                    self.currentMove = child
-
-        # Make the move
-        if fromData[1] == 'K' and toData != ' ':
-            if toData[1] == 'R' and fromData[0] == toData[0]:
-                # Castling move
-                if fromRank == toRank:
-                    if abs(toFile - fromFile) == 3:  # Kingside
-                        kingFile = toFile - 1 if toFile > fromFile else toFile + 1
-                        rookFile = fromFile + 1 if toFile > fromFile else fromFile - 1
-                        self.board.movePiece(fromFile, fromRank, kingFile, toRank)
-                        self.board.movePiece(toFile, fromRank, rookFile, toRank)
-                    elif abs(toFile - fromFile) == 4:  # Queenside
-                        kingFile = toFile + 2 if toFile < fromFile else toFile - 2
-                        rookFile = fromFile - 1 if toFile < fromFile else fromFile + 1
-                        self.board.movePiece(fromFile, fromRank, kingFile, toRank)
-                        self.board.movePiece(toFile, fromRank, rookFile, toRank)
-                elif fromFile == toFile:
-                    if abs(toRank - fromRank) == 3:  # Kingside
-                        kingRank = toRank - 1 if toRank > fromRank else toRank + 1
-                        rookRank = fromRank + 1 if toRank > fromRank else fromRank - 1
-                        self.board.movePiece(fromFile, fromRank, toFile, kingRank)
-                        self.board.movePiece(fromFile, toRank, toFile, rookRank)
-                    elif abs(toRank - fromRank) == 4:  # Queenside
-                        kingRank = toRank + 2 if toRank < fromRank else toRank - 2
-                        rookRank = fromRank - 1 if toRank < fromRank else fromRank + 1
-                        self.board.movePiece(fromFile, fromRank, toFile, kingRank)
-                        self.board.movePiece(fromFile, toRank, toFile, rookRank)
-            else:
-                self.board.movePiece(fromFile, fromRank, toFile, toRank)
-        else:
-            self.board.movePiece(fromFile, fromRank, toFile, toRank)
 
-        # Increment move number
-        self.moveNumber += 1
+class Teams(Algorithm, rules.algorithm.Teams):
+    """Qt adapter of the headless Teams variant."""
+    pass
 
-        # Rotate player queue and get next player from the queue (first element)
-        self.playerQueue.rotate(-1)
-        self.setCurrentPlayer(self.playerQueue[0])
 
-        return True
+class FFA(Algorithm, rules.algorithm.FFA):
+    """Qt adapter of the headless Free-For-All (FFA) variant."""
+    pass
 
 
-class FFA(Algorithm):
-    """A subclass of Algorithm for the 4-player chess Free-For-All (FFA) variant."""
-    # TODO implement FFA class
+class Engine(rules.search.ParallelSearch, QObject):
+    """Qt adapter of the headless ParallelSearch. Lives in a worker thread: searches are requested from the GUI thread
+    with start() and run in the worker thread, which streams the lines found back through signals."""
+    info = pyqtSignal(int, int, int, int, list)
+    bestMove = pyqtSignal(int, int)
+    searchRequested = pyqtSignal(object, float, str, int)
+
     def __init__(self):
         super().__init__()
-        self.variant = 'Free-For-All'
+        self.requests = 0  # Number of the latest search request; stopping also counts as request
+        self.request = 0  # Number of the running search request
+        self.searchRequested.connect(self.run)
+
+    def infoEvent(self, depth, score, nodes, milliseconds, pv):
+        """Overrides Search infoEvent() method."""
+        self.info.emit(depth, score, nodes, milliseconds, pv)
+
+    def bestMoveEvent(self, code):
+        """Overrides Search bestMoveEvent() method."""
+        self.bestMove.emit(code, self.request)
+
+    def start(self, position, timeLimit, mode):
+        """Stops the running search and requests a search of position for timeLimit seconds (0 = until stopped) in
+        mode. Called from the GUI thread. Returns the number of the request, which is sent with its best move."""
+        self.stop()
+        self.requests += 1
+        self.searchRequested.emit(position, timeLimit, mode, self.requests)
+        return self.requests
+
+    def stop(self):
+        """Overrides ParallelSearch stop() method. Also drops queued requests, whose search would otherwise start
+        after the stop and run until the next start()."""
+        self.requests += 1
+        super().stop()
+
+    @pyqtSlot(object, float, str, int)
+    def run(self, position, timeLimit, mode, request):
+        """Searches position in the worker thread, unless a newer request was made while this one was queued."""
+        if request != self.requests:
+            return
+        self.request = request
+        self.setMode(mode)
+        self.search(position, timeLimit=timeLimit or None)
+
+
+class GameAnalysis(rules.analysis.GameAnalysis, QObject):
+    """Qt adapter of the headless GameAnalysis. Lives in a worker thread: analyses are requested from the GUI thread
+    with start() and run in the worker thread, which streams the annotations back through signals."""
+    annotated = pyqtSignal(object, object)
+    finished = pyqtSignal(bool)
+    analysisRequested = pyqtSignal(list, int)
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0  # Number of the latest analysis request; cancelling also counts as request
+        self.analysisRequested.connect(self.run)
+
+    def annotationEvent(self, node, annotation):
+        """Overrides GameAnalysis annotationEvent() method."""
+        self.annotated.emit(node, annotation)
+
+    def finishedEvent(self, complete):
+        """Overrides GameAnalysis finishedEvent() method."""
+        self.finished.emit(complete)
+
+    def start(self, root, position):
+        """Cancels the running analysis and requests analysis of the moves below root, position being the position of
+        root. Called from the GUI thread, which walks the tree while it cannot change."""
+        self.cancel()
+        self.analysisRequested.emit(self.jobs(root, position), self.requests)
+
+    def cancel(self):
+        """Overrides GameAnalysis cancel() method. Also drops queued requests."""
+        self.requests += 1
+        super().cancel()
+
+    @pyqtSlot(list, int)
+    def run(self, jobs, request):
+        """Analyzes jobs in the worker thread, unless the request was cancelled while it was queued."""
+        if request == self.requests:
+            self.analyzeJobs(jobs)
+
+
+class ExternalEngine(rules.protocol.EngineClient, QObject):
+    """Qt adapter of the EngineClient: runs an engine process with QProcess, whose output is read in the GUI event
+    loop without blocking it. Offers the same signals as Engine. Positions are sent as the FEN4 of the start of the
+    game and the moves played since. The engine is sent isready every few seconds and restarted if it did not answer
+    the previous one."""
+    info = pyqtSignal(int, int, int, int, list)
+    bestMove = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+    healthCheckInterval = 5000  # Milliseconds
+
+    def __init__(self, command):
+        super().__init__()
+        self.command = command  # Program and arguments
+        self.process = QProcess()
+        self.process.readyReadStandardOutput.connect(self.readOutput)
+        self.process.errorOccurred.connect(self.processError)
+        self.requests = 0
+        self.searches = deque()  # (request, position) of the searches whose best move has not arrived, oldest first
+        self.healthTimer = QTimer()
+        self.healthTimer.timeout.connect(self.healthCheck)
+
+    def launch(self):
+        """Starts the engine process and the protocol."""
+        self.searches.clear()
+        self.process.start(self.command[0], self.command[1:])
+        self.start()
+        self.healthTimer.start(self.healthCheckInterval)
+
+    def shutdown(self):
+        """Tells the engine to quit, and kills it if it does not exit in time."""
+        self.healthTimer.stop()
+        if self.process.state() != QProcess.NotRunning:
+            self.quit()
+            if not self.process.waitForFinished(1000):
+                self.process.kill()
+                self.process.waitForFinished(1000)
+
+    def writeEvent(self, line):
+        """Overrides EngineClient writeEvent() method."""
+        self.process.write((line + '\n').encode())
+
+    def readOutput(self):
+        """Passes the complete lines the engine printed to the protocol."""
+        while self.process.canReadLine():
+            self.lineReceived(bytes(self.process.readLine()).decode(errors='replace'))
+
+    def processError(self, error):
+        """Reports a process error, e.g. if the engine cannot be started or crashed."""
+        self.failed.emit('Engine %s: %s' % (self.engineName or self.command[0], self.process.errorString()))
+
+    def healthCheck(self):
+        """Restarts the engine if it did not answer the previous isready, and sends the next one."""
+        if self.process.state() != QProcess.Running:
+            return
+        if self.pings:
+            self.failed.emit('Engine %s does not respond, restarting' % (self.engineName or self.command[0]))
+            self.process.kill()
+            self.process.waitForFinished(1000)
+            self.launch()
+            return
+        self.ping()
+
+    def startSearch(self, fen4, moves, position, timeLimit, mode):
+        """Stops the running search and starts a search of the position of fen4 after moves in coordinate notation
+        for timeLimit seconds (0 = until stopped) in mode. Position is the same position, for decoding the moves the
+        engine sends. Returns the number of the request, which is sent with its best move."""
+        self.stop()
+        self.requests += 1
+        self.go(fen4, moves, movetime=timeLimit * 1000, mode=mode)
+        self.searches.append((self.requests, position))
+        return self.requests
+
+    def infoEvent(self, info):
+        """Overrides EngineClient infoEvent() method. Only the lines of the latest search are reported, with the
+        principal variation as compact move codes."""
+        if len(self.searches) != 1 or 'depth' not in info:
+            return
+        position = self.searches[0][1].copy()
+        pv = []
+        for name in info.get('pv', []):
+            try:
+                move = position.findMoveName(name)
+            except ValueError:
+                break
+            if move is None:
+                break
+            pv.append(position.encodeMove(move))
+            position.push(move)
+        self.info.emit(info['depth'], info.get('score', 0), info.get('nodes', 0), info.get('time', 0), pv)
+
+    def bestMoveEvent(self, move):
+        """Overrides EngineClient bestMoveEvent() method. Sends the best move as compact move code, 0 if it is
+        missing or illegal."""
+        if not self.searches:
+            return
+        request, position = self.searches.popleft()
+        try:
+            legalMove = position.findMoveName(move) if move else None
+        except ValueError:
+            legalMove = None
+        self.bestMove.emit(position.encodeMove(legalMove) if legalMove else 0, request)
+
+
+class MoveListModel(rules.movelist.MoveList, QAbstractListModel):
+    """Qt model adapter of the MoveList. Each row of the move list is one item, so the view only lays out the rows that
+    were inserted or changed by a new move."""
+    def __init__(self, moveText):
+        super().__init__(moveText)
+
+    def rowAboutToBeInsertedEvent(self, index):
+        """Overrides MoveList rowAboutToBeInsertedEvent() method."""
+        self.beginInsertRows(QModelIndex(), index, index)
+
+    def rowInsertedEvent(self, index):
+        """Overrides MoveList rowInsertedEvent() method."""
+        self.endInsertRows()
+
+    def rowChangedEvent(self, index):
+        """Overrides MoveList rowChangedEvent() method."""
+        modelIndex = self.index(index)
+        self.dataChanged.emit(modelIndex, modelIndex)
+
+    def aboutToResetEvent(self):
+        """Overrides MoveList aboutToResetEvent() method."""
+        self.beginResetModel()
+
+    def resetEvent(self):
+        """Overrides MoveList resetEvent() method."""
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        """Overrides QAbstractListModel rowCount() method."""
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        """Overrides QAbstractListModel data() method. Main line rows are black, variations of the main line dark gray
+        and deeper variations light gray."""
+        if not index.isValid():
+            return None
+        depth = self.rows[index.row()].depth
+        if role == Qt.DisplayRole:
+            return self.rowText(index.row())
+        if role == Qt.ForegroundRole:
+            return QColor(0, 0, 0) if depth == 0 else QColor(100, 100, 100) if depth == 1 else QColor(150, 150, 150)
+        if role == Qt.BackgroundRole:
+            return QColor(255, 255, 255) if depth == 0 else QColor(240, 240, 240)
+        if role == Qt.ToolTipRole:
+            return self.rowAnalysis(index.row()) or None
+        return None
+
+    def rowAnalysis(self, index):
+        """Returns the analysis of the annotated moves of the row at index, one line per move with its score and the
+        best move, or '' if none is annotated."""
+        lines = []
+        for node, text in zip(self.rows[index].nodes, self.rows[index].texts):
+            annotation = self.annotations.get(node)
+            if annotation:
+                line = '%s%s %s' % (text, annotation.flag, rules.search.scoreToString(annotation.teamScore))
+                if annotation.bestMove and annotation.bestMove != node.move:
+                    line += ', best %s' % self.moveText(annotation.bestMove)
+                lines.append(line)
+        return '\n'.join(lines)
 
 
 class View(QWidget):
@@ -1037,6 +767,8 @@ class View(QWidget):
         self.squareSize = QSize(50, 50)
         self.board = Board(14, 14)
         self.pieces = {}
+        self.piecePixmaps = {}  # Piece icons rendered at the current square size
+        self.background = None  # Squares rendered at the current square size, see drawBackground()
         self.highlights = []
         self.playerHighlights = {'r': self.PlayerHighlight(12, 1, QColor('#bf3b43')),
                                  'b': self.PlayerHighlight(1, 1, QColor('#4185bf')),
@@ -1077,7 +809,8 @@ class View(QWidget):
                 pass
         self.board = board
         if board:
-            board.dataChanged.connect(self.update)
+            board.dataChanged.connect(self.updateSquare)
+            board.boardDiff.connect(self.updateSquares)
             board.boardReset.connect(self.update)
             board.boardReset.connect(self.resetHighlights)
         self.updateGeometry()
@@ -1087,9 +820,20 @@ class View(QWidget):
         if self.squareSize == size:
             return
         self.squareSize = size
+        self.piecePixmaps = {}
+        self.background = None
         self.squareSizeChanged.emit(size)
         self.updateGeometry()
 
+    def updateSquare(self, file, rank):
+        """Schedules repaint of square (file, rank)."""
+        self.update(self.squareRect(file, rank))
+
+    def updateSquares(self, squares):
+        """Schedules repaint of the squares (file, rank) that changed."""
+        for file, rank in squares:
+            self.update(self.squareRect(file, rank))
+
     def sizeHint(self):
         """Overrides QWidget sizeHint() method. Computes and returns size based on size of board squares."""
         return QSize(self.squareSize.width()*self.board.files, self.squareSize.height()*self.board.ranks)
@@ -1099,27 +843,59 @@ class View(QWidget):
         sqSize = self.squareSize
         return QRect(QPoint(file*sqSize.width(), (self.board.ranks-(rank+1))*sqSize.height()), sqSize)
 
+    def changeEvent(self, event):
+        """Overrides QWidget changeEvent() method. Renders the squares again if the palette changed."""
+        if event.type() == QEvent.PaletteChange:
+            self.background = None
+        super().changeEvent(event)
+
     def paintEvent(self, event):
-        """Overrides QWidget paintEvent() method. Draws squares and pieces on the board."""
+        """Overrides QWidget paintEvent() method. Draws squares, highlights and pieces on the board. Only the squares
+        in the rect to be repainted are drawn, from the cached background and piece pixmaps."""
         painter = QPainter()
         painter.begin(self)
+        dirty = event.rect()
         # First draw squares, then highlights, then pieces
-        for rank in range(self.board.ranks):
-            for file in range(self.board.files):
-                # Do not paint 3x3 sub-grids at the corners
-                if not ((file < 3 and rank < 3) or (file < 3 and rank > 10) or
-                        (file > 10 and rank < 3) or (file > 10 and rank > 10)):
-                    self.drawSquare(painter, file, rank)
-        self.drawHighlights(painter)
+        self.drawBackground(painter, dirty)
+        self.drawHighlights(painter, dirty)
         painter.fillRect(self.squareRect(12, 1), QColor('#40bf3b43'))
         painter.fillRect(self.squareRect(1, 1), QColor('#404185bf'))
         painter.fillRect(self.squareRect(1, 12), QColor('#40c09526'))
         painter.fillRect(self.squareRect(12, 12), QColor('#404e9161'))
-        for rank in range(self.board.ranks):
-            for file in range(self.board.files):
+        sqSize = self.squareSize
+        files = range(max(dirty.left() // sqSize.width(), 0),
+                      min(dirty.right() // sqSize.width() + 1, self.board.files))
+        ranks = range(max(self.board.ranks - 1 - dirty.bottom() // sqSize.height(), 0),
+                      min(self.board.ranks - dirty.top() // sqSize.height(), self.board.ranks))
+        for rank in ranks:
+            for file in files:
                 self.drawPiece(painter, file, rank)
         painter.end()
 
+    def drawBackground(self, painter, rect):
+        """Draws the squares within rect using painter. The squares are rendered once per square size into a
+        pixmap."""
+        if self.background is None:
+            self.background = QPixmap(self.sizeHint() * self.devicePixelRatioF())
+            self.background.setDevicePixelRatio(self.devicePixelRatioF())
+            self.background.fill(Qt.transparent)
+            backgroundPainter = QPainter(self.background)
+            for rank in range(self.board.ranks):
+                for file in range(self.board.files):
+                    # Do not paint 3x3 sub-grids at the corners
+                    if not ((file < 3 and rank < 3) or (file < 3 and rank > 10) or
+                            (file > 10 and rank < 3) or (file > 10 and rank > 10)):
+                        self.drawSquare(backgroundPainter, file, rank)
+            backgroundPainter.end()
+        rect = rect & QRect(QPoint(0, 0), self.sizeHint())
+        painter.drawPixmap(rect, self.background, self.pixmapRect(rect))
+
+    def pixmapRect(self, rect):
+        """Returns rect in device pixels of the cached pixmaps."""
+        ratio = self.devicePixelRatioF()
+        return QRect(round(rect.x() * ratio), round(rect.y() * ratio), round(rect.width() * ratio),
+                     round(rect.height() * ratio))
+
     def drawSquare(self, painter, file, rank):
         """Draws dark or light square at position (file, rank) using painter."""
         rect = self.squareRect(file, rank)
@@ -1129,20 +905,32 @@ class View(QWidget):
     def setPiece(self, char, icon):
         """Sets piece icon corresponding to algebraic piece name."""
         self.pieces[char] = icon
+        self.piecePixmaps.pop(char, None)
         self.update()
 
     def piece(self, char):
         """Returns piece icon corresponding to algebraic piece name."""
         return self.pieces[char]
 
+    def piecePixmap(self, char):
+        """Returns piece icon corresponding to algebraic piece name, rendered at the current square size. The pixmap
+        is cached until the square size or the icon changes."""
+        pixmap = self.piecePixmaps.get(char)
+        if pixmap is None:
+            pixmap = self.piece(char).pixmap(self.squareSize)
+            self.piecePixmaps[char] = pixmap
+        return pixmap
+
     def drawPiece(self, painter, file, rank):
         """Draws piece at square (file, rank) using painter."""
-        rect = self.squareRect(file, rank)
         char = self.board.getData(file, rank)
         if char != ' ':
-            icon = self.piece(char)
-            if not icon.isNull():
-                icon.paint(painter, rect, Qt.AlignCenter)
+            pixmap = self.piecePixmap(char)
+            if not pixmap.isNull():
+                rect = self.squareRect(file, rank)
+                size = pixmap.size() / pixmap.devicePixelRatio()
+                painter.drawPixmap(rect.x() + (rect.width() - size.width()) // 2,
+                                   rect.y() + (rect.height() - size.height()) // 2, pixmap)
 
     def squareAt(self, point):
         """Returns square (file, rank) of type QPoint that contains point."""
@@ -1161,14 +949,14 @@ class View(QWidget):
         self.clicked.emit(point)
 
     def addHighlight(self, highlight):
-        """Adds highlight to the list and redraws view."""
+        """Adds highlight to the list and redraws its square."""
         self.highlights.append(highlight)
-        self.update()
+        self.updateSquare(highlight.file, highlight.rank)
 
     def removeHighlight(self, highlight):
-        """Removes highlight from the list and redraws view."""
+        """Removes highlight from the list and redraws its square."""
         self.highlights.remove(highlight)
-        self.update()
+        self.updateSquare(highlight.file, highlight.rank)
 
     def removeHighlightsOfColor(self, color):
         """Removes all highlights of color."""
@@ -1178,12 +966,13 @@ class View(QWidget):
             if highlight.color == color:
                 self.removeHighlight(highlight)
 
-    def drawHighlights(self, painter):
-        """Draws all recognized highlights stored in the list."""
+    def drawHighlights(self, painter, dirty):
+        """Draws all recognized highlights stored in the list that are within rect dirty."""
         for highlight in self.highlights:
             if highlight.Type == self.SquareHighlight.Type:
                 rect = self.squareRect(highlight.file, highlight.rank)
-                painter.fillRect(rect, highlight.color)
+                if rect.intersects(dirty):
+                    painter.fillRect(rect, highlight.color)
 
     def highlightPlayer(self, player):
         """Adds highlight for player to indicate turn. Removes highlights for other players if they exist."""
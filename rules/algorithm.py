@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import deque
+from datetime import date
+from rules.board import Board
+from rules.bitboard import PLAYERS, encodeBoard, squareIndex
+from rules.movegen import (CASTLING, EN_PASSANT, Position, castlingFromString, decodeMove, enPassantFromString,
+                           formatFen4, moveCodeFromString, moveCodeToAlgebraic, moveCodeToString, moveFromCode)
+from rules.movelist import flattenTree, formatMovetext
+from rules.zobrist import stateKey
+
+
+class Algorithm:
+    """The Algorithm is the underlying logic responsible for changing the current state of the board."""
+    NoResult, Team1Wins, Team2Wins, Draw = ['*', '1-0', '0-1', '1/2-1/2']  # Results
+    NoPlayer, Red, Blue, Yellow, Green = ['?', 'r', 'b', 'y', 'g']  # Players
+    StartingPosition = ('3yRyNyByKyQyByNyR3/3yPyPyPyPyPyPyPyP3/14/bRbP10gPgR/bNbP10gPgN/bBbP10gPgB/bKbP10gPgQ/'
+                        'bQbP10gPgK/bBbP10gPgB/bNbP10gPgN/bRbP10gPgR/14/3rPrPrPrPrPrPrPrP3/3rRrNrBrQrKrBrNrR3 '
+                        'r rKrQbKbQyKyQgKgQ - 0 1')  # FEN4
+
+    def __init__(self):
+        super().__init__()
+        self.variant = '?'
+        self.board = self.createBoard()
+        self.playerQueue = deque([self.Red, self.Blue, self.Yellow, self.Green])
+        self.result = self.NoResult
+        self.currentPlayer = self.NoPlayer
+        self.moveNumber = 0
+        self.castling = 0
+        self.enPassant = (None, None, None, None)
+        self.currentMove = self.Node(0, [], None)
+        self.treeVersion = 0  # Incremented whenever the move tree changes
+        self.flattened = (None, [])  # Tree version and cached result of getMoves()
+        self.checkpointInterval = 16  # Plies between the position snapshots used by seekNode()
+        self.checkpoints = {}  # Node -> Position at that node
+        self.redName = self.NoPlayer
+        self.blueName = self.NoPlayer
+        self.yellowName = self.NoPlayer
+        self.greenName = self.NoPlayer
+
+    class Node:
+        """Generic node class. Basic element of a tree. The move is stored as compact move code (see
+        rules.movegen.encodeMove()), 0 for the root node; it is only rendered as text for display or export."""
+        __slots__ = ('move', 'children', 'parent', 'state')
+
+        def __init__(self, move, children, parent):
+            self.move = move
+            self.children = children
+            self.parent = parent
+            self.state = None  # Castling rights and en passant targets after the move
+
+        @property
+        def name(self):
+            """Move in string form, i.e. '<piece> <from> <captured piece> <to>', or 'root' for the root node."""
+            return moveCodeToString(self.move) if self.move else 'root'
+
+        def add(self, node):
+            """Adds node to children."""
+            self.children.append(node)
+
+        def pop(self):
+            """Removes last child from node."""
+            self.children.pop()
+
+        def getRoot(self):
+            """Backtracks tree and returns root node."""
+            node = self
+            while node.parent is not None:
+                node = node.parent
+            return node
+
+        def getTree(self):
+            """Returns the (sub)tree starting from the current node, with moves as compact move codes."""
+            tree = [self.move, [child.getTree() for child in self.children]]
+            return tree
+
+    # Notification hooks. They do nothing by default, so that the rules run headless at full speed. The GUI adapters
+    # override them to emit the corresponding Qt signals.
+    def boardChangedEvent(self, board):
+        """Called after the board instance has been replaced."""
+        pass
+
+    def gameOverEvent(self, result):
+        """Called once when the game result is set."""
+        pass
+
+    def currentPlayerChangedEvent(self, player):
+        """Called after the current player has changed."""
+        pass
+
+    def fen4GeneratedEvent(self, fen4):
+        """Called after FEN4 has been generated from the current board state."""
+        pass
+
+    def pgn4GeneratedEvent(self, pgn4):
+        """Called after PGN4 has been generated from the current game."""
+        pass
+
+    def moveTreeChangedEvent(self):
+        """Called after a move has been added to the move tree."""
+        pass
+
+    def moveAddedEvent(self, node):
+        """Called after node has been added to the move tree, for incremental updates of the move list."""
+        pass
+
+    def moveTreeResetEvent(self, root):
+        """Called after the move tree has been replaced by the tree below root."""
+        pass
+
+    def addHighlightEvent(self, fromFile, fromRank, toFile, toRank, player):
+        """Called after player's move from (fromFile, fromRank) to (toFile, toRank) has been replayed."""
+        pass
+
+    def removeHighlightEvent(self, player):
+        """Called when the move highlights of player are no longer valid."""
+        pass
+
+    def createBoard(self):
+        """Returns a new, empty board. Adapters override it to provide a board that emits signals."""
+        return Board(14, 14)
+
+    def updatePlayerNames(self, red, blue, yellow, green):
+        self.redName = red if not (red == 'Player Name' or red == '') else '?'
+        self.blueName = blue if not (blue == 'Player Name' or blue == '') else '?'
+        self.yellowName = yellow if not (yellow == 'Player Name' or yellow == '') else '?'
+        self.greenName = green if not (green == 'Player Name' or green == '') else '?'
+
+    def resetMoves(self):
+        """Resets current move to root and move number to zero."""
+        self.moveNumber = 0
+        self.currentMove = self.Node(0, [], None)
+        self.currentMove.state = (self.castling, self.enPassant)
+        self.checkpoints = {self.currentMove: self.getPosition()}
+        self.treeVersion += 1
+        self.moveTreeResetEvent(self.currentMove)
+
+    def setResult(self, value):
+        """Updates game result, if changed."""
+        if self.result == value:
+            return
+        if self.result == self.NoResult:
+            self.result = value
+            self.gameOverEvent(self.result)
+        else:
+            self.result = value
+
+    def setCurrentPlayer(self, value):
+        """Updates current player, if changed."""
+        if self.currentPlayer == value:
+            return
+        self.currentPlayer = value
+        self.setPlayerQueue(self.currentPlayer)
+        self.currentPlayerChangedEvent(self.currentPlayer)
+
+    def setPlayerQueue(self, currentPlayer):
+        """Rotates player queue such that the current player is the first in the queue."""
+        while self.playerQueue[0] != currentPlayer:
+            self.playerQueue.rotate(-1)
+
+    def setBoard(self, board):
+        """Updates board, if changed."""
+        if self.board == board:
+            return
+        self.board = board
+        self.boardChangedEvent(self.board)
+
+    def setupBoard(self):
+        """Initializes board."""
+        self.setBoard(self.createBoard())
+
+    def newGame(self):
+        """Initializes board and sets starting position."""
+        self.setupBoard()
+        # Set starting position from FEN4
+        self.board.setFen4(self.StartingPosition)
+        self.setStateFields(self.StartingPosition)
+        self.setResult(self.NoResult)
+        self.setCurrentPlayer(self.Red)
+        self.setPlayerQueue(self.currentPlayer)
+        self.resetMoves()
+
+    def getBoardState(self):
+        """Gets FEN4 from current board state."""
+        # Board, current player, castling availability (e.g. "rKrQ" if Red can castle kingside and queenside, "-" if no
+        # player can), en passant target squares, number of quarter-moves and number of full moves, starting from 1
+        fen4 = formatFen4(encodeBoard(self.board.boardData), self.currentPlayer, self.castling, self.enPassant,
+                          self.moveNumber)
+        self.fen4GeneratedEvent(fen4)
+        return fen4
+
+    def setBoardState(self, fen4):
+        """Sets board according to FEN4. Does nothing if the FEN4 is invalid."""
+        try:
+            position = Position.fromFen4(fen4)
+        except ValueError:
+            return
+        self.board.setBitBoard(position.board)
+        self.setCurrentPlayer(position.player)
+        self.castling, self.enPassant = position.castling, position.enPassant
+        self.currentMove.state = (self.castling, self.enPassant)
+        self.checkpoints = {self.currentMove: self.getPosition()}  # The other snapshots no longer match the tree
+
+    def setStateFields(self, fen4):
+        """Sets castling rights and en passant targets from the corresponding FEN4 fields, if present."""
+        fields = fen4.split()
+        try:
+            self.castling = castlingFromString(fields[2]) if len(fields) > 2 else 0
+        except ValueError:
+            self.castling = 0
+        try:
+            self.enPassant = enPassantFromString(fields[3] if len(fields) > 3 else '-')
+        except ValueError:
+            self.enPassant = (None, None, None, None)
+
+    def getPosition(self):
+        """Returns a Position with the current board state, for move generation."""
+        return Position(self.board.bitboard.copy(), self.currentPlayer, self.castling, self.enPassant,
+                        self.moveNumber)
+
+    def getRootPosition(self):
+        """Returns a Position with the board state at the root of the move tree, i.e. the start of the game."""
+        root = self.currentMove.getRoot()
+        if root in self.checkpoints:
+            return self.checkpoints[root].copy()
+        position = self.getPosition()
+        node = self.currentMove
+        while node is not root:
+            castling, enPassant = node.parent.state
+            position.unmakeMove(node.move, castling, enPassant)
+            node = node.parent
+        return position
+
+    def getLine(self):
+        """Returns the moves from the root of the move tree to the current move as compact move codes."""
+        line = []
+        node = self.currentMove
+        while node.parent is not None:
+            line.append(node.move)
+            node = node.parent
+        line.reverse()
+        return line
+
+    def getKey(self):
+        """Returns 64-bit Zobrist key of the current position, including current player, castling rights and en
+        passant targets. The piece part is kept up to date by the board, so this takes constant time."""
+        return self.board.bitboard.key ^ stateKey(self.currentPlayer, self.castling, self.enPassant)
+
+    def legalMoves(self):
+        """Returns list of legal moves of the current player as (fromSquare, toSquare, flag, promotion) tuples."""
+        if self.currentPlayer == self.NoPlayer:
+            return []
+        return self.getPosition().legalMoves()
+
+    def treeToAlgebraic(self, tree):
+        if not tree[0]:
+            newTree = ['root', [self.treeToAlgebraic(subtree) for subtree in tree[1]]]
+        else:
+            newTree = [self.toAlgebraic(tree[0]), [self.treeToAlgebraic(subtree) for subtree in tree[1]]]
+        return newTree
+
+    def toAlgebraic(self, move):
+        """Converts move (compact move code or move string) to algebraic notation."""
+        if isinstance(move, str):
+            move = moveCodeFromString(move)
+        return moveCodeToAlgebraic(move)
+
+    def strMove(self, fromFile, fromRank, toFile, toRank):
+        """Returns move in string form, separated by spaces, i.e. '<piece> <from> <captured piece> <to>'."""
+        piece: str = self.board.getData(fromFile, fromRank)
+        target: str = self.board.getData(toFile, toRank)
+        char = (piece + ' ' + chr(97+fromFile) + str(fromRank+1) + ' ' + target*(target != ' ') + ' ' + chr(97+toFile) +
+                str(toRank+1))  # chr(97) = 'a'
+        return char
+
+    @staticmethod
+    def parseMove(moveString):
+        """Parses move string into (piece, fromFile, fromRank, target, toFile, toRank, promotion)."""
+        moveString = moveString.split()
+        piece = moveString[0]
+        fromFile = ord(moveString[1][0]) - 97  # chr(97) = 'a'
+        fromRank = int(moveString[1][1:]) - 1
+        target = moveString[2] if len(moveString) == 4 else ' '
+        toSquare, _, promotion = moveString[-1].partition('=')
+        toFile = ord(toSquare[0]) - 97
+        toRank = int(toSquare[1:]) - 1
+        return piece, fromFile, fromRank, target, toFile, toRank, promotion
+
+    @staticmethod
+    def castlingSquares(fromFile, fromRank, toFile, toRank):
+        """Returns king and rook target squares ((kingFile, kingRank), (rookFile, rookRank)) of castling move from king
+        square (fromFile, fromRank) to rook square (toFile, toRank), or None if the distance does not match."""
+        if fromRank == toRank:
+            if abs(toFile - fromFile) == 3:  # Kingside
+                kingFile = toFile - 1 if toFile > fromFile else toFile + 1
+                rookFile = fromFile + 1 if toFile > fromFile else fromFile - 1
+            elif abs(toFile - fromFile) == 4:  # Queenside
+                kingFile = toFile + 2 if toFile < fromFile else toFile - 2
+                rookFile = fromFile - 1 if toFile < fromFile else fromFile + 1
+            else:
+                return None
+            return (kingFile, toRank), (rookFile, toRank)
+        elif fromFile == toFile:
+            if abs(toRank - fromRank) == 3:  # Kingside
+                kingRank = toRank - 1 if toRank > fromRank else toRank + 1
+                rookRank = fromRank + 1 if toRank > fromRank else fromRank - 1
+            elif abs(toRank - fromRank) == 4:  # Queenside
+                kingRank = toRank + 2 if toRank < fromRank else toRank - 2
+                rookRank = fromRank - 1 if toRank < fromRank else fromRank + 1
+            else:
+                return None
+            return (toFile, kingRank), (toFile, rookRank)
+        return None
+
+    def enPassantPawn(self, target):
+        """Returns square (file, rank) of the pawn of player target[0] that can be captured en passant."""
+        pawn = self.enPassant[PLAYERS.index(target[0])][1]
+        return pawn % self.board.files, pawn // self.board.files
+
+    def playMove(self, move):
+        """Makes move (compact move code) on the board, including castling, en passant captures and promotions."""
+        fromSquare, toSquare, piece, target, flag, promotion = decodeMove(move)
+        files = self.board.files
+        fromFile, fromRank = fromSquare % files, fromSquare // files
+        toFile, toRank = toSquare % files, toSquare // files
+        self.board.beginBatch()  # One notification for the whole move
+        try:
+            if flag == CASTLING:
+                (kingFile, kingRank), (rookFile, rookRank) = self.castlingSquares(fromFile, fromRank, toFile, toRank)
+                self.board.movePiece(fromFile, fromRank, kingFile, kingRank)
+                self.board.movePiece(toFile, toRank, rookFile, rookRank)
+                return
+            if flag == EN_PASSANT:
+                # En passant capture, the captured pawn is not on the target square
+                self.board.setData(*self.enPassantPawn(target), ' ')
+            self.board.movePiece(fromFile, fromRank, toFile, toRank)
+            if promotion:
+                self.board.setData(toFile, toRank, piece[0] + promotion)
+        finally:
+            self.board.endBatch()
+
+    def unplayMove(self, move):
+        """Takes back move (compact move code) on the board. Castling rights and en passant targets must be those
+        before the move."""
+        fromSquare, toSquare, piece, target, flag, promotion = decodeMove(move)
+        files = self.board.files
+        fromFile, fromRank = fromSquare % files, fromSquare // files
+        toFile, toRank = toSquare % files, toSquare // files
+        self.board.beginBatch()  # One notification for the whole move
+        try:
+            if flag == CASTLING:
+                (kingFile, kingRank), (rookFile, rookRank) = self.castlingSquares(fromFile, fromRank, toFile, toRank)
+                self.board.setData(kingFile, kingRank, ' ')
+                self.board.setData(rookFile, rookRank, ' ')
+                self.board.setData(fromFile, fromRank, piece)
+                self.board.setData(toFile, toRank, target)
+                return
+            self.board.setData(fromFile, fromRank, piece)
+            if flag == EN_PASSANT:
+                # En passant capture, the captured pawn was not on the target square
+                self.board.setData(toFile, toRank, ' ')
+                self.board.setData(*self.enPassantPawn(target), target)
+            else:
+                self.board.setData(toFile, toRank, target)
+        finally:
+            self.board.endBatch()
+
+    def prevMove(self):
+        """Sets board state to previous move."""
+        if self.currentMove.parent is None:
+            return
+        move = self.currentMove.move
+        self.currentMove = self.currentMove.parent
+        if self.currentMove.state:
+            self.castling, self.enPassant = self.currentMove.state
+        self.unplayMove(move)
+        self.moveNumber -= 1
+        self.playerQueue.rotate(1)
+        self.setCurrentPlayer(self.playerQueue[0])
+        # Signal View to remove last move highlight
+        self.removeHighlightEvent(self.currentPlayer)
+
+    def nextMove(self):
+        """Sets board state to next move."""
+        if not self.currentMove.children:
+            return
+        move = self.currentMove.children[-1].move  # Take last variation
+        self.playMove(move)
+        self.currentMove = self.currentMove.children[-1]
+        if self.currentMove.state:
+            self.castling, self.enPassant = self.currentMove.state
+        self.moveNumber += 1
+        # Signal View to add move highlight and remove highlights of next player
+        fromSquare, toSquare = move & 0xff, move >> 8 & 0xff
+        files = self.board.files
+        self.addHighlightEvent(fromSquare % files, fromSquare // files, toSquare % files, toSquare // files,
+                               self.currentPlayer)
+        self.playerQueue.rotate(-1)
+        self.setCurrentPlayer(self.playerQueue[0])
+        self.removeHighlightEvent(self.currentPlayer)
+
+    def firstMove(self):
+        """Sets board state to the start of the game."""
+        self.seekNode(self.currentMove.getRoot())
+
+    def lastMove(self):
+        """Sets board state to the end of the line, following the last variation like nextMove()."""
+        node = self.currentMove
+        while node.children:
+            node = node.children[-1]
+        self.seekNode(node)
+
+    def seekPly(self, ply):
+        """Sets board state to the move at ply of the current line. Beyond the current move, the line follows the last
+        variation like nextMove()."""
+        node = self.currentMove
+        moveNumber = self.moveNumber
+        while moveNumber > ply and node.parent is not None:
+            node = node.parent
+            moveNumber -= 1
+        while moveNumber < ply and node.children:
+            node = node.children[-1]
+            moveNumber += 1
+        self.seekNode(node)
+
+    def seekNode(self, node):
+        """Sets board state to node of the move tree. Starts from the current position or from the nearest checkpoint
+        on the way from node to the root, whichever is fewer moves away, and replays the moves in between silently
+        on a Position. Checkpoints are taken every checkpointInterval plies along the lines replayed. The board, the
+        move highlights and the current player are notified once at the end."""
+        if node is self.currentMove:
+            return
+        # Distances of the ancestors of the current move
+        distances = {}
+        distance = 0
+        current = self.currentMove
+        while current is not None:
+            distances[current] = distance
+            distance += 1
+            current = current.parent
+        # Line from the root to node, the last common ancestor with the current move and the last checkpoint on it
+        line = []
+        current = node
+        while current is not None:
+            line.append(current)
+            current = current.parent
+        line.reverse()
+        common = 0
+        checkpoint = None
+        for index, current in enumerate(line):
+            if current in distances:
+                common = index
+            if current in self.checkpoints:
+                checkpoint = index
+        fromCurrent = distances[line[common]] + len(line) - 1 - common
+        fromCheckpoint = len(line) - 1 - checkpoint + 4 if checkpoint is not None else fromCurrent  # Copy ~ 4 moves
+        if fromCheckpoint < fromCurrent:
+            position = self.checkpoints[line[checkpoint]].copy()
+            start = checkpoint
+        else:
+            # Take back the moves from the current move to the common ancestor
+            position = self.getPosition()
+            current = self.currentMove
+            while current is not line[common]:
+                castling, enPassant = current.parent.state
+                position.unmakeMove(current.move, castling, enPassant)
+                current = current.parent
+            start = common
+        for index in range(start + 1, len(line)):
+            position.push(moveFromCode(line[index].move))
+            if index % self.checkpointInterval == 0 and line[index] not in self.checkpoints:
+                self.checkpoints[line[index]] = position.copy()
+
+        self.currentMove = node
+        self.castling, self.enPassant = position.castling, position.enPassant
+        self.moveNumber = position.ply
+        self.board.setBitBoard(position.board)
+        # Highlight the last move of each of the other players
+        current = node
+        while current.parent is not None and current is not line[max(len(line) - 4, 0)]:
+            fromSquare, toSquare, piece, target, flag, promotion = decodeMove(current.move)
+            files = self.board.files
+            self.addHighlightEvent(fromSquare % files, fromSquare // files, toSquare % files, toSquare // files,
+                                   piece[0])
+            current = current.parent
+        self.currentPlayer = position.player
+        self.setPlayerQueue(self.currentPlayer)
+        self.currentPlayerChangedEvent(self.currentPlayer)
+
+    def makeMove(self, fromFile, fromRank, toFile, toRank, promotion='Q'):
+        """This method must be overridden to define the proper logic corresponding to the game type (Teams or FFA)."""
+        return False
+
+    def getPgn4(self):
+        """Generates PGN4 from current game."""
+        pgn4 = ''
+
+        # Standard tags, ("?" if data unknown, "-" if not applicable)
+        pgn4 += '[Event "Four-Player Chess ' + self.variant + '"]\n'
+        pgn4 += '[Site "chess.com"]\n'
+        pgn4 += '[Date "' + date.today().strftime('%Y.%m.%d') + '"]\n'
+        # pgn4 += '[Round "-"]\n'
+        pgn4 += '[Red "' + self.redName + '"]\n'
+        pgn4 += '[Blue "' + self.blueName + '"]\n'
+        pgn4 += '[Yellow "' + self.yellowName + '"]\n'
+        pgn4 += '[Green "' + self.greenName + '"]\n'
+        pgn4 += '[Result "' + self.result + '"]\n'  # 1-0 (r & y win), 0-1 (b & g win), 1/2-1/2 (draw), * (no result)
+
+        # Supplemental tags
+        # pgn4 += '[RedElo "?"]\n'
+        # pgn4 += '[BlueElo "?"]\n'
+        # pgn4 += '[YellowElo "?"]\n'
+        # pgn4 += '[GreenElo "?"]\n'
+        pgn4 += '[PlyCount "' + str(self.moveNumber) + '"]\n'  # Total number of quarter-moves
+        pgn4 += '[TimeControl "60 d15"]\n'  # 60 seconds sudden death with 15 seconds delay per move
+        pgn4 += '[Mode "ICS"]\n'  # ICS = Internet Chess Server, OTB = Over-The-Board
+        pgn4 += '[CurrentPosition "' + self.getBoardState() + '"]\n'
+        rootPosition = self.getRootPosition()
+        if rootPosition.getFen4() != Position.fromFen4(self.StartingPosition).getFen4():
+            pgn4 += '[StartFen4 "' + rootPosition.getFen4() + '"]\n'  # Game set up from a position
+        pgn4 += '\n'
+
+        # Movetext, with the moves disambiguated so that rules.pgn4 reads back the same move tree
+        movetext = formatMovetext(self.currentMove.getRoot(), rootPosition)
+        if movetext:
+            pgn4 += movetext + ' '
+        # Append result
+        pgn4 += self.result
+        self.pgn4GeneratedEvent(pgn4)
+        return pgn4
+
+    def getMoveTree(self):
+        """Returns the move tree as nested list with moves in algebraic notation, i.e. ['root', [children]]."""
+        return self.treeToAlgebraic(self.currentMove.getRoot().getTree())
+
+    def getMoves(self):
+        """Returns the moves of the move tree in PGN4 order as list of (moveNum, node, lineRoot, var) tuples, see
+        flattenTree(). The list is cached until the move tree changes."""
+        version, moves = self.flattened
+        if version != self.treeVersion:
+            moves = flattenTree(self.currentMove.getRoot())
+            self.flattened = (self.treeVersion, moves)
+        return moves
+
+
+class Teams(Algorithm):
+    """A subclass of Algorithm for the 4-player chess Teams variant."""
+    def __init__(self):
+        super().__init__()
+        self.variant = 'Teams'
+
+    def makeMove(self, fromFile, fromRank, toFile, toRank, promotion='Q'):
+        """Moves piece from square (fromFile, fromRank) to square (toFile, toRank), if the move is legal. Pawns reaching
+        the promotion rank are promoted to promotion."""
+        if self.currentPlayer == self.NoPlayer:
+            return False
+        # Check if square contains piece of current player. (A player may only move his own pieces.)
+        fromData = self.board.getData(fromFile, fromRank)
+        if self.currentPlayer == self.Red and fromData[0] != 'r':
+            return False
+        if self.currentPlayer == self.Blue and fromData[0] != 'b':
+            return False
+        if self.currentPlayer == self.Yellow and fromData[0] != 'y':
+            return False
+        if self.currentPlayer == self.Green and fromData[0] != 'g':
+            return False
+
+        # Check if move is within board
+        if toFile < 0 or toFile > (self.board.files-1):
+            return False
+        if toRank < 0 or toRank > (self.board.ranks-1):
+            return False
+        if ((toFile < 3 and toRank < 3) or (toFile < 3 and toRank > 10) or
+                (toFile > 10 and toRank < 3) or (toFile > 10 and toRank > 10)):
+            return False
+
+        # Check if target square is not occupied by friendly piece. (Castling move excluded.)
+        toData = self.board.getData(toFile, toRank)
+        if self.currentPlayer == self.Red and (toData[0] == 'r' or toData[0] == 'y'):
+            if not (fromData == 'rK' and toData == 'rR'):
+                return False
+        if self.currentPlayer == self.Blue and (toData[0] == 'b' or toData[0] == 'g'):
+            if not (fromData == 'bK' and toData == 'bR'):
+                return False
+        if self.currentPlayer == self.Yellow and (toData[0] == 'y' or toData[0] == 'r'):
+            if not (fromData == 'yK' and toData == 'yR'):
+                return False
+        if self.currentPlayer == self.Green and (toData[0] == 'g' or toData[0] == 'b'):
+            if not (fromData == 'gK' and toData == 'gR'):
+                return False
+
+        # Check if move is legal, i.e. follows the piece movement rules and does not leave the own king in check
+        position = self.getPosition()
+        legalMove = position.findMove(squareIndex(fromFile, fromRank), squareIndex(toFile, toRank), promotion)
+        if legalMove is None:
+            return False
+
+        # If move already exists (in case of variations), do not change the move tree
+        code = position.encodeMove(legalMove)
+        if not (self.currentMove.children and (code in (child.move for child in self.currentMove.children))):
+            # Make move child of current move and update current move (i.e. previous move is parent of current move)
+            move = self.Node(code, [], self.currentMove)
+            self.currentMove.add(move)
+            self.currentMove = move
+
+            # Notify that the move list must be updated
+            self.treeVersion += 1
+            self.moveTreeChangedEvent()
+            self.moveAddedEvent(move)
+        else:
+            # Update current move, but do not change the move tree
+            for child in self.currentMove.children:
+                if child.move == code:
+                    self.currentMove = child
+
+        # Make the move and update castling rights and en passant targets
+        self.playMove(code)
+        position.push(legalMove)
+        self.castling, self.enPassant = position.castling, position.enPassant
+        self.currentMove.state = (self.castling, self.enPassant)
+
+        # Increment move number
+        self.moveNumber += 1
+
+        # Rotate player queue and get next player from the queue (first element)
+        self.playerQueue.rotate(-1)
+        self.setCurrentPlayer(self.playerQueue[0])
+
+        # The game ends if the next player has no legal move
+        result = teamsResult(position)
+        if result != self.NoResult:
+            self.setResult(result)
+        return True
+
+
+def teamsResult(position):
+    """Returns the result of a Teams game in position: if the player to move has no legal move, checkmate loses the
+    game for his team and stalemate is a draw; otherwise there is no result yet."""
+    if position.hasLegalMove():
+        return Algorithm.NoResult
+    if position.inCheck():
+        return Algorithm.Team2Wins if position.player in (Algorithm.Red, Algorithm.Yellow) else Algorithm.Team1Wins
+    return Algorithm.Draw
+
+
+class FFA(Algorithm):
+    """A subclass of Algorithm for the 4-player chess Free-For-All (FFA) variant."""
+    # TODO implement FFA class
+    def __init__(self):
+        super().__init__()
+        self.variant = 'Free-For-All'
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rules.movegen import OPPONENTS, Position, moveFromCode
+from rules.movelist import flattenTree
+from rules.search import PARANOID, Search, SearchStopped
+
+ANALYSIS_DEPTH = 3  # Plies searched before each move; the position after it is searched one ply less
+BLUNDER, MISTAKE, INACCURACY = '??', '?', '?!'
+FLAG_THRESHOLDS = ((300, BLUNDER), (120, MISTAKE), (50, INACCURACY))  # Centipawns lost by a move -> flag
+
+
+def analysisOrder(root):
+    """Returns the nodes below root in the order they are analyzed: the main line first, then the variations of the
+    main line, then the variations of those, and so on, each level in PGN4 order."""
+    return [node for moveNum, node, lineRoot, var in sorted(flattenTree(root), key=lambda entry: entry[3])]
+
+
+def nodeFen4s(root, position):
+    """Returns dict of the FEN4 of the position at each node of the tree below root, including root. Position is the
+    position of root; the tree is walked once, pushing and popping the moves on a copy."""
+    fen4s = {}
+    position = position.copy()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            position.pop()  # All children of the node have been visited
+            continue
+        if node is not root:
+            position.push(moveFromCode(node.move))
+            stack.append(None)
+        fen4s[node] = position.getFen4()
+        stack.extend(reversed(node.children))
+    return fen4s
+
+
+class Annotation:
+    """Analysis result of a move: the score of the position after the move and the score and compact code of the
+    best move, both scores in centipawns from the view of the team that made the move."""
+    __slots__ = ('player', 'score', 'bestScore', 'bestMove')
+
+    def __init__(self, player, score, bestScore, bestMove):
+        self.player = player  # Player who made the move
+        self.score = score
+        self.bestScore = bestScore
+        self.bestMove = bestMove
+
+    @property
+    def loss(self):
+        """Centipawns lost by the move compared to the best move."""
+        return max(self.bestScore - self.score, 0)
+
+    @property
+    def flag(self):
+        """Blunder, mistake or inaccuracy mark of the move, or '' if it loses little or nothing."""
+        for threshold, flag in FLAG_THRESHOLDS:
+            if self.loss >= threshold:
+                return flag
+        return ''
+
+    @property
+    def teamScore(self):
+        """Score of the position after the move from the view of team Red and Yellow."""
+        return -self.score if self.player in OPPONENTS['r'] else self.score
+
+
+class Analyzer(Search):
+    """Paranoid search run by each process of a GameAnalysis pool. Stops as soon as the analysis it works for is
+    cancelled, i.e. the shared generation number no longer matches that of its job."""
+    def __init__(self, generation):
+        super().__init__(PARANOID)
+        self.generation = generation  # Shared with the parent process, incremented by GameAnalysis.cancel()
+        self.jobGeneration = 0
+
+    def checkTime(self):
+        """Overrides Search checkTime() method. Also checks the shared generation number."""
+        if self.generation.value != self.jobGeneration:
+            raise SearchStopped
+        super().checkTime()
+
+
+# Analyzer of the current process of a GameAnalysis pool, see _initAnalyzer()
+_analyzer = None
+
+
+def _initAnalyzer(generation):
+    global _analyzer
+    _analyzer = Analyzer(generation)
+
+
+def _analyzeMove(fen4, code, depth, timeLimit, generation):
+    """Searches the position of fen4 before and after the move with compact code. Returns (bestMove, bestScore,
+    score) as in Annotation, or None if the analysis was cancelled."""
+    _analyzer.jobGeneration = generation
+    if _analyzer.generation.value != generation:
+        return None
+    position = Position.fromFen4(fen4)
+    best, bestScore, pv = _analyzer.search(position, depth, timeLimit)
+    bestMove = position.encodeMove(best) if best else 0
+    if bestMove == code:
+        score = bestScore
+    else:
+        position.push(moveFromCode(code))
+        # The other team moves next; the position after the move is searched to the same horizon
+        score = -_analyzer.search(position, max(depth - 1, 1), timeLimit)[1]
+    if _analyzer.generation.value != generation:
+        return None
+    return bestMove, bestScore, score
+
+
+class GameAnalysis:
+    """Analysis of all moves of a move tree in a pool of worker processes: for each move, the score of the position
+    after it, the best move and whether the move was a blunder, mistake or inaccuracy. The moves are queued in
+    analysisOrder() and their annotations reported through annotationEvent() as they arrive. analyze() blocks until
+    all moves are analyzed, so GUIs walk the tree with jobs() and call analyzeJobs() in a worker thread; cancel() may
+    be called from any thread. Moves analyzed before are not analyzed again, as long as the tree root stays the
+    same."""
+    def __init__(self, depth=ANALYSIS_DEPTH, timeLimit=None, processes=None):
+        super().__init__()
+        self.depth = depth
+        self.timeLimit = timeLimit  # Seconds per search, None for no limit
+        self.processes = processes or multiprocessing.cpu_count()
+        self.executor = None
+        self.generation = None  # Shared generation number, see Analyzer
+        self.lock = threading.Lock()
+        self.futures = []
+        self.root = None
+        self.annotations = {}  # Node -> Annotation
+
+    # Notification hooks. They do nothing by default; the Qt adapter overrides them.
+    def annotationEvent(self, node, annotation):
+        """Called when the move of node has been analyzed."""
+        pass
+
+    def finishedEvent(self, complete):
+        """Called when analyze() returns; complete is False if the analysis was cancelled."""
+        pass
+
+    def startPool(self):
+        """Starts the worker processes, unless they are running."""
+        if self.executor:
+            return
+        # Spawned, not forked, since the caller may be a GUI with several threads
+        context = multiprocessing.get_context('spawn')
+        self.generation = context.RawValue('Q', 0)
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=context, initializer=_initAnalyzer,
+                                            initargs=(self.generation,))
+
+    def shutdown(self):
+        """Cancels the analysis and stops the worker processes."""
+        self.cancel()
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def cancel(self):
+        """Cancels the running analysis. The moves being searched are stopped, the queued ones dropped."""
+        with self.lock:
+            if self.generation is not None:
+                self.generation.value += 1
+            for future in self.futures:
+                future.cancel()
+            self.futures = []
+
+    def jobs(self, root, position):
+        """Returns list of (node, fen4) of the moves of the tree below root that are still to be analyzed, in
+        analysisOrder(), with the FEN4 of the position before each move. Position is the position of root."""
+        if root is not self.root:
+            self.root = root
+            self.annotations = {}
+        nodes = [node for node in analysisOrder(root) if node not in self.annotations]
+        fen4s = nodeFen4s(root, position) if nodes else {}
+        return [(node, fen4s[node.parent]) for node in nodes]
+
+    def analyze(self, root, position):
+        """Analyzes the moves of the tree below root, position being the position of root. Returns True if all
+        moves were analyzed, False if the analysis was cancelled."""
+        return self.analyzeJobs(self.jobs(root, position))
+
+    def analyzeJobs(self, jobs):
+        """Analyzes the moves of jobs, as returned by jobs(). Returns True if all were analyzed, False if the
+        analysis was cancelled."""
+        self.startPool()
+        with self.lock:
+            generation = self.generation.value
+            futures = {self.executor.submit(_analyzeMove, fen4, node.move, self.depth, self.timeLimit, generation):
+                       (node, fen4) for node, fen4 in jobs}
+            self.futures = list(futures)
+        for future in as_completed(futures):
+            if future.cancelled() or self.generation.value != generation:
+                continue
+            result = future.result()
+            if result is None:
+                continue
+            node, fen4 = futures[future]
+            bestMove, bestScore, score = result
+            annotation = Annotation(fen4.split()[1], score, bestScore, bestMove)
+            self.annotations[node] = annotation
+            self.annotationEvent(node, annotation)
+        complete = self.generation.value == generation
+        self.finishedEvent(complete)
+        return complete
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import mmap
+import struct
+import sys
+from array import array
+from rules.algorithm import Algorithm
+from rules.movegen import PROMOTIONS, Position, moveFromCode
+from rules.movelist import flattenTree
+from rules.pgn4 import RESULTS, Game
+
+# Binary game archive, a compact alternative to PGN4 with random access. All integers are little-endian.
+#   file header     magic '4PCA', version (u16), reserved (u16), game count (u64), index offset (u64)
+#   games           one record per game, see below
+#   index           game count + 1 record offsets (u64 each); the last one is the index offset
+# A game record is its header table followed by its moves:
+#   result (u8, index into RESULTS), tag count (u8), move word count (u32)
+#   tags            name length (u8), value length (u16), name and value (UTF-8) per tag, in their PGN4 order
+#   move words      u16 each, the move tree in PGN4 order (see rules.movelist.flattenTree())
+# A move word has the from square in the low byte and the to square in the high byte, like the low 16 bits of a
+# compact move code (see rules.movegen.encodeMove()); pawns reaching the promotion rank become queens. Squares are
+# below 196, so low bytes of 0xff mark the other words:
+#   VARIATION_START   the following moves replace the last move, up to the matching VARIATION_END
+#   VARIATION_END     the line continues after the move the variation replaced
+#   PROMOTION_WORDS   the next move promotes to a rook, bishop or knight instead of a queen
+# The start position is the StartFen4 or FEN4 tag, as in PGN4.
+MAGIC = b'4PCA'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sHHQQ')
+GAME_HEADER = struct.Struct('<BBI')
+TAG_HEADER = struct.Struct('<BH')
+OFFSET = struct.Struct('<Q')
+VARIATION_START = 0x00ff
+VARIATION_END = 0x01ff
+PROMOTION_WORDS = {'R': 0x02ff, 'B': 0x03ff, 'N': 0x04ff}
+WORD_PROMOTIONS = {word: promotion for promotion, word in PROMOTION_WORDS.items()}
+NO_RESULT = 0xff  # Result not in RESULTS, read from the Result tag
+
+
+class ArchiveError(ValueError):
+    """Raised if an archive is invalid or a game cannot be decoded."""
+    pass
+
+
+def encodeTree(root):
+    """Returns the move tree below root as array of move words."""
+    words = array('H')
+    prevNode = root
+    prevVar = 0
+    for moveNum, node, lineRoot, var in flattenTree(root):
+        if node.parent is not prevNode:
+            words.extend([VARIATION_END] * (prevVar - var + (node is lineRoot)))
+            if node is lineRoot:
+                words.append(VARIATION_START)
+        code = node.move
+        promotion = PROMOTIONS[code >> 28 & 7]
+        if promotion in PROMOTION_WORDS:
+            words.append(PROMOTION_WORDS[promotion])
+        words.append(code & 0xffff)
+        prevNode = node
+        prevVar = var
+    words.extend([VARIATION_END] * prevVar)
+    return words
+
+
+def decodeTree(words, startPosition):
+    """Returns the root of the move tree of move words, played from FEN4 startPosition. The moves were legal when
+    written, so they are not checked again (see Position.inferMove()). Raises ArchiveError if a move does not start
+    on a piece of the player to move or the variations do not match."""
+    position = Position.fromFen4(startPosition)
+    root = Algorithm.Node(0, [], None)
+    root.state = (position.castling, position.enPassant)
+    node = root
+    stack = []  # (node, number of moves made) where the enclosing lines continue
+    promotion = 'Q'
+    for word in words:
+        if word & 0xff == 0xff:
+            if word == VARIATION_START:
+                if node is root:
+                    raise ArchiveError('Variation without a move to replace')
+                stack.append((node, len(position.stack)))
+                position.pop()
+                node = node.parent
+            elif word == VARIATION_END:
+                if not stack:
+                    raise ArchiveError('Unmatched variation end')
+                node, depth = stack.pop()
+                while len(position.stack) >= depth:
+                    position.pop()
+                position.push(moveFromCode(node.move))
+            elif word in WORD_PROMOTIONS:
+                promotion = WORD_PROMOTIONS[word]
+            else:
+                raise ArchiveError('Invalid move word: %#06x' % word)
+            continue
+        move = position.inferMove(word & 0xff, word >> 8, promotion)
+        if move is None:
+            raise ArchiveError('Invalid move at ply %d' % (position.ply + 1))
+        promotion = 'Q'
+        child = Algorithm.Node(position.encodeMove(move), [], node)
+        position.push(move)
+        child.state = (position.castling, position.enPassant)
+        node.add(child)
+        node = child
+    if stack:
+        raise ArchiveError('Unmatched variation start')
+    return root
+
+
+def encodeGame(game):
+    """Returns game (a rules.pgn4.Game) as archive record."""
+    tags = list(game.tags.items())
+    if len(tags) > 0xff:
+        raise ArchiveError('Too many tags: %d' % len(tags))
+    words = encodeTree(game.root)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    parts = [GAME_HEADER.pack(RESULTS.index(game.result) if game.result in RESULTS else NO_RESULT, len(tags),
+                              len(words))]
+    for name, value in tags:
+        name, value = name.encode(), value.encode()
+        if len(name) > 0xff or len(value) > 0xffff:
+            raise ArchiveError('Tag too long: %s' % name.decode())
+        parts += [TAG_HEADER.pack(len(name), len(value)), name, value]
+    parts.append(words.tobytes())
+    return b''.join(parts)
+
+
+def readWords(data, offset, count):
+    """Returns array of count move words at offset of data."""
+    words = array('H', data[offset:offset + 2 * count])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+
+class ArchiveWriter:
+    """Writes games to a new archive. The index and the game count are written by close()."""
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.offsets = array('Q')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def add(self, game):
+        """Appends game (a rules.pgn4.Game)."""
+        self.offsets.append(self.file.tell())
+        self.file.write(encodeGame(game))
+
+    def close(self):
+        """Writes the index and the file header and closes the file."""
+        if self.file.closed:
+            return
+        indexOffset = self.file.tell()
+        offsets = array('Q', self.offsets)
+        offsets.append(indexOffset)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+        self.file.seek(0)
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, len(self.offsets), indexOffset))
+        self.file.close()
+
+
+class GameArchive:
+    """Reads an archive through mmap. Games are decoded on access, one at a time, using the index to find them; the
+    rest of the file is not touched. Supports len(), indexing and iteration."""
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < FILE_HEADER.size:
+            raise ArchiveError('Not a game archive: %s' % path)
+        magic, version, reserved, self.count, self.indexOffset = FILE_HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ArchiveError('Not a game archive: %s' % path)
+        if version != VERSION:
+            raise ArchiveError('Unsupported archive version: %d' % version)
+        if self.indexOffset + (self.count + 1) * OFFSET.size > len(self.data):
+            raise ArchiveError('Truncated archive: %s' % path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.game(index)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.game(index)
+
+    def close(self):
+        """Unmaps the file."""
+        self.data.close()
+
+    def record(self, index):
+        """Returns (start, end) offsets of the record of game index."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('Game index out of range: %d' % index)
+        return (OFFSET.unpack_from(self.data, self.indexOffset + index * OFFSET.size)[0],
+                OFFSET.unpack_from(self.data, self.indexOffset + (index + 1) * OFFSET.size)[0])
+
+    def header(self, index):
+        """Returns (tags, result, offset of the move words, move word count) of game index."""
+        offset, end = self.record(index)
+        data = self.data
+        resultIndex, tagCount, wordCount = GAME_HEADER.unpack_from(data, offset)
+        offset += GAME_HEADER.size
+        tags = {}
+        for _ in range(tagCount):
+            nameLength, valueLength = TAG_HEADER.unpack_from(data, offset)
+            offset += TAG_HEADER.size
+            name = data[offset:offset + nameLength].decode()
+            offset += nameLength
+            tags[name] = data[offset:offset + valueLength].decode()
+            offset += valueLength
+        if offset + 2 * wordCount != end:
+            raise ArchiveError('Corrupt record of game %d' % index)
+        result = RESULTS[resultIndex] if resultIndex < len(RESULTS) else tags.get('Result', Algorithm.NoResult)
+        return tags, result, offset, wordCount
+
+    def tags(self, index):
+        """Returns the tags of game index, without decoding its moves."""
+        return self.header(index)[0]
+
+    def words(self, index):
+        """Returns the move words of game index as array."""
+        tags, result, offset, wordCount = self.header(index)
+        return readWords(self.data, offset, wordCount)
+
+    def game(self, index):
+        """Returns game index as rules.pgn4.Game, with the same tags, move tree and result as the game written."""
+        tags, result, offset, wordCount = self.header(index)
+        words = readWords(self.data, offset, wordCount)
+        startPosition = tags.get('StartFen4') or tags.get('FEN4') or Algorithm.StartingPosition
+        return Game(tags, decodeTree(words, startPosition), startPosition, result)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from functools import reduce
+from itertools import chain
+from operator import xor
+from rules.piecesquare import PIECE_SQUARE_SCORES
+from rules.zobrist import PIECE_KEYS
+
+# Board geometry. Squares are indexed as file + rank * FILES, the same as Board.boardData, so that square indices can
+# be shared between the list and the bitboard representation. Bit n of a bitboard corresponds to square n.
+FILES = RANKS = 14
+SQUARES = FILES * RANKS
+PLAYERS = 'rbyg'
+PIECE_TYPES = 'PNBRQK'
+TEAMMATES = {'r': 'y', 'b': 'g', 'y': 'r', 'g': 'b'}
+
+# Ray directions as (file, rank) steps. Rays in positive directions have their first blocker at the lowest set bit,
+# rays in negative directions at the highest set bit.
+NORTH, EAST, NORTHEAST, NORTHWEST, SOUTH, WEST, SOUTHWEST, SOUTHEAST = range(8)
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (-1, 1), (0, -1), (-1, 0), (-1, -1), (1, -1)]
+ORTHOGONALS = (NORTH, EAST, SOUTH, WEST)
+DIAGONALS = (NORTHEAST, NORTHWEST, SOUTHWEST, SOUTHEAST)
+KNIGHT_STEPS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+# Forward direction of the pawns of each player
+PAWN_DIRECTIONS = {'r': (0, 1), 'b': (1, 0), 'y': (0, -1), 'g': (-1, 0)}
+
+
+FEN4_TOKEN = re.compile(r'\d+|[rbyg][PNBRQK]')
+# Memo tables of the FEN4 board field codec, filled as ranks are seen. Positions of a game or dataset share most of
+# their ranks, so nearly all ranks are a lookup.
+FEN4_ROWS = {}  # Squares of a rank joined (' ' for empty squares) -> FEN4 row
+FEN4_RANKS = {}  # (rank, FEN4 row) -> (squares, packed masks, key, scores) of the rank, see decodeRank()
+FEN4_CACHE_SIZE = 1 << 16  # Entries per table; a full table is cleared
+FEN4_MASK = (1 << SQUARES) - 1
+EMPTY_RUNS = [(' ' * length, str(length)) for length in reversed(range(1, FILES + 1))]
+
+
+def isCorner(file, rank):
+    """Returns True if square (file, rank) is one of the 3x3 corner squares that are not part of the board."""
+    return (file < 3 or file > 10) and (rank < 3 or rank > 10)
+
+
+def onBoard(file, rank):
+    """Returns True if square (file, rank) is a playable square."""
+    return 0 <= file < FILES and 0 <= rank < RANKS and not isCorner(file, rank)
+
+
+def squareIndex(file, rank):
+    """Returns square index of square (file, rank)."""
+    return file + rank * FILES
+
+
+def squareName(square):
+    """Returns algebraic name of square index, e.g. 'h2'."""
+    return chr(97 + square % FILES) + str(square // FILES + 1)  # chr(97) = 'a'
+
+
+def parseSquare(name):
+    """Returns square index of algebraic square name, e.g. 'h2'."""
+    return ord(name[0]) - 97 + (int(name[1:]) - 1) * FILES
+
+
+def iterBits(mask):
+    """Yields the square indices of the set bits of mask, from low to high."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _mask(squares):
+    mask = 0
+    for file, rank in squares:
+        mask |= 1 << squareIndex(file, rank)
+    return mask
+
+
+def _ray(file, rank, step):
+    squares = []
+    file, rank = file + step[0], rank + step[1]
+    while onBoard(file, rank):
+        squares.append((file, rank))
+        file, rank = file + step[0], rank + step[1]
+    return squares
+
+
+def _jumps(file, rank, steps):
+    return [(file + df, rank + dr) for df, dr in steps if onBoard(file + df, rank + dr)]
+
+
+CORNER_MASK = _mask((file, rank) for rank in range(RANKS) for file in range(FILES) if isCorner(file, rank))
+BOARD_MASK = ((1 << SQUARES) - 1) ^ CORNER_MASK
+
+# Precomputed per-square tables. Corner squares have empty entries.
+_coords = [(square % FILES, square // FILES) for square in range(SQUARES)]
+RAYS = [[_mask(_ray(file, rank, step)) if onBoard(file, rank) else 0 for file, rank in _coords]
+        for step in DIRECTIONS]
+KNIGHT_ATTACKS = [_mask(_jumps(file, rank, KNIGHT_STEPS)) if onBoard(file, rank) else 0 for file, rank in _coords]
+KING_ATTACKS = [_mask(_jumps(file, rank, DIRECTIONS)) if onBoard(file, rank) else 0 for file, rank in _coords]
+# Squares attacked by a pawn of each player standing on the square
+PAWN_ATTACKS = {}
+for _player, (_df, _dr) in PAWN_DIRECTIONS.items():
+    _steps = [(_df + _dr, _dr + _df), (_df - _dr, _dr - _df)]  # Forward step plus or minus one sideways step
+    PAWN_ATTACKS[_player] = [_mask(_jumps(file, rank, _steps)) if onBoard(file, rank) else 0 for file, rank in _coords]
+# Squares from which a pawn of each player attacks the square. Pawns of opposite sides move in opposite directions.
+PAWN_ATTACKERS = {player: PAWN_ATTACKS[TEAMMATES[player]] for player in PLAYERS}
+del _coords, _player, _df, _dr, _steps
+
+
+def _firstBlockers(square, occupied, directions):
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if direction < SOUTH:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(square, occupied):
+    """Returns mask of squares attacked by a rook on square, given the mask of occupied squares."""
+    return _firstBlockers(square, occupied, ORTHOGONALS)
+
+
+def bishopAttacks(square, occupied):
+    """Returns mask of squares attacked by a bishop on square, given the mask of occupied squares."""
+    return _firstBlockers(square, occupied, DIAGONALS)
+
+
+def queenAttacks(square, occupied):
+    """Returns mask of squares attacked by a queen on square, given the mask of occupied squares."""
+    return _firstBlockers(square, occupied, range(8))
+
+
+def encodeRank(squares):
+    """Returns FEN4 row of the squares of one rank."""
+    joined = ''.join(squares)
+    row = FEN4_ROWS.get(joined)
+    if row is None:
+        row = joined
+        if ' ' in row:
+            # Empty squares are single spaces, pieces two letters, so runs of spaces are runs of empty squares
+            for spaces, digits in EMPTY_RUNS:
+                row = row.replace(spaces, digits)
+        if len(FEN4_ROWS) >= FEN4_CACHE_SIZE:
+            FEN4_ROWS.clear()
+        FEN4_ROWS[joined] = row
+    return row
+
+
+def encodeBoard(squares):
+    """Returns board field of FEN4 (without trailing space) of squares, a list indexed like Board.boardData."""
+    return '/'.join([encodeRank(squares[start:start + FILES]) for start in range(SQUARES - FILES, -1, -FILES)])
+
+
+def decodeRank(rank, row):
+    """Returns (squares, masks, key, scores) of FEN4 row at rank: the tuple of the squares of the rank, the bitboard
+    masks of its pieces per piece type (in PIECE_TYPES order) and per player (in PLAYERS order) packed into one int,
+    SQUARES bits per mask, their Zobrist key and the tuple of their piece-square scores per player. Raises ValueError
+    if the row is invalid."""
+    entry = FEN4_RANKS.get((rank, row))
+    if entry is None:
+        squares = []
+        tokens = FEN4_TOKEN.findall(row)
+        for token in tokens:
+            if token[0].isdigit():
+                squares.extend(' ' * int(token))
+            else:
+                if not onBoard(len(squares), rank):
+                    raise ValueError('Piece %r outside board in rank %r' % (token, row))
+                squares.append(token)
+        if len(squares) != FILES or sum(len(token) for token in tokens) != len(row):
+            raise ValueError('Invalid rank %r' % row)
+        masks = 0
+        key = 0
+        scores = [0] * len(PLAYERS)
+        for file, piece in enumerate(squares):
+            if piece != ' ':
+                square = file + rank * FILES
+                masks |= 1 << square + SQUARES * PIECE_TYPES.index(piece[1])
+                masks |= 1 << square + SQUARES * (len(PIECE_TYPES) + PLAYERS.index(piece[0]))
+                key ^= PIECE_KEYS[piece][square]
+                scores[PLAYERS.index(piece[0])] += PIECE_SQUARE_SCORES[piece][square]
+        entry = (tuple(squares), masks, key, tuple(scores))
+        if len(FEN4_RANKS) >= FEN4_CACHE_SIZE:
+            FEN4_RANKS.clear()
+        FEN4_RANKS[(rank, row)] = entry
+    return entry
+
+
+class BitBoard:
+    """Board representation backed by Python ints: one bitboard per piece type and per player. Also keeps a list of
+    piece names per square (same format as Board.boardData) for constant time lookup of the piece on a square, the
+    Zobrist key of the pieces and the material and piece-square score of each player (see rules.piecesquare), all
+    updated incrementally."""
+    def __init__(self):
+        self.pieces = dict.fromkeys(PIECE_TYPES, 0)
+        self.colors = dict.fromkeys(PLAYERS, 0)
+        self.occupied = 0
+        self.squares = [' '] * SQUARES
+        self.key = 0
+        self.scores = dict.fromkeys(PLAYERS, 0)
+
+    @classmethod
+    def fromBoard(cls, board):
+        """Creates bitboard from a Board (or any object with boardData list of the same layout)."""
+        bitboard = cls()
+        pieces = bitboard.pieces
+        colors = bitboard.colors
+        scores = bitboard.scores
+        occupied = 0
+        key = 0
+        for square, piece in enumerate(board.boardData):
+            if piece != ' ':
+                bit = 1 << square
+                pieces[piece[1]] |= bit
+                colors[piece[0]] |= bit
+                occupied |= bit
+                key ^= PIECE_KEYS[piece][square]
+                scores[piece[0]] += PIECE_SQUARE_SCORES[piece][square]
+        bitboard.occupied = occupied
+        bitboard.key = key
+        bitboard.squares = board.boardData[:]
+        return bitboard
+
+    @classmethod
+    def fromFen4(cls, fen4):
+        """Creates bitboard from the board field of a FEN4 string. Raises ValueError if the FEN4 is invalid."""
+        rows = fen4.split(' ', 1)[0].split('/')
+        if len(rows) != RANKS:
+            raise ValueError('FEN4 must have %d ranks: %r' % (RANKS, fen4))
+        try:
+            ranks = [decodeRank(rank, row) for rank, row in enumerate(reversed(rows))]
+        except ValueError as error:
+            raise ValueError('%s in FEN4: %r' % (error, fen4))
+        squares, masks, keys, scores = zip(*ranks)
+        masks = sum(masks)  # The ranks do not overlap, so the packed masks can be summed
+        masks = [masks >> shift & FEN4_MASK for shift in range(0, SQUARES * (len(PIECE_TYPES) + len(PLAYERS)), SQUARES)]
+        bitboard = cls.__new__(cls)
+        bitboard.pieces = dict(zip(PIECE_TYPES, masks))
+        bitboard.colors = dict(zip(PLAYERS, masks[len(PIECE_TYPES):]))
+        bitboard.occupied = masks[-4] | masks[-3] | masks[-2] | masks[-1]
+        bitboard.squares = list(chain(*squares))
+        bitboard.key = reduce(xor, keys)
+        bitboard.scores = dict(zip(PLAYERS, map(sum, zip(*scores))))
+        return bitboard
+
+    def getFen4(self):
+        """Generates board field of FEN4, formatted the same way as Board.getFen4()."""
+        return encodeBoard(self.squares) + ' '
+
+    def toBoard(self, board):
+        """Writes pieces to a Board (which must have the same dimensions)."""
+        for square, piece in enumerate(self.squares):
+            board.setData(square % FILES, square // FILES, piece)
+
+    def copy(self):
+        """Returns a copy of the bitboard."""
+        bitboard = BitBoard.__new__(BitBoard)
+        bitboard.pieces = self.pieces.copy()
+        bitboard.colors = self.colors.copy()
+        bitboard.occupied = self.occupied
+        bitboard.squares = self.squares[:]
+        bitboard.key = self.key
+        bitboard.scores = self.scores.copy()
+        return bitboard
+
+    def pieceAt(self, square):
+        """Returns piece on square, or ' ' if empty."""
+        return self.squares[square]
+
+    def setPiece(self, square, piece):
+        """Puts piece on square, replacing any piece on it."""
+        if self.squares[square] != ' ':
+            self.removePiece(square)
+        bit = 1 << square
+        self.pieces[piece[1]] |= bit
+        self.colors[piece[0]] |= bit
+        self.occupied |= bit
+        self.squares[square] = piece
+        self.key ^= PIECE_KEYS[piece][square]
+        self.scores[piece[0]] += PIECE_SQUARE_SCORES[piece][square]
+
+    def removePiece(self, square):
+        """Removes piece from square and returns it (' ' if the square was empty)."""
+        piece = self.squares[square]
+        if piece != ' ':
+            bit = 1 << square
+            self.pieces[piece[1]] ^= bit
+            self.colors[piece[0]] ^= bit
+            self.occupied ^= bit
+            self.squares[square] = ' '
+            self.key ^= PIECE_KEYS[piece][square]
+            self.scores[piece[0]] -= PIECE_SQUARE_SCORES[piece][square]
+        return piece
+
+    def movePiece(self, fromSquare, toSquare):
+        """Moves piece from fromSquare to toSquare and returns the captured piece (' ' if none)."""
+        captured = self.removePiece(toSquare)
+        self.setPiece(toSquare, self.removePiece(fromSquare))
+        return captured
+
+    def pieceMask(self, player, pieceType):
+        """Returns mask of the pieces of pieceType owned by player."""
+        return self.pieces[pieceType] & self.colors[player]
+
+    def teamMask(self, player):
+        """Returns mask of the pieces of player and his teammate."""
+        return self.colors[player] | self.colors[TEAMMATES[player]]
+
+    def enemyMask(self, player):
+        """Returns mask of the pieces of both opponents of player."""
+        return self.occupied ^ self.teamMask(player)
+
+    def emptyMask(self):
+        """Returns mask of empty playable squares."""
+        return BOARD_MASK ^ self.occupied
+
+    def attacks(self, square):
+        """Returns mask of squares attacked by the piece on square (0 if empty)."""
+        piece = self.squares[square]
+        if piece == ' ':
+            return 0
+        pieceType = piece[1]
+        if pieceType == 'P':
+            return PAWN_ATTACKS[piece[0]][square]
+        if pieceType == 'N':
+            return KNIGHT_ATTACKS[square]
+        if pieceType == 'K':
+            return KING_ATTACKS[square]
+        if pieceType == 'B':
+            return bishopAttacks(square, self.occupied)
+        if pieceType == 'R':
+            return rookAttacks(square, self.occupied)
+        return queenAttacks(square, self.occupied)
+
+    def attackersOf(self, square, players):
+        """Returns mask of the pieces of players that attack square."""
+        by = 0
+        pawns = 0
+        for player in players:
+            by |= self.colors[player]
+            pawns |= self.pieces['P'] & self.colors[player] & PAWN_ATTACKERS[player][square]
+        pieces = self.pieces
+        queens = pieces['Q']
+        attackers = pawns
+        attackers |= KNIGHT_ATTACKS[square] & pieces['N'] & by
+        attackers |= KING_ATTACKS[square] & pieces['K'] & by
+        attackers |= rookAttacks(square, self.occupied) & (pieces['R'] | queens) & by
+        attackers |= bishopAttacks(square, self.occupied) & (pieces['B'] | queens) & by
+        return attackers
+
+    def isAttacked(self, square, players):
+        """Returns True if square is attacked by any piece of players."""
+        by = 0
+        for player in players:
+            by |= self.colors[player]
+            if self.pieces['P'] & self.colors[player] & PAWN_ATTACKERS[player][square]:
+                return True
+        pieces = self.pieces
+        if KNIGHT_ATTACKS[square] & pieces['N'] & by or KING_ATTACKS[square] & pieces['K'] & by:
+            return True
+        queens = pieces['Q'] & by
+        if rookAttacks(square, self.occupied) & (pieces['R'] & by | queens):
+            return True
+        return bool(bishopAttacks(square, self.occupied) & (pieces['B'] & by | queens))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from rules.bitboard import BitBoard, encodeBoard
+
+
+class Board:
+    """The Board is the actual chess board and is the data structure shared between the View and the Algorithm."""
+    def __init__(self, files, ranks):
+        super().__init__()
+        self.files = files
+        self.ranks = ranks
+        self.boardData = []
+        self.bitboard = None  # Bitboard mirror of boardData incl. Zobrist key, kept up to date by setData()
+        self.batchDepth = 0  # Nesting depth of beginBatch() calls
+        self.batchChanges = {}  # Squares (file, rank) changed during the batch, in order (values unused)
+        self.batchReset = False  # True if the whole board changed during the batch
+        self.initBoard()
+
+    def boardResetEvent(self):
+        """Called after the whole board has changed. Does nothing by default; adapters override it to notify."""
+        pass
+
+    def dataChangedEvent(self, file, rank):
+        """Called after square (file, rank) has changed. Does nothing by default; adapters override it to notify."""
+        pass
+
+    def boardDiffEvent(self, squares):
+        """Called at the end of a batch with the list of squares (file, rank) that changed. Does nothing by default;
+        adapters override it to notify."""
+        pass
+
+    def beginBatch(self):
+        """Starts collecting square changes instead of notifying each of them. Batches can be nested."""
+        self.batchDepth += 1
+
+    def endBatch(self):
+        """Ends batch. The outermost batch notifies once: boardResetEvent() if the whole board changed, otherwise
+        boardDiffEvent() with the changed squares, if any."""
+        self.batchDepth -= 1
+        if self.batchDepth:
+            return
+        squares, reset = self.batchChanges, self.batchReset
+        self.batchChanges = {}
+        self.batchReset = False
+        if reset:
+            self.boardResetEvent()
+        elif squares:
+            self.boardDiffEvent(list(squares))
+
+    @contextmanager
+    def batch(self):
+        """Context manager for beginBatch() and endBatch()."""
+        self.beginBatch()
+        try:
+            yield self
+        finally:
+            self.endBatch()
+
+    def notifyReset(self):
+        """Notifies that the whole board has changed, at the end of the batch if there is one."""
+        if self.batchDepth:
+            self.batchReset = True
+        else:
+            self.boardResetEvent()
+
+    def initBoard(self):
+        """Initializes board with empty squares."""
+        self.boardData = [' '] * self.files * self.ranks
+        self.bitboard = BitBoard()
+        self.notifyReset()
+
+    def getData(self, file, rank):
+        """Gets board data from square (file, rank)."""
+        return self.boardData[file+rank*self.files]
+
+    def setData(self, file, rank, data):
+        """Sets board data at square (file, rank) to data."""
+        index = file+rank*self.files
+        if self.boardData[index] == data:
+            return
+        self.boardData[index] = data
+        if data == ' ':
+            self.bitboard.removePiece(index)
+        else:
+            self.bitboard.setPiece(index, data)
+        if self.batchDepth:
+            self.batchChanges[(file, rank)] = None
+        else:
+            self.dataChangedEvent(file, rank)
+
+    def setBitBoard(self, bitboard):
+        """Sets the whole board from bitboard, which is taken over (not copied). Notifies once."""
+        self.bitboard = bitboard
+        self.boardData = bitboard.squares[:]
+        self.notifyReset()
+
+    def movePiece(self, fromFile, fromRank, toFile, toRank):
+        """Moves piece from square (fromFile, fromRank) to square (toFile, toRank)."""
+        self.setData(toFile, toRank, self.getData(fromFile, fromRank))
+        self.setData(fromFile, fromRank, ' ')
+
+    def setFen4(self, fen4):
+        """Sets board position according to the board field of FEN4 string fen4, or clears the board if it is invalid.
+        Notifies once, with boardResetEvent()."""
+        try:
+            bitboard = BitBoard.fromFen4(fen4)
+        except ValueError:
+            self.initBoard()
+            return
+        self.setBitBoard(bitboard)
+
+    def getFen4(self):
+        """Generates board field of FEN4 from current board state, with a trailing space."""
+        return encodeBoard(self.boardData) + ' '
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import sqlite3
+from rules.algorithm import Algorithm
+from rules.movegen import Position
+
+COLORS = {'r': 'red', 'b': 'blue', 'y': 'yellow', 'g': 'green'}
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    event TEXT, site TEXT, date TEXT,
+    red TEXT, blue TEXT, yellow TEXT, green TEXT,
+    redElo INTEGER, blueElo INTEGER, yellowElo INTEGER, greenElo INTEGER,
+    result TEXT, plyCount INTEGER, currentPosition TEXT,
+    startPosition TEXT, finalPosition TEXT,
+    tags TEXT,  -- All tags as JSON object
+    moves TEXT,  -- Main line in coordinate notation, separated by spaces
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS positions (
+    key INTEGER NOT NULL,  -- Zobrist key of the position before the move of ply (signed 64-bit)
+    game INTEGER NOT NULL,
+    ply INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS explorer (
+    key INTEGER NOT NULL,  -- Zobrist key of the position (signed 64-bit)
+    move TEXT NOT NULL,  -- Continuation in coordinate notation
+    games INTEGER NOT NULL,
+    team1Wins INTEGER NOT NULL,  -- 1-0 (Red and Yellow win)
+    team2Wins INTEGER NOT NULL,  -- 0-1 (Blue and Green win)
+    draws INTEGER NOT NULL,
+    ratingSum INTEGER NOT NULL,  -- Sum of the average player ratings of the rated games
+    ratedGames INTEGER NOT NULL,
+    PRIMARY KEY (key, move)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imports (
+    source TEXT NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL,
+    PRIMARY KEY (source, start, end)
+);
+'''
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS positionsKey ON positions (key);
+CREATE INDEX IF NOT EXISTS gamesRed ON games (red);
+CREATE INDEX IF NOT EXISTS gamesBlue ON games (blue);
+CREATE INDEX IF NOT EXISTS gamesYellow ON games (yellow);
+CREATE INDEX IF NOT EXISTS gamesGreen ON games (green);
+'''
+
+
+EXPLORER_UPSERT = '''
+INSERT INTO explorer VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (key, move) DO UPDATE SET games = games + 1, team1Wins = team1Wins + excluded.team1Wins,
+    team2Wins = team2Wins + excluded.team2Wins, draws = draws + excluded.draws,
+    ratingSum = ratingSum + excluded.ratingSum, ratedGames = ratedGames + excluded.ratedGames
+'''
+
+
+def signedKey(key):
+    """Returns 64-bit Zobrist key as signed int, as SQLite stores signed 64-bit integers."""
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def positionKeys(startFen4, moves):
+    """Returns Zobrist keys of the start position and of the position after each move (in coordinate notation)."""
+    position = Position.fromFen4(startFen4)
+    keys = [position.key()]
+    for name in moves:
+        move = position.findMoveName(name)
+        if move is None:
+            break
+        position.push(move)
+        keys.append(position.key())
+    return keys
+
+
+def colorColumn(color):
+    """Returns games column of color given as 'y', 'Yellow', 'yellow' or Algorithm.Yellow."""
+    column = COLORS.get(color[0].lower())
+    if column is None:
+        raise ValueError('Unknown color: %r' % color)
+    return column
+
+
+def rating(value):
+    """Returns rating tag as int, or None if unknown."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GameDatabase:
+    """Game store in an SQLite file. Holds the game headers, the main line and an index from the Zobrist key of every
+    position reached to game and ply, so that games can be looked up by position or player. The explorer table
+    aggregates the results of the continuations of every position; it is updated as games are added."""
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA + INDEXES)
+
+    def close(self):
+        self.connection.close()
+
+    def beginBulkImport(self):
+        """Drops the position index and relaxes syncing for a faster import. Call endBulkImport() afterwards; if the
+        import is interrupted, the index is rebuilt when the database is opened again."""
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('DROP INDEX IF EXISTS positionsKey')
+
+    def endBulkImport(self):
+        """Rebuilds the indexes after beginBulkImport()."""
+        self.connection.executescript(INDEXES)
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+
+    def importedRanges(self, source):
+        """Returns list of the byte ranges (start, end) of source imported before."""
+        cursor = self.connection.execute('SELECT start, end FROM imports WHERE source = ? ORDER BY start', (source,))
+        return cursor.fetchall()
+
+    def addGames(self, records, source=None, start=None, end=None):
+        """Adds normalized games (see tools.pgn4import.normalize()) in one transaction. If source is given, the byte
+        range [start, end) of source is marked as imported in the same transaction. Returns list of game ids."""
+        with self.connection:
+            ids = [self._insert(record) for record in records]
+            if source is not None:
+                self.connection.execute('INSERT OR IGNORE INTO imports VALUES (?, ?, ?)', (source, start, end))
+        return ids
+
+    def addGame(self, record):
+        """Adds a normalized game. Returns its id."""
+        return self.addGames([record])[0]
+
+    def _insert(self, record):
+        """Inserts game and its positions. Must be called inside a transaction."""
+        tags = record['tags']
+        startPosition = record.get('startFen4') or tags.get('StartFen4') or tags.get('FEN4') or \
+            Algorithm.StartingPosition
+        keys = record.get('keys')
+        if keys is None:
+            keys = positionKeys(startPosition, record['moves'])
+        try:
+            plyCount = int(tags.get('PlyCount'))
+        except (TypeError, ValueError):
+            plyCount = len(record['moves'])
+        cursor = self.connection.execute(
+            'INSERT INTO games (event, site, date, red, blue, yellow, green, redElo, blueElo, yellowElo, greenElo, '
+            'result, plyCount, currentPosition, startPosition, finalPosition, tags, moves, error) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (tags.get('Event'), tags.get('Site'), tags.get('Date'), tags.get('Red'), tags.get('Blue'),
+             tags.get('Yellow'), tags.get('Green'), rating(tags.get('RedElo')), rating(tags.get('BlueElo')),
+             rating(tags.get('YellowElo')), rating(tags.get('GreenElo')), record['result'], plyCount,
+             tags.get('CurrentPosition'), startPosition, record['fen4'], json.dumps(tags), ' '.join(record['moves']),
+             record['error']))
+        game = cursor.lastrowid
+        self.connection.executemany('INSERT INTO positions VALUES (?, ?, ?)',
+                                    [(signedKey(key), game, ply) for ply, key in enumerate(keys)])
+        self._explore(keys, record['moves'], record['result'], tags)
+        return game
+
+    def _explore(self, keys, moves, result, tags):
+        """Adds game to the explorer table. Must be called inside a transaction."""
+        team1Wins, team2Wins, draws = (result == Algorithm.Team1Wins, result == Algorithm.Team2Wins,
+                                       result == Algorithm.Draw)
+        ratings = [rating(tags.get(color.capitalize() + 'Elo')) for color in COLORS.values()]
+        ratings = [value for value in ratings if value is not None]
+        ratingSum, rated = (sum(ratings) // len(ratings), 1) if ratings else (0, 0)
+        rows = set()  # A game counts once per continuation, also if a position is repeated
+        for key, move in zip(keys, moves):
+            rows.add((signedKey(key), move))
+        self.connection.executemany(EXPLORER_UPSERT, [(key, move, team1Wins, team2Wins, draws, ratingSum, rated)
+                                                      for key, move in rows])
+
+    def rebuildExplorer(self):
+        """Recomputes the explorer table from the games, e.g. for a database created before the table existed."""
+        with self.connection:
+            self.connection.execute('DELETE FROM explorer')
+            # Games are read one at a time from a cursor of their own, so that memory use does not grow with the
+            # database
+            games = self.connection.cursor()
+            for startPosition, moves, result, tags in games.execute(
+                    'SELECT startPosition, moves, result, tags FROM games'):
+                moves = moves.split()
+                self._explore(positionKeys(startPosition, moves), moves, result, json.loads(tags))
+
+    def count(self):
+        """Returns number of games."""
+        return self.connection.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def getGame(self, game):
+        """Returns game as dict with id, tags, result, moves (list in coordinate notation), start and final FEN4 and
+        error, or None if there is no such game."""
+        row = self.connection.execute('SELECT id, tags, result, moves, startPosition, finalPosition, error '
+                                      'FROM games WHERE id = ?', (game,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'tags': json.loads(row[1]), 'result': row[2], 'moves': row[3].split(),
+                'startFen4': row[4], 'fen4': row[5], 'error': row[6]}
+
+    def findPosition(self, fen4, limit=None):
+        """Returns list of (game id, ply) of the games that reached the position of fen4 (pieces, player to move,
+        castling and en passant), with the first ply at which each game reached it."""
+        key = signedKey(Position.fromFen4(fen4).key())
+        return self.findKey(key, limit)
+
+    def findKey(self, key, limit=None):
+        """Same as findPosition(), with the signed Zobrist key of the position."""
+        return self.connection.execute('SELECT game, MIN(ply) FROM positions WHERE key = ? GROUP BY game '
+                                       'ORDER BY game LIMIT ?', (key, -1 if limit is None else limit)).fetchall()
+
+    def explore(self, fen4):
+        """Returns the continuations of the position of fen4 in the games, see exploreKey()."""
+        return self.exploreKey(signedKey(Position.fromFen4(fen4).key()))
+
+    def exploreKey(self, key):
+        """Returns list of dicts with move (coordinate notation), games, team1Wins, team2Wins, draws and
+        averageRating (None if no game was rated) of the continuations of the position with signed Zobrist key, most
+        played first."""
+        cursor = self.connection.execute('SELECT move, games, team1Wins, team2Wins, draws, ratingSum, ratedGames '
+                                         'FROM explorer WHERE key = ? ORDER BY games DESC, move', (key,))
+        return [{'move': move, 'games': games, 'team1Wins': team1Wins, 'team2Wins': team2Wins, 'draws': draws,
+                 'averageRating': ratingSum // ratedGames if ratedGames else None}
+                for move, games, team1Wins, team2Wins, draws, ratingSum, ratedGames in cursor]
+
+    def findPlayer(self, name, color=None, limit=None):
+        """Returns list of ids of the games of player name, as color if given (e.g. 'Yellow' or 'y')."""
+        columns = [colorColumn(color)] if color else list(COLORS.values())
+        query = ' UNION '.join('SELECT id FROM games WHERE %s = ?' % column for column in columns)
+        cursor = self.connection.execute(query + ' ORDER BY id LIMIT ?',
+                                         [name] * len(columns) + [-1 if limit is None else limit])
+        return [row[0] for row in cursor]
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import sys
+from rules.protocol import STOPPED, EngineClient
+
+REFERENCE_ENGINE = [sys.executable, '-m', 'tools.engine']  # Command of the bundled engine, run from the project root
+ENGINE_TIMEOUT = 10.0  # Seconds an engine may take to start or to answer isready, and to send bestmove after movetime
+
+
+class EngineError(Exception):
+    """Raised if an engine does not start, exits or stops responding."""
+    pass
+
+
+class AsyncEngine(EngineClient):
+    """Engine subprocess driven with asyncio. The lines the engine prints are read by a task of their own, so that
+    info lines are streamed to the onInfo callback of search() while the caller's event loop keeps running."""
+    def __init__(self, command=REFERENCE_ENGINE, timeout=ENGINE_TIMEOUT):
+        super().__init__()
+        self.command = command
+        self.timeout = timeout
+        self.process = None
+        self.reader = None
+        self.waiters = {}  # Event name ('handshake', 'ready' or 'bestmove') -> future of the reply
+        self.onInfo = None
+
+    @property
+    def alive(self):
+        """True if the engine process is running and has not been told to quit."""
+        return self.process is not None and self.process.returncode is None and self.state != STOPPED
+
+    def writeEvent(self, line):
+        """Overrides EngineClient writeEvent() method."""
+        if self.alive or line == 'quit':
+            self.process.stdin.write((line + '\n').encode())
+
+    def handshakeEvent(self):
+        """Overrides EngineClient handshakeEvent() method."""
+        self.resolve('handshake', True)
+
+    def readyEvent(self):
+        """Overrides EngineClient readyEvent() method."""
+        self.resolve('ready', True)
+
+    def infoEvent(self, info):
+        """Overrides EngineClient infoEvent() method. Info lines of searches that were given up are not passed on."""
+        if self.onInfo and self.pendingSearches <= 1:
+            self.onInfo(info)
+
+    def bestMoveEvent(self, move):
+        """Overrides EngineClient bestMoveEvent() method. Only the best move of the last search is a reply; those of
+        searches that were given up (see search()) arrive before it and are dropped."""
+        if not self.pendingSearches:
+            self.resolve('bestmove', move)
+
+    def resolve(self, name, value):
+        """Sets the result of the future waiting for the reply name, if any."""
+        future = self.waiters.pop(name, None)
+        if future and not future.done():
+            future.set_result(value)
+
+    async def reply(self, name, timeout):
+        """Waits for the reply name. Raises EngineError if it does not arrive within timeout seconds (None for no
+        limit) or the engine exits."""
+        future = asyncio.get_event_loop().create_future()
+        self.waiters[name] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise EngineError('%s: no %s within %s seconds' % (self.engineName or self.command[0], name, timeout))
+        finally:
+            self.waiters.pop(name, None)
+
+    async def readLines(self):
+        """Feeds the lines the engine prints to lineReceived() until it exits, then fails the waiting calls."""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+            self.lineReceived(line.decode(errors='replace'))
+        self.state = STOPPED
+        for future in self.waiters.values():
+            if not future.done():
+                future.set_exception(EngineError('%s exited' % (self.engineName or self.command[0])))
+
+    async def launch(self):
+        """Starts the engine process and the protocol. Raises EngineError if the engine cannot be started or does not
+        complete the handshake in time."""
+        try:
+            self.process = await asyncio.create_subprocess_exec(*self.command, stdin=asyncio.subprocess.PIPE,
+                                                                stdout=asyncio.subprocess.PIPE)
+        except OSError as error:
+            raise EngineError('Cannot start %s: %s' % (self.command[0], error))
+        self.reader = asyncio.ensure_future(self.readLines())
+        self.start()
+        try:
+            await self.reply('handshake', self.timeout)
+        except EngineError:
+            await self.close()
+            raise
+
+    async def isReady(self):
+        """Health check: returns True if the engine answers isready in time."""
+        if not self.alive:
+            return False
+        self.ping()
+        try:
+            return await self.reply('ready', self.timeout)
+        except EngineError:
+            return False
+
+    async def search(self, fen4, moves=(), onInfo=None, **limits):
+        """Searches the position of fen4 after moves in coordinate notation (see EngineClient.go() for the limits)
+        and returns the best move, None if there is no legal move. Info lines are passed to onInfo as dicts, see
+        rules.protocol.parseInfo(). Raises EngineError if the engine exits or exceeds movetime by more than the
+        timeout."""
+        if not self.alive:
+            raise EngineError('%s is not running' % (self.engineName or self.command[0]))
+        self.onInfo = onInfo
+        timeout = limits['movetime'] / 1000 + self.timeout if limits.get('movetime') else None
+        self.go(fen4, moves, **limits)
+        try:
+            return await self.reply('bestmove', timeout)
+        except (EngineError, asyncio.CancelledError):
+            self.stop()  # The engine answers with a best move, which the next search drops
+            raise
+        finally:
+            self.onInfo = None
+
+    async def close(self):
+        """Tells the engine to quit and waits until it has exited; it is killed if it does not exit in time."""
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.quit()
+                self.process.stdin.close()
+                await asyncio.wait_for(self.process.wait(), self.timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.process.kill()
+                await self.process.wait()
+        self.state = STOPPED
+        if self.reader:
+            await self.reader
+
+
+class EngineManager:
+    """Pool of engine processes of one command, e.g. to analyze or play several games at the same time. Engines are
+    launched concurrently by start(). acquire() hands out an idle engine after a health check, and engines that
+    exited or stopped responding are replaced by new processes. options (name -> value) are set on every engine
+    launched."""
+    def __init__(self, command=REFERENCE_ENGINE, size=1, options=None, timeout=ENGINE_TIMEOUT):
+        self.command = command
+        self.size = size
+        self.options = options or {}
+        self.timeout = timeout
+        self.engines = []
+        self.idle = None  # Queue of the engines not in use
+        self.restarts = 0
+
+    async def launch(self):
+        """Returns a new engine process with the options set."""
+        engine = AsyncEngine(self.command, self.timeout)
+        await engine.launch()
+        for name, value in self.options.items():
+            engine.setOption(name, value)
+        return engine
+
+    async def start(self):
+        """Launches the engines."""
+        self.idle = asyncio.Queue()
+        self.engines = list(await asyncio.gather(*(self.launch() for _ in range(self.size))))
+        for engine in self.engines:
+            self.idle.put_nowait(engine)
+
+    async def replace(self, engine):
+        """Closes engine and returns a new process in its place."""
+        await engine.close()
+        self.restarts += 1
+        newEngine = await self.launch()
+        self.engines[self.engines.index(engine)] = newEngine
+        return newEngine
+
+    async def acquire(self):
+        """Waits for an idle engine and returns it, replaced by a new process if it fails the health check."""
+        engine = await self.idle.get()
+        try:
+            if not await engine.isReady():
+                engine = await self.replace(engine)
+        except EngineError:
+            self.idle.put_nowait(engine)  # Tried again by the next call
+            raise
+        return engine
+
+    def release(self, engine):
+        """Returns engine to the pool."""
+        self.idle.put_nowait(engine)
+
+    async def search(self, fen4, moves=(), onInfo=None, **limits):
+        """Searches with an idle engine, see AsyncEngine.search(). An engine that fails is replaced by the next
+        acquire()."""
+        engine = await self.acquire()
+        try:
+            return await engine.search(fen4, moves, onInfo, **limits)
+        finally:
+            self.release(engine)
+
+    async def healthCheck(self):
+        """Checks the idle engines and replaces those not responding. Returns the number replaced."""
+        engines = [self.idle.get_nowait() for _ in range(self.idle.qsize())]
+        results = await asyncio.gather(*(engine.isReady() for engine in engines))
+        replaced = 0
+        for engine, ready in zip(engines, results):
+            if not ready:
+                engine = await self.replace(engine)
+                replaced += 1
+            self.idle.put_nowait(engine)
+        return replaced
+
+    async def close(self):
+        """Closes all engines."""
+        await asyncio.gather(*(engine.close() for engine in self.engines))
+        self.engines = []
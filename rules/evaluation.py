@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from rules.bitboard import (DIRECTIONS, FILES, KING_ATTACKS, KNIGHT_ATTACKS, KNIGHT_STEPS, PLAYERS, RANKS,
+                            SQUARES, TEAMMATES, bishopAttacks, isCorner, iterBits, queenAttacks, rookAttacks)
+from rules.movegen import OPPONENTS
+try:
+    import numpy
+except ImportError:
+    numpy = None  # evaluateBatch() falls back to evaluating one board at a time
+
+MOBILITY_WEIGHTS = {'N': 4, 'B': 3, 'R': 2, 'Q': 1}  # Per attacked square not occupied by the piece's team
+# Steps (file, rank) and maximum number of steps of the attacks of each piece type with mobility
+PIECE_STEPS = {'N': (KNIGHT_STEPS, 1), 'B': ([step for step in DIRECTIONS if all(step)], RANKS - 1),
+               'R': ([step for step in DIRECTIONS if not all(step)], RANKS - 1), 'Q': (DIRECTIONS, RANKS - 1)}
+SHIELD_WEIGHT = 10  # Per own pawn next to the king
+KING_ATTACK_WEIGHT = 8  # Per attack of an opponent's knight, bishop, rook or queen on a square next to the king
+ATTACKS = {'N': lambda square, occupied: KNIGHT_ATTACKS[square], 'B': bishopAttacks, 'R': rookAttacks,
+           'Q': queenAttacks}
+
+
+def popCount(mask):
+    """Returns number of set bits of mask."""
+    return bin(mask).count('1')
+
+
+def playerScores(board):
+    """Returns list of the scores of the players (in PLAYERS order) on board, a BitBoard, in centipawns: material and
+    piece-square scores (kept up to date by the board as pieces move), mobility of knights, bishops, rooks and queens,
+    and king safety (pawn shield and attacks next to the king)."""
+    pieces = board.pieces
+    colors = board.colors
+    occupied = board.occupied
+    scores = [board.scores[player] for player in PLAYERS]
+    kings = [pieces['K'] & colors[player] for player in PLAYERS]
+    zones = [KING_ATTACKS[king.bit_length() - 1] if king else 0 for king in kings]
+    for index, player in enumerate(PLAYERS):
+        own = colors[player]
+        scores[index] += SHIELD_WEIGHT * popCount(zones[index] & pieces['P'] & own)
+        targets = ~(own | colors[TEAMMATES[player]])
+        left, right = (index + 1) % 4, (index + 3) % 4  # Opponents
+        opponentZones = zones[left] | zones[right]
+        for pieceType, weight in MOBILITY_WEIGHTS.items():
+            attacksOf = ATTACKS[pieceType]
+            for square in iterBits(pieces[pieceType] & own):
+                attacks = attacksOf(square, occupied)
+                scores[index] += weight * popCount(attacks & targets)
+                if attacks & opponentZones:
+                    scores[left] -= KING_ATTACK_WEIGHT * popCount(attacks & zones[left])
+                    scores[right] -= KING_ATTACK_WEIGHT * popCount(attacks & zones[right])
+    return scores
+
+
+def materialScore(position):
+    """Returns material and piece-square score of position for the team of the player to move, in centipawns. Takes
+    constant time, since the board keeps the scores up to date."""
+    scores = position.board.scores
+    player = position.player
+    left, right = OPPONENTS[player]
+    return scores[player] + scores[TEAMMATES[player]] - scores[left] - scores[right]
+
+
+def evaluate(position):
+    """Returns static score of position for the team of the player to move, in centipawns."""
+    scores = playerScores(position.board)
+    index = PLAYERS.index(position.player)
+    return scores[index] + scores[index ^ 2] - scores[index ^ 1] - scores[index ^ 3]
+
+
+def evaluateAll(position):
+    """Returns tuple of the static scores of position per player (in PLAYERS order), for max-n search. A player
+    values the score of its team against the opponents', and its own pieces above its teammate's."""
+    scores = playerScores(position.board)
+    team = scores[0] + scores[2] - scores[1] - scores[3]
+    return tuple((team if index & 1 == 0 else -team) + (scores[index] - scores[index ^ 2]) // 2 for index in range(4))
+
+
+# Padded grid of the batch evaluator: the board with a border of RANKS - 1 squares, so that a ray never steps beyond it
+PADDED = FILES + 2 * (RANKS - 1)
+_tables = None  # NumPy tables of evaluateBatch(), created on first use
+
+
+def _batchTables():
+    global _tables
+    if _tables is None:
+        paddedSquares = numpy.full(PADDED * PADDED, -1)
+        for square in range(SQUARES):
+            file, rank = square % FILES, square // FILES
+            if not isCorner(file, rank):
+                paddedSquares[(rank + RANKS - 1) * PADDED + file + RANKS - 1] = square
+        kingZones = numpy.zeros((SQUARES + 1, SQUARES), bool)  # King square -> zone; the last row is for no king
+        for square, mask in enumerate(KING_ATTACKS):
+            kingZones[square, list(iterBits(mask))] = True
+        _tables = (paddedSquares, kingZones)
+    return _tables
+
+
+def evaluateBatch(boards):
+    """Returns the playerScores() of each of boards (a sequence of BitBoards), computed for all boards at once with
+    NumPy: a (len(boards), 4) int array, or a list of lists without NumPy. For the team score of the player to move,
+    combine the scores as evaluate() does."""
+    if numpy is None:
+        return [playerScores(board) for board in boards]
+    paddedSquares, kingZones = _batchTables()
+    count = len(boards)
+    players = len(PLAYERS)
+    if not count:
+        return numpy.zeros((0, players), numpy.int64)
+
+    # Rows of 0/1 per square unpacked from the bitboards: pawns, knights, bishops, rooks, queens, the pieces of each
+    # player and the pieces of each team
+    size = (SQUARES + 7) // 8
+    data = []
+    kings = []
+    scores = []
+    for board in boards:
+        pieces, colors = board.pieces, board.colors
+        red, blue, yellow, green = colors['r'], colors['b'], colors['y'], colors['g']
+        for mask in (pieces['P'], pieces['N'], pieces['B'], pieces['R'], pieces['Q'], red, blue, yellow, green,
+                     red | yellow, blue | green):
+            data.append(mask.to_bytes(size, 'little'))
+        kings.extend((pieces['K'] & colors[player]).bit_length() - 1 for player in PLAYERS)
+        scores.append([board.scores[player] for player in PLAYERS])
+    bits = numpy.unpackbits(numpy.frombuffer(b''.join(data), numpy.uint8).reshape(count, 11, size), axis=2,
+                            bitorder='little')[..., :SQUARES].astype(bool)
+    pawns, mobile, colors, teams = bits[:, 0], bits[:, 1:5], bits[:, 5:9], bits[:, 9:]
+
+    # Material and piece-square scores, kept up to date by the boards
+    scores = numpy.array(scores, numpy.int64)
+
+    # King zones and pawn shields
+    zones = kingZones[numpy.array(kings)].reshape(count, players, SQUARES)
+    scores += SHIELD_WEIGHT * (zones & colors & pawns[:, None]).sum(axis=2)
+    zones = zones.reshape(-1)  # Indexed by (board * 4 + player) * SQUARES + square
+
+    # Attacks of the knights, bishops, rooks and queens of all boards at once. Pieces are followed on the padded grid
+    # as (board * 4 + player, padded square); the rays of sliders until they leave the board or hit a piece.
+    teams = numpy.where(teams[:, 0], 0, numpy.where(teams[:, 1], 1, -1)).reshape(-1)  # Board * SQUARES + square
+    keys = []  # Board * 4 + player of each score term
+    terms = []  # Mobility score or king attack penalty
+
+    def attack(key, padded, weight):
+        """Scores the attacks of pieces (key, padded square) on the squares padded, where they are on the board.
+        Returns key, padded square, weight and team of the piece on the attacked square (-1 if empty) of those."""
+        target = paddedSquares[padded]
+        inside = target >= 0
+        key, padded, weight, target = key[inside], padded[inside], weight[inside], target[inside]
+        occupant = teams[(key >> 2) * SQUARES + target]
+        keys.extend((key, key ^ 1, key ^ 3))  # The player and his opponents
+        terms.extend((weight * (occupant != key & 1), -KING_ATTACK_WEIGHT * zones[(key ^ 1) * SQUARES + target],
+                      -KING_ATTACK_WEIGHT * zones[(key ^ 3) * SQUARES + target]))
+        return key, padded, weight, occupant
+
+    board, types, square = numpy.nonzero(mobile)
+    key = board * 4 + colors[board, :, square].argmax(axis=1)
+    padded = (square // FILES + RANKS - 1) * PADDED + square % FILES + RANKS - 1
+    weight = numpy.array([MOBILITY_WEIGHTS[pieceType] for pieceType in 'NBRQ'])[types]
+    rays = []
+    for index, pieceType in enumerate('NBRQ'):
+        selected = types == index
+        steps, length = PIECE_STEPS[pieceType]
+        steps = numpy.array([rankStep * PADDED + fileStep for fileStep, rankStep in steps])
+        rays.append((numpy.repeat(key[selected], len(steps)), numpy.repeat(padded[selected], len(steps)),
+                     numpy.repeat(weight[selected], len(steps)), numpy.tile(steps, selected.sum())))
+    attack(rays[0][0], rays[0][1] + rays[0][3], rays[0][2])  # Knights jump once
+    key, padded, weight, step = (numpy.concatenate(column) for column in zip(*rays[1:]))
+    while len(key):
+        ray = paddedSquares[padded + step] >= 0
+        step = step[ray]
+        key, padded, weight, occupant = attack(key[ray], padded[ray] + step, weight[ray])
+        empty = occupant < 0
+        key, padded, weight, step = key[empty], padded[empty], weight[empty], step[empty]
+    counts = numpy.bincount(numpy.concatenate(keys), numpy.concatenate(terms), count * players)
+    return scores + counts.astype(numpy.int64).reshape(count, players)  # The counts are small integers, thus exact
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+from rules.algorithm import Algorithm, teamsResult
+from rules.bitboard import FILES, PLAYERS, parseSquare
+from rules.movegen import SQUARE_NAMES, Position
+
+# Messages are JSON objects, one per line over TCP or one per text frame over WebSocket. Clients send:
+#   {"type": "join", "game": <id>, "seat": "r"|"b"|"y"|"g"}   seat optional (first free); unknown games are created
+#   {"type": "move", "game": <id>, "move": "h2h4"}            move in coordinate notation, by the seat to move
+#   {"type": "leave", "game": <id>}
+#   {"type": "watch", "game": <id>}                         spectate a game
+#   {"type": "unwatch", "game": <id>}
+#   {"type": "stats"}
+# The server answers with "state" (to the joining client), "joined", "move" and "left" broadcasts to the seats of
+# the game, "stats" and "error" messages. Spectators get a "snapshot" (FEN4) when they start watching and every
+# SNAPSHOT_INTERVAL plies, and a "delta" for every other move: the move, the squares it changed with their new
+# content ('' for empty), the next player and the result. A late joiner gets the last snapshot and the deltas since.
+MAX_LINE = 1 << 12  # Longest message accepted
+MAX_BUFFER = 1 << 20  # Bytes queued for a client that does not read; it is disconnected beyond that
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+SNAPSHOT_INTERVAL = 40  # Plies between the FEN4 snapshots sent to spectators
+
+
+class ProtocolError(ValueError):
+    """Raised for messages that cannot be carried out; sent back to the client as error message."""
+    pass
+
+
+def encodeMessage(message):
+    """Returns message as JSON line."""
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+def websocketFrame(data):
+    """Returns WebSocket text frame with data (a JSON line) as payload, without the line break."""
+    data = data.rstrip(b'\n')
+    length = len(data)
+    if length < 126:
+        header = struct.pack('!BB', 0x81, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x81, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x81, 127, length)
+    return header + data
+
+
+class Packet:
+    """A message encoded once for any number of recipients: as JSON line and, when first needed, as WebSocket
+    frame."""
+    __slots__ = ('line', 'frame')
+
+    def __init__(self, message):
+        self.line = encodeMessage(message)
+        self.frame = None
+
+    def websocketFrame(self):
+        """Returns the message as WebSocket frame."""
+        if self.frame is None:
+            self.frame = websocketFrame(self.line)
+        return self.frame
+
+
+class ServerGame:
+    """A game hosted by the GameServer. The rules state is a Position, without board widgets or move tree, so that a
+    game takes a few kilobytes. Moves are only accepted from the seat of the current player, once all four seats are
+    taken."""
+    def __init__(self, gameId, fen4=Algorithm.StartingPosition):
+        self.gameId = gameId
+        self.startPosition = fen4
+        self.position = Position.fromFen4(fen4)
+        self.currentPlayer = self.position.player
+        self.moves = []  # Moves in coordinate notation
+        self.result = teamsResult(self.position)
+        self.seats = dict.fromkeys(PLAYERS)  # Player -> connection
+        self.spectators = None  # SpectatorChannel, while the game is watched
+
+    def setCurrentPlayer(self, value):
+        """Updates current player."""
+        self.currentPlayer = value
+
+    def connections(self):
+        """Returns set of the connections in the seats."""
+        return {connection for connection in self.seats.values() if connection is not None}
+
+    def state(self):
+        """Returns the state message sent to joining clients."""
+        return {'type': 'state', 'game': self.gameId, 'fen4': self.position.getFen4(),
+                'startPosition': self.startPosition, 'moves': self.moves, 'player': self.currentPlayer,
+                'result': self.result, 'seats': [player for player in PLAYERS if self.seats[player] is not None]}
+
+    def play(self, player, name):
+        """Plays move name for player and publishes it to the spectators. Raises ProtocolError if the game is not
+        running, it is not the turn of player or the move is illegal."""
+        if self.result != Algorithm.NoResult:
+            raise ProtocolError('Game is over')
+        if None in self.seats.values():
+            raise ProtocolError('Waiting for players')
+        if player != self.currentPlayer:
+            raise ProtocolError('Not your turn')
+        try:
+            move = self.position.findMoveName(name)
+        except ValueError:
+            move = None
+        if move is None:
+            raise ProtocolError('Illegal move: %s' % name)
+        changed = self.position.changedSquares(move)
+        self.position.push(move)
+        self.moves.append(name)
+        self.result = teamsResult(self.position)
+        self.setCurrentPlayer(self.position.player)
+        if self.spectators:
+            self.spectators.publish(self, name, changed)
+
+    def watch(self, connection):
+        """Adds connection to the spectators."""
+        if self.spectators is None:
+            self.spectators = SpectatorChannel(self)
+        self.spectators.subscribe(connection)
+
+    def unwatch(self, connection):
+        """Removes connection from the spectators."""
+        if self.spectators:
+            self.spectators.unsubscribe(connection)
+            if not self.spectators.subscribers:
+                self.spectators = None
+
+
+class SpectatorChannel:
+    """Fan-out of the moves of a game to its spectators. Each move is encoded once, as a delta of the squares it
+    changed, and the same bytes are sent to every subscriber, so a move costs one serialization plus one write per
+    subscriber however many watch. Every snapshotInterval plies a FEN4 snapshot is sent as well. Subscribers joining
+    late get the last snapshot and the deltas since, which are kept encoded."""
+    def __init__(self, game, snapshotInterval=SNAPSHOT_INTERVAL):
+        self.gameId = game.gameId
+        self.snapshotInterval = snapshotInterval
+        self.subscribers = set()
+        self.snapshot = self.snapshotPacket(game)
+        self.deltas = []  # Packets of the moves since the snapshot
+
+    @staticmethod
+    def snapshotPacket(game):
+        """Returns the snapshot of game."""
+        return Packet({'type': 'snapshot', 'game': game.gameId, 'ply': len(game.moves),
+                       'fen4': game.position.getFen4(), 'result': game.result})
+
+    def subscribe(self, connection):
+        """Adds connection and brings it up to date."""
+        connection.send(self.snapshot)
+        for packet in self.deltas:
+            connection.send(packet)
+        self.subscribers.add(connection)
+        connection.watching.add(self.gameId)
+
+    def unsubscribe(self, connection):
+        """Removes connection."""
+        self.subscribers.discard(connection)
+        connection.watching.discard(self.gameId)
+
+    def publish(self, game, name, changed):
+        """Sends the last move of game, name in coordinate notation, with the changed squares."""
+        squares = game.position.board.squares
+        packet = Packet({'type': 'delta', 'game': self.gameId, 'ply': len(game.moves), 'move': name,
+                         'squares': [[SQUARE_NAMES[square], squares[square].strip()] for square in changed],
+                         'next': game.currentPlayer, 'result': game.result})
+        self.deltas.append(packet)
+        self.send(packet)
+        if len(game.moves) % self.snapshotInterval == 0:
+            self.snapshot = self.snapshotPacket(game)
+            self.deltas = []
+            self.send(self.snapshot)
+
+    def send(self, packet):
+        """Sends packet to all subscribers."""
+        for connection in list(self.subscribers):
+            connection.send(packet)
+
+
+def applySpectatorMessage(board, message):
+    """Applies spectator message (decoded) to Board board: a snapshot sets the whole board, a delta only the squares
+    it changed, in one batch so that views redraw just those. Returns True if the message was applied."""
+    kind = message.get('type')
+    if kind == 'snapshot':
+        board.setFen4(message['fen4'])
+    elif kind == 'delta':
+        with board.batch():
+            for name, piece in message['squares']:
+                square = parseSquare(name)
+                board.setData(square % FILES, square // FILES, piece or ' ')
+    else:
+        return False
+    return True
+
+
+class Connection:
+    """A client of the GameServer. Transports override send() and close()."""
+    def __init__(self):
+        self.seats = {}  # Game -> set of players
+        self.watching = set()  # Ids of the games watched
+
+    def send(self, packet):
+        """Sends Packet."""
+        pass
+
+    def close(self):
+        """Closes the connection."""
+        pass
+
+
+class GameServer:
+    """Hosts many concurrent Teams games in one process, independent of the transport: clients are Connections,
+    whose messages are passed to handle(). Replies and broadcasts are encoded once and sent with Connection.send().
+    Games are created when the first client joins and dropped when the last one leaves."""
+    def __init__(self):
+        self.games = {}  # Game id -> ServerGame
+        self.moves = 0  # Moves played since the start
+        self.clients = 0  # Number of connections
+
+    def connect(self, connection):
+        """Registers a new connection."""
+        self.clients += 1
+
+    def disconnect(self, connection):
+        """Removes connection from all its seats and spectators."""
+        self.clients -= 1
+        for game in list(connection.seats):
+            self.leave(connection, game)
+        for gameId in list(connection.watching):
+            self.unwatch(connection, gameId)
+
+    def handle(self, connection, message):
+        """Carries out message of connection. Errors are sent back to the connection."""
+        try:
+            if not isinstance(message, dict):
+                raise ProtocolError('Message must be an object')
+            kind = message.get('type')
+            if kind == 'move':
+                self.move(connection, self.game(connection, message), str(message.get('move')))
+            elif kind == 'join':
+                if message.get('game') is None:
+                    raise ProtocolError('Game id missing')
+                self.join(connection, str(message['game']), message.get('seat'))
+            elif kind == 'leave':
+                self.leave(connection, self.game(connection, message))
+            elif kind == 'watch':
+                self.watch(connection, str(message.get('game')))
+            elif kind == 'unwatch':
+                self.unwatch(connection, str(message.get('game')))
+            elif kind == 'stats':
+                connection.send(Packet(self.stats()))
+            else:
+                raise ProtocolError('Unknown message type: %s' % kind)
+        except ProtocolError as error:
+            connection.send(Packet({'type': 'error', 'message': str(error)}))
+
+    def game(self, connection, message):
+        """Returns the game of message, which connection must have joined."""
+        game = self.games.get(str(message.get('game')))
+        if game is None or game not in connection.seats:
+            raise ProtocolError('Not in game: %s' % message.get('game'))
+        return game
+
+    def broadcast(self, game, message):
+        """Sends message to all connections in the seats of game."""
+        packet = Packet(message)
+        for connection in game.connections():
+            connection.send(packet)
+
+    def join(self, connection, gameId, seat=None):
+        """Seats connection in game gameId, in seat or the first free seat. The seat is checked before the game is
+        created, so that invalid requests do not leave empty games behind."""
+        if seat is not None and seat not in tuple(PLAYERS):
+            raise ProtocolError('Invalid seat: %s' % seat)
+        game = self.games.get(gameId)
+        if game is None:
+            game = self.games[gameId] = ServerGame(gameId)
+        if seat is None:
+            seat = next((player for player in PLAYERS if game.seats[player] is None), None)
+            if seat is None:
+                raise ProtocolError('Game is full')
+        elif game.seats[seat] is not None:
+            raise ProtocolError('Seat not available: %s' % seat)
+        game.seats[seat] = connection
+        connection.seats.setdefault(game, set()).add(seat)
+        connection.send(Packet(game.state()))
+        self.broadcast(game, {'type': 'joined', 'game': gameId, 'seat': seat})
+
+    def move(self, connection, game, name):
+        """Plays move name in game for connection, which must hold the seat of the current player, and broadcasts
+        it."""
+        player = game.currentPlayer
+        if player not in connection.seats[game]:
+            raise ProtocolError('Not your turn')
+        game.play(player, name)
+        self.moves += 1
+        self.broadcast(game, {'type': 'move', 'game': game.gameId, 'ply': len(game.moves), 'player': player,
+                              'move': name, 'next': game.currentPlayer, 'result': game.result})
+
+    def leave(self, connection, game):
+        """Removes connection from its seats in game. Games without players are dropped."""
+        for seat in connection.seats.pop(game, ()):
+            game.seats[seat] = None
+            self.broadcast(game, {'type': 'left', 'game': game.gameId, 'seat': seat})
+        if not game.connections() and not game.spectators:
+            self.games.pop(game.gameId, None)
+
+    def watch(self, connection, gameId):
+        """Adds connection to the spectators of game gameId."""
+        game = self.games.get(gameId)
+        if game is None:
+            raise ProtocolError('No such game: %s' % gameId)
+        game.watch(connection)
+
+    def unwatch(self, connection, gameId):
+        """Removes connection from the spectators of game gameId. Games without players and spectators are
+        dropped."""
+        game = self.games.get(gameId)
+        if game is None or gameId not in connection.watching:
+            return
+        game.unwatch(connection)
+        if not game.connections() and not game.spectators:
+            self.games.pop(gameId, None)
+
+    def stats(self):
+        """Returns stats message: games, clients, moves played and CPU time of the server process."""
+        return {'type': 'stats', 'games': len(self.games), 'clients': self.clients, 'moves': self.moves,
+                'cpuSeconds': time.process_time()}
+
+
+class StreamConnection(Connection):
+    """Connection of a TCP client: JSON messages, one per line."""
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def send(self, packet):
+        """Overrides Connection send() method."""
+        self.write(packet.line)
+
+    def write(self, data):
+        """Writes data. Clients that fall too far behind are disconnected."""
+        if self.writer.transport.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.close()
+            return
+        self.writer.write(data)
+
+    def close(self):
+        """Overrides Connection close() method."""
+        self.writer.close()
+
+    async def messages(self, reader):
+        """Yields the messages received, until the client disconnects. Invalid JSON is answered with an error."""
+        while True:
+            try:
+                line = await reader.readline()
+            except (ValueError, ConnectionError):
+                return  # Line too long or connection reset
+            if not line:
+                return
+            if line.strip():
+                yield self.decode(line)
+
+    def decode(self, data):
+        """Returns message decoded from JSON, or None if it is invalid (an error is sent)."""
+        try:
+            return json.loads(data.decode())
+        except ValueError:
+            self.send(Packet({'type': 'error', 'message': 'Invalid JSON'}))
+            return None
+
+
+class WebSocketConnection(StreamConnection):
+    """Connection of a WebSocket client (RFC 6455): JSON messages, one per text frame. Only unfragmented frames are
+    supported, which is what browsers send for short messages."""
+    def send(self, packet):
+        """Overrides StreamConnection send() method. Sends the packet as text frame."""
+        self.write(packet.websocketFrame())
+
+    async def handshake(self, reader):
+        """Reads the HTTP upgrade request and accepts it. Returns False if it is not a WebSocket request."""
+        headers = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, ConnectionError):
+            return False
+        key = headers.get('sec-websocket-key')
+        if not key:
+            self.writer.write(b'HTTP/1.1 400 Bad Request\r\n\r\n')
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                           'Sec-WebSocket-Accept: %s\r\n\r\n' % accept).encode())
+        return True
+
+    async def messages(self, reader):
+        """Overrides StreamConnection messages() method. Answers pings and ends at a close frame."""
+        if not await self.handshake(reader):
+            return
+        while True:
+            try:
+                first, second = await reader.readexactly(2)
+                length = second & 0x7f
+                if length == 126:
+                    length, = struct.unpack('!H', await reader.readexactly(2))
+                elif length == 127:
+                    length, = struct.unpack('!Q', await reader.readexactly(8))
+                if length > MAX_LINE:
+                    return
+                mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+                payload = bytes(byte ^ mask[index & 3] for index, byte in enumerate(await reader.readexactly(length)))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            opcode = first & 0x0f
+            if opcode == 0x8:
+                return
+            if opcode == 0x9:
+                self.write(struct.pack('!BB', 0x8a, len(payload)) + payload)  # Pong
+            elif opcode == 0x1:
+                yield self.decode(payload)
+
+
+async def serve(gameServer, connection, reader):
+    """Passes the messages of connection to gameServer until the client disconnects."""
+    gameServer.connect(connection)
+    try:
+        async for message in connection.messages(reader):
+            if message is not None:
+                gameServer.handle(connection, message)
+    finally:
+        gameServer.disconnect(connection)
+        connection.close()
+
+
+async def startServer(gameServer, host='127.0.0.1', port=4444, websocketPort=None):
+    """Starts listening for TCP clients on port and, if given, WebSocket clients on websocketPort. Returns the list
+    of asyncio servers."""
+    async def tcpClient(reader, writer):
+        await serve(gameServer, StreamConnection(writer), reader)
+
+    async def websocketClient(reader, writer):
+        await serve(gameServer, WebSocketConnection(writer), reader)
+
+    servers = [await asyncio.start_server(tcpClient, host, port, limit=MAX_LINE)]
+    if websocketPort is not None:
+        servers.append(await asyncio.start_server(websocketClient, host, websocketPort, limit=MAX_LINE))
+    return servers
@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from rules.zobrist import stateKey
+from rules.bitboard import BitBoard, FILES, PLAYERS, PIECE_TYPES, TEAMMATES, PAWN_DIRECTIONS, BOARD_MASK, \
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, PAWN_ATTACKERS, RANKS, SQUARES, onBoard, squareIndex, squareName, \
+    parseSquare, iterBits, rookAttacks, bishopAttacks, queenAttacks, encodeBoard, encodeRank
+
+# Move flags. A move is a tuple (fromSquare, toSquare, flag, promotion), where promotion is the piece type a pawn
+# promotes to ('' if none). A castling move goes from the king square to the square of the castling rook, the same as
+# clicking the king and then the rook in the GUI.
+NORMAL, DOUBLE_PUSH, EN_PASSANT, CASTLING = range(4)
+PROMOTION_TYPES = 'QRBN'
+OPPONENTS = {'r': 'bg', 'b': 'ry', 'y': 'bg', 'g': 'ry'}
+NEXT_PLAYER = {'r': 'b', 'b': 'y', 'y': 'g', 'g': 'r'}
+
+# Teams: pawns promote on the 11th rank as seen from the owner's side
+PROMOTION_MASK = {}
+PAWN_START_MASK = {}
+# Single and double step targets of pawns per player and square (-1 if not possible)
+PAWN_PUSHES = {}
+PAWN_DOUBLE_PUSHES = {}
+for _player, (_df, _dr) in PAWN_DIRECTIONS.items():
+    PROMOTION_MASK[_player] = 0
+    PAWN_START_MASK[_player] = 0
+    PAWN_PUSHES[_player] = [-1] * FILES * FILES
+    PAWN_DOUBLE_PUSHES[_player] = [-1] * FILES * FILES
+    for _rank in range(FILES):
+        for _file in range(FILES):
+            if not onBoard(_file, _rank):
+                continue
+            _square = squareIndex(_file, _rank)
+            # Distance from the owner's side of the board, i.e. 0 for the back rank
+            _progress = {(0, 1): _rank, (0, -1): 13 - _rank, (1, 0): _file, (-1, 0): 13 - _file}[(_df, _dr)]
+            if _progress == 10:
+                PROMOTION_MASK[_player] |= 1 << _square
+            if onBoard(_file + _df, _rank + _dr):
+                PAWN_PUSHES[_player][_square] = squareIndex(_file + _df, _rank + _dr)
+                if _progress == 1 and onBoard(_file + 2 * _df, _rank + 2 * _dr):
+                    PAWN_START_MASK[_player] |= 1 << _square
+                    PAWN_DOUBLE_PUSHES[_player][_square] = squareIndex(_file + 2 * _df, _rank + 2 * _dr)
+del _player, _df, _dr, _rank, _file, _square, _progress
+
+# Castling rights are bits of an int: bit 2 * player index for kingside ('K'), the next bit for queenside ('Q').
+# Each right corresponds to (king square, rook square, king target, rook target, squares between king and rook,
+# squares the king passes through) of the starting position.
+CASTLING_RIGHTS = {}
+
+
+def _castling(king, rook):
+    kingFile, kingRank = king % FILES, king // FILES
+    rookFile, rookRank = rook % FILES, rook // FILES
+    distance = abs(rookFile - kingFile) + abs(rookRank - kingRank)
+    step = (rook - king) // distance
+    kingTo = rook - step * (distance - 2)
+    rookTo = king + step
+    between = [king + step * i for i in range(1, distance)]
+    path = [king + step * i for i in range(1, abs(kingTo - king) // abs(step) + 1)]
+    return king, rook, kingTo, rookTo, between, path
+
+
+for _index, (_player, _king, _kingside, _queenside) in enumerate([('r', 'h1', 'k1', 'd1'), ('b', 'a8', 'a11', 'a4'),
+                                                                   ('y', 'g14', 'd14', 'k14'),
+                                                                   ('g', 'n7', 'n4', 'n11')]):
+    CASTLING_RIGHTS[_player + 'K'] = (1 << 2 * _index, _castling(parseSquare(_king), parseSquare(_kingside)))
+    CASTLING_RIGHTS[_player + 'Q'] = (2 << 2 * _index, _castling(parseSquare(_king), parseSquare(_queenside)))
+del _index, _player, _king, _kingside, _queenside
+ALL_CASTLING = 0xff
+# Castling rights that are lost if a piece moves from or to the square
+CASTLING_LOSS = [0] * FILES * FILES
+for _bit, (_king, _rook, _kingTo, _rookTo, _between, _path) in CASTLING_RIGHTS.values():
+    CASTLING_LOSS[_king] |= _bit
+    CASTLING_LOSS[_rook] |= _bit
+del _bit, _king, _rook, _kingTo, _rookTo, _between, _path
+# Castling moves by (king square, rook square)
+CASTLING_MOVES = {(right[1][0], right[1][1]): right for right in CASTLING_RIGHTS.values()}
+
+
+def castlingToString(castling):
+    """Returns castling availability as FEN4 field, e.g. 'rKrQbKbQyKyQgKgQ', or '-' if no player can castle."""
+    return CASTLING_FIELDS[castling]
+
+
+def castlingFromString(field):
+    """Returns castling rights int from FEN4 castling field. Raises ValueError if the field is invalid."""
+    castling = CASTLING_VALUES.get(field)
+    if castling is None:
+        # Not in the usual order
+        castling = 0
+        names = [field[index:index + 2] for index in range(0, len(field), 2)]
+        for name in names:
+            if name not in CASTLING_RIGHTS or CASTLING_RIGHTS[name][0] & castling:
+                raise ValueError('Invalid castling availability: %r' % field)
+            castling |= CASTLING_RIGHTS[name][0]
+    return castling
+
+
+CASTLING_FIELDS = [''.join(name for name, (bit, _) in CASTLING_RIGHTS.items() if castling & bit) or '-'
+                   for castling in range(ALL_CASTLING + 1)]
+CASTLING_VALUES = {field: castling for castling, field in enumerate(CASTLING_FIELDS)}
+
+
+def enPassantOwner(target):
+    """Returns player whose pawn can be captured en passant on target square, based on its location."""
+    file, rank = target % FILES, target // FILES
+    if rank == 2:
+        return 'r'
+    if rank == 11:
+        return 'y'
+    if file == 2:
+        return 'b'
+    if file == 11:
+        return 'g'
+    return None
+
+
+# Memo tables of the en passant field, there are few distinct values
+EN_PASSANT_FIELDS = {}  # En passant tuple -> FEN4 field
+EN_PASSANT_VALUES = {}  # FEN4 field -> en passant tuple
+
+
+def enPassantToString(enPassant):
+    """Returns en passant target squares as FEN4 field, e.g. 'h3,b7', or '-' if there are none."""
+    field = EN_PASSANT_FIELDS.get(enPassant)
+    if field is None:
+        field = ','.join(squareName(entry[0]) for entry in enPassant if entry) or '-'
+        EN_PASSANT_FIELDS[enPassant] = field
+    return field
+
+
+def enPassantFromString(field):
+    """Returns en passant tuple (one (target, pawn square) entry or None per player) from FEN4 en passant field.
+    Raises ValueError if the field is invalid."""
+    enPassant = EN_PASSANT_VALUES.get(field)
+    if enPassant is None:
+        enPassant = [None] * 4
+        if field and field != '-':
+            for name in field.split(','):
+                try:
+                    target = parseSquare(name)
+                except (ValueError, IndexError):
+                    raise ValueError('Invalid en passant target square: %r' % name)
+                player = enPassantOwner(target)
+                if player is None or not onBoard(target % FILES, target // FILES):
+                    raise ValueError('Invalid en passant target square: %r' % name)
+                df, dr = PAWN_DIRECTIONS[player]
+                enPassant[PLAYERS.index(player)] = (target, target + df + dr * FILES)
+        enPassant = tuple(enPassant)
+        EN_PASSANT_VALUES[field] = enPassant
+    return enPassant
+
+
+FEN4_PLAYERS = tuple(PLAYERS)
+
+
+def formatFen4(board, player, castling, enPassant, ply):
+    """Returns FEN4 string from board field (without trailing space), player, castling rights, en passant targets and
+    quarter-move number."""
+    return '%s %s %s %s %d %d' % (board, player, CASTLING_FIELDS[castling], enPassantToString(enPassant), ply,
+                                  ply // 4 + 1)
+
+
+def moveName(move):
+    """Returns move in coordinate notation, e.g. 'h2h4', 'h1k1' (castling, king to rook) or 'e10e11Q' (promotion)."""
+    return squareName(move[0]) + squareName(move[1]) + move[3]
+
+
+MOVE_NAME = re.compile(r'([a-n])(\d{1,2})([a-n])(\d{1,2})([QRBN]?)$')
+
+
+def parseMoveName(name):
+    """Returns (fromSquare, toSquare, promotion) from move in coordinate notation. Raises ValueError if invalid."""
+    match = MOVE_NAME.match(name)
+    if not match:
+        raise ValueError('Invalid move: %r' % name)
+    fromFile, fromRank, toFile, toRank, promotion = match.groups()
+    return parseSquare(fromFile + fromRank), parseSquare(toFile + toRank), promotion
+
+
+# Compact move encoding, used by the move tree: an int with the from square in bits 0-7, the to square in bits 8-15,
+# the moved piece in bits 16-20, the captured piece in bits 21-25 (for en passant the captured pawn), the flag in bits
+# 26-27 and the promotion in bits 28-30. Pieces are indices into PIECES, where 0 is the empty square. No move encodes
+# to 0, as square 0 is a corner.
+PIECES = [' '] + [player + pieceType for player in PLAYERS for pieceType in PIECE_TYPES]
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+PROMOTIONS = [''] + list(PROMOTION_TYPES)
+SQUARE_NAMES = [squareName(square) for square in range(FILES * FILES)]
+
+
+def encodeMove(fromSquare, toSquare, piece, captured=' ', flag=NORMAL, promotion=''):
+    """Returns compact move code."""
+    return (fromSquare | toSquare << 8 | PIECE_CODES[piece] << 16 | PIECE_CODES[captured] << 21 | flag << 26 |
+            PROMOTIONS.index(promotion) << 28)
+
+
+def decodeMove(code):
+    """Returns (fromSquare, toSquare, piece, captured, flag, promotion) of compact move code."""
+    return (code & 0xff, code >> 8 & 0xff, PIECES[code >> 16 & 0x1f], PIECES[code >> 21 & 0x1f], code >> 26 & 3,
+            PROMOTIONS[code >> 28 & 7])
+
+
+def moveFromCode(code):
+    """Returns move tuple (fromSquare, toSquare, flag, promotion) of compact move code."""
+    return code & 0xff, code >> 8 & 0xff, code >> 26 & 3, PROMOTIONS[code >> 28 & 7]
+
+
+def moveCodeToString(code):
+    """Returns compact move code as move string, i.e. '<piece> <from> <captured piece> <to>[=<promotion>]'."""
+    fromSquare, toSquare, piece, captured, flag, promotion = decodeMove(code)
+    return (piece + ' ' + SQUARE_NAMES[fromSquare] + ' ' + captured * (captured != ' ') + ' ' + SQUARE_NAMES[toSquare] +
+            ('=' + promotion if promotion else ''))
+
+
+def moveCodeFromString(moveString):
+    """Returns compact move code of move string. The move string does not tell en passant captures and double pawn
+    pushes apart from other moves, so these get flag NORMAL."""
+    fields = moveString.split()
+    piece = fields[0]
+    captured = fields[2] if len(fields) == 4 else ' '
+    toSquare, _, promotion = fields[-1].partition('=')
+    flag = CASTLING if piece[1] == 'K' and captured == piece[0] + 'R' else NORMAL
+    return encodeMove(parseSquare(fields[1]), parseSquare(toSquare), piece, captured, flag, promotion)
+
+
+def moveCodeToAlgebraic(code):
+    """Returns compact move code in algebraic notation, e.g. 'h3', 'exf11=Q', 'Nxc3' or 'O-O'."""
+    fromSquare, toSquare, piece, captured, flag, promotion = decodeMove(code)
+    if flag == CASTLING:
+        distance = abs(toSquare % FILES - fromSquare % FILES) + abs(toSquare // FILES - fromSquare // FILES)
+        return 'O-O' if distance == 3 else 'O-O-O'
+    if piece[1] == 'P':
+        text = SQUARE_NAMES[fromSquare][0] + 'x' + SQUARE_NAMES[toSquare] if captured != ' ' else SQUARE_NAMES[toSquare]
+        return text + ('=' + promotion if promotion else '')
+    return piece[1] + 'x' * (captured != ' ') + SQUARE_NAMES[toSquare]
+
+
+class Position:
+    """Lightweight game state for move generation: bitboard, player to move, castling rights and en passant targets.
+    Moves are made and unmade in place with push() and pop()."""
+    def __init__(self, board=None, player='r', castling=ALL_CASTLING, enPassant=(None, None, None, None), ply=0):
+        self.board = board if board is not None else BitBoard()
+        self.player = player
+        self.castling = castling
+        self.enPassant = enPassant
+        self.ply = ply
+        self.stack = []
+
+    @classmethod
+    def fromFen4(cls, fen4):
+        """Creates position from FEN4 string (board, player, castling, en passant, quarter-move and full move fields;
+        all but the board are optional). Raises ValueError if the FEN4 is invalid."""
+        fields = fen4.split()
+        board = BitBoard.fromFen4(fen4)
+        player = fields[1] if len(fields) > 1 else 'r'
+        if player not in FEN4_PLAYERS:
+            raise ValueError('Invalid player in FEN4: %r' % fen4)
+        try:
+            castling = castlingFromString(fields[2]) if len(fields) > 2 else 0
+            enPassant = enPassantFromString(fields[3]) if len(fields) > 3 else (None, None, None, None)
+        except ValueError as error:
+            raise ValueError('%s in FEN4: %r' % (error, fen4))
+        if not all(field.isdigit() for field in fields[4:6]) or fields[5:6] == ['0'] or len(fields) > 6:
+            raise ValueError('Invalid move numbers in FEN4: %r' % fen4)
+        ply = int(fields[4]) if len(fields) > 4 else 0
+        return cls(board, player, castling, enPassant, ply)
+
+    def getFen4(self):
+        """Generates FEN4 from the position, in the same field order as Algorithm.getBoardState()."""
+        return formatFen4(encodeBoard(self.board.squares), self.player, self.castling, self.enPassant, self.ply)
+
+    def copy(self):
+        """Returns a copy of the position without move history."""
+        return Position(self.board.copy(), self.player, self.castling, self.enPassant, self.ply)
+
+    def key(self):
+        """Returns 64-bit Zobrist key of the position (pieces, player to move, castling and en passant)."""
+        return self.board.key ^ stateKey(self.player, self.castling, self.enPassant)
+
+    def findMoveName(self, name):
+        """Returns the legal move in coordinate notation (see moveName()), or None if it is not legal."""
+        fromSquare, toSquare, promotion = parseMoveName(name)
+        return self.findMove(fromSquare, toSquare, promotion or 'Q')
+
+    def kingSquare(self, player):
+        """Returns square of the king of player, or -1 if player has no king."""
+        kings = self.board.pieces['K'] & self.board.colors[player]
+        return kings.bit_length() - 1
+
+    def inCheck(self, player=None):
+        """Returns True if the king of player (default: player to move) is attacked by an opponent."""
+        player = player or self.player
+        king = self.kingSquare(player)
+        return king >= 0 and self.board.isAttacked(king, OPPONENTS[player])
+
+    def pseudoLegalMoves(self, fromMask=BOARD_MASK):
+        """Returns list of moves of the player to move, without checking if the own king is left in check. Only moves
+        of pieces on the squares in fromMask are generated."""
+        board = self.board
+        player = self.player
+        pieces = board.pieces
+        team = board.colors[player] | board.colors[TEAMMATES[player]]
+        own = board.colors[player] & fromMask
+        enemy = board.occupied ^ team
+        occupied = board.occupied
+        targets = BOARD_MASK & ~team
+        moves = []
+        append = moves.append
+
+        # Pawns
+        pushes = PAWN_PUSHES[player]
+        doublePushes = PAWN_DOUBLE_PUSHES[player]
+        promotion = PROMOTION_MASK[player]
+        attacks = PAWN_ATTACKS[player]
+        for square in iterBits(pieces['P'] & own):
+            to = pushes[square]
+            toMask = enemy & attacks[square]
+            if to >= 0 and not occupied >> to & 1:
+                toMask |= 1 << to
+                to = doublePushes[square]
+                if to >= 0 and not occupied >> to & 1:
+                    append((square, to, DOUBLE_PUSH, ''))
+            for to in iterBits(toMask):
+                if promotion >> to & 1:
+                    for pieceType in PROMOTION_TYPES:
+                        append((square, to, NORMAL, pieceType))
+                else:
+                    append((square, to, NORMAL, ''))
+        # En passant captures of both opponents' pawns that just made a double step
+        for opponent in OPPONENTS[player]:
+            entry = self.enPassant[PLAYERS.index(opponent)]
+            if entry:
+                target, pawn = entry
+                if not occupied >> target & 1 and board.squares[pawn] == opponent + 'P':
+                    for square in iterBits(pieces['P'] & own & PAWN_ATTACKERS[player][target]):
+                        if promotion >> target & 1:
+                            for pieceType in PROMOTION_TYPES:
+                                append((square, target, EN_PASSANT, pieceType))
+                        else:
+                            append((square, target, EN_PASSANT, ''))
+
+        # Knights, sliders and king
+        for square in iterBits(pieces['N'] & own):
+            for to in iterBits(KNIGHT_ATTACKS[square] & targets):
+                append((square, to, NORMAL, ''))
+        for square in iterBits(pieces['B'] & own):
+            for to in iterBits(bishopAttacks(square, occupied) & targets):
+                append((square, to, NORMAL, ''))
+        for square in iterBits(pieces['R'] & own):
+            for to in iterBits(rookAttacks(square, occupied) & targets):
+                append((square, to, NORMAL, ''))
+        for square in iterBits(pieces['Q'] & own):
+            for to in iterBits(queenAttacks(square, occupied) & targets):
+                append((square, to, NORMAL, ''))
+        for square in iterBits(pieces['K'] & own):
+            for to in iterBits(KING_ATTACKS[square] & targets):
+                append((square, to, NORMAL, ''))
+
+        # Castling
+        if self.castling and pieces['K'] & own:
+            opponents = OPPONENTS[player]
+            for side in 'KQ':
+                bit, (king, rook, kingTo, rookTo, between, path) = CASTLING_RIGHTS[player + side]
+                if (self.castling & bit and board.squares[king] == player + 'K' and
+                        board.squares[rook] == player + 'R' and
+                        not any(occupied >> square & 1 for square in between) and
+                        not board.isAttacked(king, opponents) and
+                        not any(board.isAttacked(square, opponents) for square in path)):
+                    append((king, rook, CASTLING, ''))
+        return moves
+
+    def legalMoves(self):
+        """Returns list of legal moves of the player to move."""
+        return [move for move in self.pseudoLegalMoves() if self.isLegal(move)]
+
+    def hasLegalMove(self):
+        """Returns True if the player to move has a legal move. Stops at the first one, so it is much faster than
+        legalMoves() if there is one."""
+        return any(self.isLegal(move) for move in self.pseudoLegalMoves())
+
+    def isLegal(self, move):
+        """Returns True if the pseudo-legal move does not leave the own king attacked by either opponent."""
+        player = self.player
+        self.push(move)
+        king = self.kingSquare(player)
+        legal = king < 0 or not self.board.isAttacked(king, OPPONENTS[player])
+        self.pop()
+        return legal
+
+    def findMove(self, fromSquare, toSquare, promotion='Q'):
+        """Returns the legal move from fromSquare to toSquare (promoting to promotion, if applicable), or None."""
+        for move in self.pseudoLegalMoves(1 << fromSquare):
+            if move[0] == fromSquare and move[1] == toSquare and (not move[3] or move[3] == promotion):
+                return move if self.isLegal(move) else None
+        return None
+
+    def inferMove(self, fromSquare, toSquare, promotion='Q'):
+        """Returns the move from fromSquare to toSquare (promoting to promotion, if applicable) with its flag inferred
+        from the pieces, without generating moves. The move is not checked; use it for moves known to be legal, e.g.
+        read back from a game archive. Returns None if fromSquare holds no piece of the player to move."""
+        squares = self.board.squares
+        player = self.player
+        piece = squares[fromSquare]
+        if piece[0] != player:
+            return None
+        if piece[1] == 'K' and squares[toSquare] == player + 'R':
+            return fromSquare, toSquare, CASTLING, ''
+        if piece[1] != 'P':
+            return fromSquare, toSquare, NORMAL, ''
+        if toSquare == PAWN_DOUBLE_PUSHES[player][fromSquare]:
+            flag = DOUBLE_PUSH
+        elif squares[toSquare] == ' ' and toSquare != PAWN_PUSHES[player][fromSquare]:
+            flag = EN_PASSANT
+        else:
+            flag = NORMAL
+        return fromSquare, toSquare, flag, promotion if PROMOTION_MASK[player] >> toSquare & 1 else ''
+
+    def changedSquares(self, move):
+        """Returns tuple of the squares whose content the pseudo-legal move changes, e.g. to send or redraw only
+        those. Must be called before the move is made."""
+        fromSquare, toSquare, flag, promotion = move
+        if flag == CASTLING:
+            return CASTLING_MOVES[(fromSquare, toSquare)][1][:4]
+        if flag == EN_PASSANT:
+            return fromSquare, toSquare, self.enPassant[PLAYERS.index(enPassantOwner(toSquare))][1]
+        return fromSquare, toSquare
+
+    def push(self, move):
+        """Makes move. The move must be pseudo-legal."""
+        fromSquare, toSquare, flag, promotion = move
+        board = self.board
+        player = self.player
+        index = PLAYERS.index(player)
+        self.stack.append((move, board.squares[toSquare], self.castling, self.enPassant))
+        enPassant = list(self.enPassant)
+        if flag == CASTLING:
+            king, rook, kingTo, rookTo, between, path = CASTLING_MOVES[(fromSquare, toSquare)][1]
+            board.removePiece(king)
+            board.removePiece(rook)
+            board.setPiece(kingTo, player + 'K')
+            board.setPiece(rookTo, player + 'R')
+        else:
+            if flag == EN_PASSANT:
+                victim = PLAYERS.index(enPassantOwner(toSquare))
+                board.removePiece(enPassant[victim][1])
+                enPassant[victim] = None
+            board.movePiece(fromSquare, toSquare)
+            if promotion:
+                board.setPiece(toSquare, player + promotion)
+        self.castling &= ~(CASTLING_LOSS[fromSquare] | CASTLING_LOSS[toSquare])
+        # A player's en passant target is only valid until his next move
+        enPassant[index] = ((fromSquare + toSquare) // 2, toSquare) if flag == DOUBLE_PUSH else None
+        self.enPassant = tuple(enPassant)
+        self.player = NEXT_PLAYER[player]
+        self.ply += 1
+
+    def pop(self):
+        """Unmakes the last move made with push()."""
+        move, captured, self.castling, self.enPassant = self.stack.pop()
+        fromSquare, toSquare, flag, promotion = move
+        board = self.board
+        self.ply -= 1
+        self.player = player = PLAYERS[(PLAYERS.index(self.player) + 3) % 4]
+        if flag == CASTLING:
+            king, rook, kingTo, rookTo, between, path = CASTLING_MOVES[(fromSquare, toSquare)][1]
+            board.removePiece(kingTo)
+            board.removePiece(rookTo)
+            board.setPiece(king, player + 'K')
+            board.setPiece(rook, player + 'R')
+            return
+        piece = board.removePiece(toSquare)
+        board.setPiece(fromSquare, player + 'P' if promotion else piece)
+        if captured != ' ':
+            board.setPiece(toSquare, captured)
+        if flag == EN_PASSANT:
+            victim = enPassantOwner(toSquare)
+            board.setPiece(self.enPassant[PLAYERS.index(victim)][1], victim + 'P')
+
+    def unmakeMove(self, code, castling, enPassant):
+        """Unmakes move given as compact move code, which need not have been made with push(). Castling rights and en
+        passant targets must be those before the move."""
+        move = moveFromCode(code)
+        captured = ' ' if move[2] == EN_PASSANT else PIECES[code >> 21 & 0x1f]
+        self.stack.append((move, captured, castling, enPassant))
+        self.pop()
+
+    def encodeMove(self, move):
+        """Returns compact move code of move (see encodeMove()), with the moved and captured pieces of the position."""
+        fromSquare, toSquare, flag, promotion = move
+        squares = self.board.squares
+        captured = enPassantOwner(toSquare) + 'P' if flag == EN_PASSANT else squares[toSquare]
+        return encodeMove(fromSquare, toSquare, squares[fromSquare], captured, flag, promotion)
+
+    def moveString(self, move):
+        """Returns move in string form, i.e. '<piece> <from> <captured piece> <to>'."""
+        return moveCodeToString(self.encodeMove(move))
+
+
+def toSan(position, move):
+    """Returns legal move of position in algebraic notation. Unlike moveCodeToAlgebraic(), the from file, rank or
+    square is added if another piece of the same type can move to the same square, e.g. 'Ndxf5', 'b11xc10' (Blue and
+    Green pawns capture along files) or 'b10c10' (a pawn push that a capture could be read as), so that the notation
+    reads back as the same move."""
+    san = moveCodeToAlgebraic(position.encodeMove(move))
+    fromSquare, toSquare, flag, promotion = move
+    if flag == CASTLING:
+        return san
+    board = position.board
+    pieceType = board.squares[fromSquare][1]
+    others = {other[0] for other in position.pseudoLegalMoves(board.pieces[pieceType] & board.colors[position.player])
+              if other[1] == toSquare and other[0] != fromSquare and other[2] != CASTLING and position.isLegal(other)}
+    if not others:
+        return san
+    name = SQUARE_NAMES[fromSquare]
+    if pieceType == 'P':
+        return name + san[1:] if san[1] == 'x' else name + san
+    if all(other % FILES != fromSquare % FILES for other in others):
+        name = name[0]
+    elif all(other // FILES != fromSquare // FILES for other in others):
+        name = name[1:]
+    return san[0] + name + san[1:]
+
+
+def fen4Sequence(position, moves):
+    """Returns list of the FEN4 of position and of the positions after each of moves, e.g. to export all positions of
+    a game. FEN4 only needs the squares and the state fields, so the moves are replayed on a plain list of squares
+    (the same way as push()), and only the ranks changed by a move are encoded again."""
+    squares = position.board.squares[:]
+    player, castling, ply = position.player, position.castling, position.ply
+    enPassant = position.enPassant
+    rows = [encodeRank(squares[start:start + FILES]) for start in range(SQUARES - FILES, -1, -FILES)]
+    fen4s = [formatFen4('/'.join(rows), player, castling, enPassant, ply)]
+    for fromSquare, toSquare, flag, promotion in moves:
+        index = PLAYERS.index(player)
+        if flag == CASTLING:
+            king, rook, kingTo, rookTo, between, path = CASTLING_MOVES[(fromSquare, toSquare)][1]
+            squares[king] = squares[rook] = ' '
+            squares[kingTo] = player + 'K'
+            squares[rookTo] = player + 'R'
+            ranks = {king // FILES, rook // FILES, kingTo // FILES, rookTo // FILES}
+        else:
+            ranks = {fromSquare // FILES, toSquare // FILES}
+            if flag == EN_PASSANT:
+                victim = PLAYERS.index(enPassantOwner(toSquare))
+                pawn = enPassant[victim][1]
+                squares[pawn] = ' '
+                ranks.add(pawn // FILES)
+                enPassant = enPassant[:victim] + (None,) + enPassant[victim + 1:]
+            squares[toSquare] = player + promotion if promotion else squares[fromSquare]
+            squares[fromSquare] = ' '
+        castling &= ~(CASTLING_LOSS[fromSquare] | CASTLING_LOSS[toSquare])
+        # A player's en passant target is only valid until his next move
+        if flag == DOUBLE_PUSH or enPassant[index]:
+            target = ((fromSquare + toSquare) // 2, toSquare) if flag == DOUBLE_PUSH else None
+            enPassant = enPassant[:index] + (target,) + enPassant[index + 1:]
+        player = NEXT_PLAYER[player]
+        ply += 1
+        for rank in ranks:
+            rows[RANKS - 1 - rank] = encodeRank(squares[rank * FILES:(rank + 1) * FILES])
+        fen4s.append('/'.join(rows) + ' ' + player + ' ' + CASTLING_FIELDS[castling] + ' ' +
+                     enPassantToString(enPassant) + ' ' + str(ply) + ' ' + str(ply // 4 + 1))
+    return fen4s
+
+
+def decodeFen4s(fen4s):
+    """Returns list of the positions of FEN4 strings. Raises ValueError if one is invalid."""
+    return [Position.fromFen4(fen4) for fen4 in fen4s]
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from rules.movegen import moveCodeToAlgebraic, moveFromCode, toSan
+
+ROW_LENGTH = 32  # Move list rows also end at plies that are multiples of ROW_LENGTH, so that appends take constant time
+
+
+def flattenTree(root):
+    """Returns the moves of the tree below root in PGN4 order as list of (moveNum, node, lineRoot, var) tuples, where
+    moveNum is the ply of the move (starting from 1), lineRoot the first node of the line the move belongs to (None for
+    the main line) and var the variation depth (0 for the main line). The first child of a node is its main line; after
+    it come its other children as variations, then the main line continues. Walks the tree once, without recursion,
+    so it takes linear time also for deeply nested variations."""
+    moves = []
+    stack = [(root, 0, None, 0)]  # (node, moveNum, lineRoot, var) of the lines still to be listed, last first
+    while stack:
+        node, moveNum, lineRoot, var = stack.pop()
+        if node is lineRoot:
+            moves.append((moveNum, node, lineRoot, var))
+        while node.children:
+            children = node.children
+            node = children[0]
+            moveNum += 1
+            moves.append((moveNum, node, lineRoot, var))
+            if len(children) > 1:
+                # Continue the line after the variations
+                stack.append((node, moveNum, lineRoot, var))
+                for child in reversed(children[1:]):
+                    stack.append((child, moveNum, child, var + 1))
+                break
+    return moves
+
+
+def formatMovetext(root, position):
+    """Returns the PGN4 movetext of the tree below root, without result; position is the position of root. Moves are
+    disambiguated where needed (see rules.movegen.toSan()). A variation starts with an opening bracket and the move
+    number with 1, 2 or 3 dots for Blue, Yellow or Green, and so does the line after a variation."""
+    position = position.copy()
+    startPly = position.ply
+    movetext = []
+    current = root  # Node of position
+    prevVar = 0
+    for moveNum, node, lineRoot, var in flattenTree(root):
+        ply = startPly + moveNum - 1
+        flag = ply % 4
+        if node.parent is current:
+            number = str(ply // 4 + 1) + '. ' if flag == 0 else ''
+        else:
+            if movetext:
+                movetext[-1] += ')' * (prevVar - var + (node is lineRoot))
+            number = str(ply // 4 + 1) + '. ' + ('.' * flag + ' ' if flag else '')
+            if node is lineRoot:
+                number = '(' + number
+            # Go back to the common ancestor, then forward to the parent of node
+            line = [node.parent]
+            while line[-1].parent is not None:
+                line.append(line[-1].parent)
+            while current not in line:
+                position.pop()
+                current = current.parent
+            for parent in reversed(line[:line.index(current)]):
+                position.push(moveFromCode(parent.move))
+            current = node.parent
+        move = moveFromCode(node.move)
+        movetext.append(number + toSan(position, move))
+        position.push(move)
+        current = node
+        prevVar = var
+    if movetext:
+        movetext[-1] += ')' * prevVar
+    return ' '.join(movetext)
+
+
+class MoveList:
+    """The move list of a move tree, as rows of consecutive moves in the order of PGN4 movetext. A row ends where a
+    move has variations; the variations follow as rows of their own (depth one higher), after which the line continues
+    in a new row. A row also ends at every ROW_LENGTH-th ply. Rows are updated incrementally as moves are added, so
+    adding a move only changes or inserts the affected rows, and appending a move to a long line re-renders a row of at
+    most ROW_LENGTH moves. The first child of a node is its main line. Moves may be annotated with analysis results (see
+    rules.analysis.Annotation), whose flag is shown after the move."""
+    class Row:
+        """A row of the move list: consecutive nodes of one line, starting at ply, with the variation depth."""
+        def __init__(self, nodes, texts, ply, depth, variation):
+            self.nodes = nodes
+            self.texts = texts  # Moves in display notation
+            self.ply = ply  # Ply of the first node, starting from 1
+            self.depth = depth
+            self.variation = variation  # True if the row starts a variation
+            self.index = 0  # Last known index in the rows, see MoveList.rowIndex()
+
+    def __init__(self, moveText=moveCodeToAlgebraic):
+        super().__init__()
+        self.moveText = moveText  # Converts compact move codes to display notation
+        self.rows = []
+        self.rowOf = {}  # Node -> Row
+        self.annotations = {}  # Node -> Annotation
+
+    # Notification hooks. They do nothing by default; the Qt model adapter overrides them.
+    def rowAboutToBeInsertedEvent(self, index):
+        """Called before a row is inserted at index."""
+        pass
+
+    def rowInsertedEvent(self, index):
+        """Called after a row has been inserted at index."""
+        pass
+
+    def rowChangedEvent(self, index):
+        """Called after the row at index has changed."""
+        pass
+
+    def aboutToResetEvent(self):
+        """Called before all rows are replaced."""
+        pass
+
+    def resetEvent(self):
+        """Called after all rows have been replaced."""
+        pass
+
+    def reset(self, root):
+        """Rebuilds the rows from the tree below root. In the flattened tree, a new row starts wherever a move does not
+        follow the previous one."""
+        self.aboutToResetEvent()
+        self.rows = []
+        self.rowOf = {}
+        self.annotations = {}
+        row = None
+        for moveNum, node, lineRoot, var in flattenTree(root):
+            if row is None or row.nodes[-1] is not node.parent or moveNum % ROW_LENGTH == 1:
+                row = self.Row([], [], moveNum, var, node is lineRoot)
+                row.index = len(self.rows)
+                self.rows.append(row)
+            row.nodes.append(node)
+            row.texts.append(self.moveText(node.move))
+            self.rowOf[node] = row
+        self.resetEvent()
+
+    def rowCount(self):
+        """Returns number of rows."""
+        return len(self.rows)
+
+    def rowIndex(self, row):
+        """Returns index of row. The last known index is checked first, which is right unless rows were inserted
+        before row since, so that appending moves to a line takes constant time."""
+        if row.index >= len(self.rows) or self.rows[row.index] is not row:
+            row.index = self.rows.index(row)
+        return row.index
+
+    def ply(self, node):
+        """Returns ply of node, starting from 1."""
+        row = self.rowOf[node]
+        return row.ply + row.nodes.index(node)
+
+    def addNode(self, node):
+        """Adds node, the last child of its parent, to the rows."""
+        parent = node.parent
+        siblings = parent.children
+        number = len(siblings) - 1
+        if number == 0:
+            if parent.parent is None:
+                # First move of the game
+                self.addRow(0, self.Row([node], [self.moveText(node.move)], 1, 0, False))
+                return
+            row = self.rowOf[parent]
+            uncles = parent.parent.children
+            if len(uncles) > 1 and uncles[0] is parent:
+                # The line continues after the variations of parent
+                index = self.skipVariations(self.rowIndex(row) + 1, row.depth)
+                self.addRow(index, self.Row([node], [self.moveText(node.move)], row.ply + len(row.nodes),
+                                            row.depth, False))
+            elif (row.ply + len(row.nodes)) % ROW_LENGTH == 1:
+                # The line continues in a row of its own
+                self.addRow(self.rowIndex(row) + 1, self.Row([node], [self.moveText(node.move)],
+                                                             row.ply + len(row.nodes), row.depth, False))
+            else:
+                row.nodes.append(node)
+                row.texts.append(self.moveText(node.move))
+                self.rowOf[node] = row
+                self.rowChangedEvent(self.rowIndex(row))
+            return
+        # New variation: the line of the first child must end at the first child
+        first = siblings[0]
+        row = self.rowOf[first]
+        index = self.rowIndex(row)
+        position = row.nodes.index(first)
+        ply = row.ply + position
+        if position + 1 < len(row.nodes):
+            tail = self.Row(row.nodes[position + 1:], row.texts[position + 1:], ply + 1, row.depth, False)
+            del row.nodes[position + 1:]
+            del row.texts[position + 1:]
+            self.rowChangedEvent(index)
+            self.addRow(index + 1, tail)
+        if number > 1:
+            index = self.rowIndex(self.rowOf[siblings[number - 1]])
+        index = self.skipVariations(index + 1, row.depth)
+        self.addRow(index, self.Row([node], [self.moveText(node.move)], ply, row.depth + 1, True))
+
+    def annotate(self, node, annotation):
+        """Sets the annotation of the move of node and updates its row. Does nothing if node is not in the move list,
+        e.g. a late result for a previous tree."""
+        if node in self.rowOf:
+            self.annotations[node] = annotation
+            self.rowChangedEvent(self.rowIndex(self.rowOf[node]))
+
+    def flag(self, node):
+        """Returns the flag of the annotation of node, e.g. '??' for a blunder, or '' if there is none."""
+        annotation = self.annotations.get(node)
+        return annotation.flag if annotation else ''
+
+    def skipVariations(self, index, depth):
+        """Returns index of the first row from index on with depth at most depth."""
+        while index < len(self.rows) and self.rows[index].depth > depth:
+            index += 1
+        return index
+
+    def addRow(self, index, row):
+        """Inserts row at index and notifies."""
+        self.rowAboutToBeInsertedEvent(index)
+        self.rows.insert(index, row)
+        row.index = index
+        for node in row.nodes:
+            self.rowOf[node] = row
+        self.rowInsertedEvent(index)
+        if index > 0:
+            self.rowChangedEvent(index - 1)  # Closing brackets may have changed
+
+    def closingBrackets(self, index):
+        """Returns number of variations that end with the row at index."""
+        nextRow = self.rows[index + 1] if index + 1 < len(self.rows) else None
+        if nextRow is None:
+            return self.rows[index].depth
+        return self.rows[index].depth - nextRow.depth + nextRow.variation
+
+    def moveNumber(self, ply, first):
+        """Returns move number prefix of the move at ply. The first move of a row always gets one, with one, two or
+        three dots for Blue, Yellow and Green."""
+        flag = (ply - 1) % 4
+        if flag == 0:
+            return str((ply - 1) // 4 + 1) + '. '
+        if first:
+            return str((ply - 1) // 4 + 1) + '. ' + '.' * flag + ' '
+        return ''
+
+    def rowMoves(self, index):
+        """Returns list of the display strings of the moves of the row at index, including move numbers, annotation
+        flags and brackets."""
+        row = self.rows[index]
+        moves = [self.moveNumber(row.ply + i, i == 0) + text + self.flag(node)
+                 for i, (node, text) in enumerate(zip(row.nodes, row.texts))]
+        if row.variation:
+            moves[0] = '(' + moves[0]
+        moves[-1] += ')' * self.closingBrackets(index)
+        return moves
+
+    def rowText(self, index):
+        """Returns the text of the row at index."""
+        return ' '.join(self.rowMoves(index))
+
+    def nodeAt(self, index, column):
+        """Returns the node of the move at character column of the text of the row at index (the last node if the
+        column is beyond the text)."""
+        row = self.rows[index]
+        end = 0
+        for node, text in zip(row.nodes, self.rowMoves(index)):
+            end += len(text) + 1
+            if column < end:
+                return node
+        return row.nodes[-1]
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from rules.algorithm import Algorithm
+from rules.bitboard import parseSquare, FILES
+from rules.movegen import Position, CASTLING, moveFromCode
+from rules.movelist import formatMovetext
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|(\d+)\.|(\.+)|([^\s(){};]+)')
+SAN = re.compile(r'([NBRQK]?)([a-n]?)(\d{0,2})([-x]?)([a-n])(\d{1,2})(?:=?([NBRQ]))?[+#]*[!?]*$')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+
+class PGN4Error(ValueError):
+    """Raised if PGN4 movetext cannot be parsed or contains an illegal move."""
+    pass
+
+
+class Game:
+    """A game read from PGN4: tags, move tree of Algorithm.Node (same as built by the GUI) and result."""
+    def __init__(self, tags, root, startPosition, result=Algorithm.NoResult, error=None):
+        self.tags = tags
+        self.root = root
+        self.startPosition = startPosition
+        self.result = result
+        self.error = error  # Error message if the movetext could only be read partly, otherwise None
+
+    def mainLine(self):
+        """Returns list of nodes of the main line (first child at every node), excluding the root."""
+        nodes = []
+        node = self.root
+        while node.children:
+            node = node.children[0]
+            nodes.append(node)
+        return nodes
+
+    def replay(self):
+        """Plays the main line from the start position. Returns (position at the end, list of moves)."""
+        position = Position.fromFen4(self.startPosition)
+        moves = []
+        for node in self.mainLine():
+            move = moveFromCode(node.move)  # Moves in the tree have been checked for legality when added
+            position.push(move)
+            moves.append(move)
+        return position, moves
+
+
+def readGames(source):
+    """Yields the games of a PGN4 file one at a time. Source is a path or a text file object. Only one game is held in
+    memory at a time, so files of any size can be read."""
+    if isinstance(source, str):
+        with open(source, encoding='utf-8-sig') as file:
+            yield from readGames(file)
+        return
+    for text in splitGames(source):
+        yield parseGame(text)
+
+
+def splitGames(lines):
+    """Yields the text of each game from an iterable of lines. A game starts at a tag line that follows movetext."""
+    game = []
+    movetext = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('['):
+            if movetext:
+                yield ''.join(game)
+                game = []
+                movetext = False
+        elif stripped:
+            movetext = True
+        game.append(line)
+    if movetext or any(line.strip() for line in game):
+        yield ''.join(game)
+
+
+def formatGame(game):
+    """Returns game as PGN4 text: all tags in their order, the movetext with the variations (see
+    rules.movelist.formatMovetext()) and the result, so that parseGame() reads back the same move tree. Comments and
+    numeric annotations are not part of a Game and are not written."""
+    lines = ['[%s "%s"]\n' % (name, value.replace('\\', '\\\\').replace('"', '\\"'))
+             for name, value in game.tags.items()]
+    movetext = formatMovetext(game.root, Position.fromFen4(game.startPosition))
+    return ''.join(lines) + '\n' + (movetext + ' ' if movetext else '') + game.result + '\n'
+
+
+def parseGame(text):
+    """Parses the text of one game (tags and movetext) into a Game. If the movetext contains an illegal or unreadable
+    move, the tree contains the moves before it and Game.error is set."""
+    tags = {}
+    movetext = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        match = TAG.match(stripped) if stripped.startswith('[') and not movetext else None
+        if match:
+            tags[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif stripped:
+            movetext.append(line)
+    startPosition = tags.get('StartFen4') or tags.get('FEN4') or Algorithm.StartingPosition
+    root = Algorithm.Node(0, [], None)
+    game = Game(tags, root, startPosition, tags.get('Result', Algorithm.NoResult))
+    try:
+        position = Position.fromFen4(startPosition)
+        root.state = (position.castling, position.enPassant)
+        result = parseMovetext('\n'.join(movetext), position, root)
+        if result:
+            game.result = result
+    except (PGN4Error, ValueError, IndexError) as error:
+        game.error = str(error)
+    return game
+
+
+def parseMovetext(movetext, position, root):
+    """Parses movetext and adds the moves to the tree below root. Position must be the position of root; it is
+    returned to that position afterwards. Variations start at the ply given by their move number and dots (one dot for
+    Blue, two for Yellow and three for Green), or replace the previous move if no move number is given. Returns the
+    result token, if any."""
+    startPly = position.ply
+    node = root
+    path = []  # Moves from root to node
+    stack = []  # (node, path) of the enclosing lines
+    branch = False  # Variation opened, but not started yet
+    moveNumber = None
+    dots = 0
+    tokens = [(match.group(0),) + match.groups() for match in TOKEN.finditer(movetext)]
+    for index, (token, number, dotTokens, san) in enumerate(tokens):
+        if number:
+            moveNumber, dots = int(number), 0
+        elif dotTokens:
+            dots += len(dotTokens)
+        elif token == '(':
+            stack.append((node, path[:]))
+            branch = True
+            moveNumber = None
+        elif token == ')':
+            if not stack:
+                raise PGN4Error('Unmatched closing bracket')
+            node, savedPath = stack.pop()
+            _goto(position, path, savedPath)
+            path = savedPath
+            branch = False
+        elif token in RESULTS:
+            _goto(position, path, [])
+            return token
+        elif san and not token.startswith('$'):
+            if branch:
+                # Go back to the parent of the first move of the variation
+                if moveNumber is not None:
+                    ply = (moveNumber - 1) * 4 + min(dots, 3) - startPly
+                else:
+                    ply = len(path) - 1
+                if not 0 <= ply <= len(path):
+                    raise PGN4Error('Variation starts outside of enclosing line: %r' % token)
+                for _ in range(len(path) - ply):
+                    node = node.parent
+                _goto(position, path, path[:ply])
+                del path[ply:]
+                branch = False
+            candidates = sanCandidates(position, san)
+            if not candidates:
+                raise PGN4Error('Illegal move %r at ply %d' % (san, position.ply + 1))
+            move = candidates[0] if len(candidates) == 1 else _disambiguate(position, candidates,
+                                                                             _upcoming(tokens, index + 1))
+            code = position.encodeMove(move)
+            position.push(move)
+            child = next((child for child in node.children if child.move == code), None)
+            if child is None:
+                child = Algorithm.Node(code, [], node)
+                child.state = (position.castling, position.enPassant)
+                node.add(child)
+            node = child
+            path.append(move)
+            moveNumber = None
+    if stack:
+        raise PGN4Error('Unmatched opening bracket')
+    _goto(position, path, [])
+    return None
+
+
+def _upcoming(tokens, index, count=32):
+    """Returns up to count moves that follow tokens[index - 1] in the same line."""
+    moves = []
+    for token, number, dotTokens, san in tokens[index:]:
+        if token in ('(', ')') or token in RESULTS or len(moves) == count:
+            break
+        if san and not token.startswith('$'):
+            moves.append(san)
+    return moves
+
+
+def _disambiguate(position, candidates, upcoming):
+    """Returns the candidate after which the upcoming moves can be played, or the first candidate. Needed because
+    Algorithm.toAlgebraic() does not disambiguate moves of two pieces of the same type to the same square."""
+    for move in candidates:
+        position.push(move)
+        playable = _playable(position, upcoming)
+        position.pop()
+        if playable:
+            return move
+    return candidates[0]
+
+
+def _playable(position, sans):
+    """Returns True if the moves in algebraic notation can be played from position, trying every reading of ambiguous
+    moves (backtracking)."""
+    if not sans:
+        return True
+    for move in sanCandidates(position, sans[0]):
+        position.push(move)
+        playable = _playable(position, sans[1:])
+        position.pop()
+        if playable:
+            return True
+    return False
+
+
+def _goto(position, path, target):
+    """Pops and pushes moves on position to go from path to target path (both lists of moves from the same root)."""
+    common = 0
+    while common < len(path) and common < len(target) and path[common] == target[common]:
+        common += 1
+    for _ in range(len(path) - common):
+        position.pop()
+    for move in target[common:]:
+        position.push(move)
+
+
+def findSan(position, san):
+    """Returns the legal move of position in algebraic notation, or None. If the notation is ambiguous, the first
+    matching move is returned."""
+    candidates = sanCandidates(position, san)
+    return candidates[0] if candidates else None
+
+
+def sanCandidates(position, san):
+    """Returns list of legal moves of position that match the move in algebraic notation. Accepts the short notation
+    written by Algorithm.toAlgebraic(), e.g. 'Qxj11', 'exf11=Q' or 'O-O', as well as long notation, e.g. 'Qh1-j11'."""
+    board = position.board
+    own = board.colors[position.player]
+    if san.startswith('O-O') or san.startswith('0-0'):
+        distance = 4 if san.startswith('O-O-O') or san.startswith('0-0-0') else 3
+        candidates = []
+        for move in position.pseudoLegalMoves(board.pieces['K'] & own):
+            if move[2] == CASTLING:
+                fromSquare, toSquare = move[0], move[1]
+                if (abs(fromSquare % FILES - toSquare % FILES) + abs(fromSquare // FILES - toSquare // FILES) ==
+                        distance and position.isLegal(move)):
+                    candidates.append(move)
+        return candidates
+    match = SAN.match(san)
+    if not match:
+        return []
+    pieceType, fromFile, fromRank, capture, toFile, toRank, promotion = match.groups()
+    toSquare = parseSquare(toFile + toRank)
+    candidates = []
+    for move in position.pseudoLegalMoves(board.pieces[pieceType or 'P'] & own):
+        fromSquare = move[0]
+        if (move[1] == toSquare and move[2] != CASTLING and
+                (not fromFile or chr(97 + fromSquare % FILES) == fromFile) and
+                (not fromRank or str(fromSquare // FILES + 1) == fromRank) and
+                (not move[3] or move[3] == (promotion or 'Q')) and position.isLegal(move)):
+            candidates.append(move)
+    return candidates
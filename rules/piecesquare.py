@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Piece values and piece-square tables in centipawns. Like the Zobrist keys, the tables have one entry per piece and
+# square, so that the board can keep the sum of the entries of its pieces up to date as pieces are set and removed.
+PIECE_VALUES = {'P': 100, 'N': 300, 'B': 400, 'R': 500, 'Q': 900, 'K': 0}
+
+
+def _orient(player, file, rank):
+    """Returns square (file, rank) as seen from the side of player: rank 0 is his back rank, and his king starts on
+    file 7."""
+    return {'r': (file, rank), 'b': (rank, file), 'y': (13 - file, 13 - rank), 'g': (13 - rank, 13 - file)}[player]
+
+
+def _bonus(pieceType, file, rank):
+    """Returns piece-square bonus of pieceType on square (file, rank) as seen from the side of its owner."""
+    edge = max(abs(2 * file - 13), abs(2 * rank - 13)) // 2  # 0 on the 4 central squares, 6 on the edges
+    if pieceType == 'P':
+        return 10 * (rank - 1) + (5 if 5 <= file <= 8 else 0)  # Pawns promote on rank 10
+    if pieceType == 'N':
+        return 30 - 10 * edge
+    if pieceType == 'B':
+        return 15 - 5 * edge
+    if pieceType == 'Q':
+        return 6 - 2 * edge
+    if pieceType == 'K':
+        return -20 * min(rank, 4)  # The king is safest behind his pawns
+    return 0
+
+
+def _corner(file, rank):
+    return (file < 3 or file > 10) and (rank < 3 or rank > 10)
+
+
+PIECE_SQUARE_SCORES = {player + pieceType: [0 if _corner(square % 14, square // 14) else
+                                            PIECE_VALUES[pieceType] +
+                                            _bonus(pieceType, *_orient(player, square % 14, square // 14))
+                                            for square in range(14 * 14)]
+                       for player in 'rbyg' for pieceType in 'PNBRQK'}
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from rules.algorithm import Algorithm
+from rules.movegen import Position
+from rules.search import MATE, MAX_DEPTH
+
+# Line-based engine protocol for four-player chess, modelled on UCI. The GUI sends:
+#   uci4                                   start; the engine answers with id and option lines, then uci4ok
+#   isready                                the engine answers readyok, also while searching (health check)
+#   setoption name <name> value <value>
+#   newgame
+#   position (startpos | fen4 <FEN4>) [moves <move> ...]
+#   go [depth <plies>] [movetime <ms>] [nodes <count>] [mode (paranoid | max-n)]   no limit: until stop
+#   stop                                   the engine answers with bestmove
+#   quit
+# The engine sends:
+#   id (name | author) <text>
+#   option name <name> type (spin | combo | check | string) [default <x>] [min <x>] [max <x>] [var <x>]...
+#   uci4ok
+#   readyok
+#   info depth <plies> score (cp <centipawns> | mate <plies>) nodes <count> time <ms> nps <count> pv <move> ...
+#   info string <text>
+#   bestmove <move>                        0000 if there is no legal move
+# Moves are in coordinate notation (see rules.movegen.moveName()), FEN4 as generated by Algorithm.getBoardState(),
+# scores from the view of the team to move (paranoid) or player to move (max-n).
+PROTOCOL = 'uci4'
+NULL_MOVE = '0000'
+STARTING, IDLE, SEARCHING, STOPPED = 'starting', 'idle', 'searching', 'stopped'  # EngineClient states
+GO_LIMITS = ('depth', 'movetime', 'nodes')
+OPTION_KEYWORDS = ('name', 'type', 'default', 'min', 'max', 'var')
+
+
+def positionCommand(fen4, moves=()):
+    """Returns the position command for the position of fen4 after moves in coordinate notation."""
+    return 'position fen4 ' + fen4 + (' moves ' + ' '.join(moves) if moves else '')
+
+
+def parsePosition(arguments):
+    """Returns the Position of the arguments of a position command, with the moves made. Raises ValueError if the
+    position or a move is invalid or illegal."""
+    tokens = arguments.split()
+    moves = []
+    if 'moves' in tokens:
+        index = tokens.index('moves')
+        tokens, moves = tokens[:index], tokens[index + 1:]
+    if tokens == ['startpos']:
+        position = Position.fromFen4(Algorithm.StartingPosition)
+    elif len(tokens) > 1 and tokens[0] == 'fen4':
+        position = Position.fromFen4(' '.join(tokens[1:]))
+    else:
+        raise ValueError('Invalid position: %r' % arguments)
+    for name in moves:
+        move = position.findMoveName(name)
+        if move is None:
+            raise ValueError('Illegal move: %r' % name)
+        position.push(move)
+    return position
+
+
+def goCommand(depth=None, movetime=None, nodes=None, mode=None):
+    """Returns the go command with the given limits (depth in plies, movetime in milliseconds, nodes) and search
+    mode. Without limits the engine searches until stopped."""
+    tokens = ['go']
+    for name, value in zip(GO_LIMITS, (depth, movetime, nodes)):
+        if value:
+            tokens += [name, str(int(value))]
+    if mode:
+        tokens += ['mode', mode]
+    return ' '.join(tokens)
+
+
+def parseGo(arguments):
+    """Returns dict of the limits and mode of the arguments of a go command. Raises ValueError if a limit is not a
+    number."""
+    tokens = arguments.split()
+    go = {}
+    for name, value in zip(tokens, tokens[1:]):
+        if name in GO_LIMITS:
+            go[name] = int(value)
+        elif name == 'mode':
+            go[name] = value
+    return go
+
+
+def infoLine(depth, score, nodes, milliseconds, pv):
+    """Returns the info line of a search iteration (see Search.infoEvent()), with the principal variation pv in
+    coordinate notation."""
+    if abs(score) >= MATE - MAX_DEPTH:
+        value = 'mate %d' % ((MATE - abs(score)) * (1 if score > 0 else -1))
+    else:
+        value = 'cp %d' % score
+    return 'info depth %d score %s nodes %d time %d nps %d pv %s' % (
+        depth, value, nodes, milliseconds, nodes * 1000 // max(milliseconds, 1), ' '.join(pv))
+
+
+def parseInfo(arguments):
+    """Returns dict of the fields of the arguments of an info line. Scores are converted to centipawns as in Search,
+    mates to MATE minus the plies to mate; the principal variation is a list of moves."""
+    tokens = arguments.split()
+    info = {}
+    index = 0
+    while index < len(tokens):
+        name = tokens[index]
+        if name == 'string':
+            info[name] = ' '.join(tokens[index + 1:])
+            break
+        if name == 'pv':
+            info[name] = tokens[index + 1:]
+            break
+        try:
+            if name == 'score' and index + 2 < len(tokens):
+                kind, value = tokens[index + 1], int(tokens[index + 2])
+                info[name] = value if kind == 'cp' else (MATE - value if value > 0 else -MATE - value)
+                index += 3
+                continue
+            if name in ('depth', 'nodes', 'time', 'nps') and index + 1 < len(tokens):
+                info[name] = int(tokens[index + 1])
+                index += 2
+                continue
+        except ValueError:
+            pass
+        index += 1  # Unknown or malformed field
+    return info
+
+
+def parseOption(arguments):
+    """Returns dict of the fields of the arguments of an option line; 'var' is a list of the choices of a combo."""
+    option = {'var': []}
+    key = None
+    for token in arguments.split():
+        if token in OPTION_KEYWORDS:
+            key = token
+            if key != 'var':
+                option[key] = ''
+            else:
+                option[key].append('')
+        elif key == 'var':
+            option[key][-1] = (option[key][-1] + ' ' + token).strip()
+        elif key:
+            option[key] = (option[key] + ' ' + token).strip()
+    return option
+
+
+class EngineClient:
+    """GUI side of the engine protocol, independent of how the engine process is run: commands are passed to
+    writeEvent(), and the transport feeds the lines the engine prints to lineReceived(), which keeps track of the
+    engine state and reports the replies through the event hooks. Transports (asyncio in rules.engines, QProcess in
+    the GUI) override writeEvent() and the hooks they need."""
+    def __init__(self):
+        super().__init__()
+        self.engineName = ''
+        self.engineAuthor = ''
+        self.options = {}  # Option name -> fields, see parseOption()
+        self.state = STARTING
+        self.pings = 0  # Number of isready commands not answered yet
+        self.pendingSearches = 0  # Number of go commands not answered with bestmove yet
+
+    # Notification hooks. They do nothing by default; the transports override them.
+    def writeEvent(self, line):
+        """Called with each command line to be sent to the engine."""
+        pass
+
+    def handshakeEvent(self):
+        """Called when the engine has sent uci4ok, i.e. its id and options."""
+        pass
+
+    def readyEvent(self):
+        """Called when the engine has answered isready."""
+        pass
+
+    def infoEvent(self, info):
+        """Called with the fields of each info line (see parseInfo())."""
+        pass
+
+    def bestMoveEvent(self, move):
+        """Called with the best move in coordinate notation when a search has ended, None if there is no legal
+        move."""
+        pass
+
+    def send(self, line):
+        """Sends command line to the engine."""
+        self.writeEvent(line)
+
+    def start(self):
+        """Starts the protocol."""
+        self.state = STARTING
+        self.pings = 0
+        self.pendingSearches = 0
+        self.send(PROTOCOL)
+
+    def ping(self):
+        """Asks the engine whether it is still responsive."""
+        self.pings += 1
+        self.send('isready')
+
+    def setOption(self, name, value):
+        """Sets engine option."""
+        self.send('setoption name %s value %s' % (name, value))
+
+    def newGame(self):
+        """Tells the engine that the next position is from another game."""
+        self.send('newgame')
+
+    def go(self, fen4, moves=(), **limits):
+        """Starts a search of the position of fen4 after moves in coordinate notation. See goCommand() for the
+        limits."""
+        self.send(positionCommand(fen4, moves))
+        self.send(goCommand(**limits))
+        self.pendingSearches += 1
+        self.state = SEARCHING
+
+    def stop(self):
+        """Stops the search; the engine answers with its best move."""
+        if self.state == SEARCHING:
+            self.send('stop')
+
+    def quit(self):
+        """Tells the engine to exit."""
+        if self.state != STOPPED:
+            self.send('quit')
+            self.state = STOPPED
+
+    def lineReceived(self, line):
+        """Handles a line the engine printed. Unknown lines are ignored."""
+        command, _, arguments = line.strip().partition(' ')
+        if command == 'info':
+            self.infoEvent(parseInfo(arguments))
+        elif command == 'bestmove':
+            move = arguments.split()[0] if arguments.split() else NULL_MOVE
+            self.pendingSearches = max(self.pendingSearches - 1, 0)
+            if self.state == SEARCHING and not self.pendingSearches:
+                self.state = IDLE  # Not if it is the best move of a search stopped for a newer one
+            self.bestMoveEvent(None if move == NULL_MOVE else move)
+        elif command == 'readyok':
+            self.pings = max(self.pings - 1, 0)
+            self.readyEvent()
+        elif command == 'id':
+            key, _, value = arguments.partition(' ')
+            if key == 'name':
+                self.engineName = value
+            elif key == 'author':
+                self.engineAuthor = value
+        elif command == 'option':
+            option = parseOption(arguments)
+            if option.get('name'):
+                self.options[option['name']] = option
+        elif command == PROTOCOL + 'ok':
+            if self.state == STARTING:
+                self.state = IDLE
+            self.handshakeEvent()
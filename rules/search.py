@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ctypes
+import multiprocessing
+import queue
+import time
+from rules.bitboard import PLAYERS, SQUARES, TEAMMATES
+from rules.evaluation import evaluate, evaluateAll, materialScore
+from rules.movegen import CASTLING, EN_PASSANT, OPPONENTS, PROMOTIONS, Position
+from rules.piecesquare import PIECE_VALUES
+
+PARANOID, MAX_N = 'paranoid', 'max-n'  # Search modes
+MATE = 100000  # Score of a mate at the root; mates found deeper score MATE - ply
+INFINITY = MATE + 1
+MAX_DEPTH = 64
+QUIESCENCE_DEPTH = 4  # Maximum plies of captures searched beyond the nominal depth
+LAZY_MARGIN = 300  # Quiescence search skips the full evaluation if the material score is this far out of the window
+EXACT, LOWER, UPPER = 0, 1, 2  # Bounds of transposition table scores
+SCORE_OFFSET = 1 << 18  # Added to scores packed into shared table entries, which are unsigned
+
+
+def scoreToString(score):
+    """Returns score in pawns with sign, e.g. '+1.25', or the plies to mate, e.g. '+#3' or '-#2'."""
+    if abs(score) >= MATE - MAX_DEPTH:
+        return '%s#%d' % ('+' if score > 0 else '-', MATE - abs(score))
+    return '%+.2f' % (score / 100)
+
+
+class SearchStopped(Exception):
+    """Raised inside the search when it is stopped or out of time."""
+    pass
+
+
+class Search:
+    """Game tree search for the Teams variant. Paranoid search treats the game as team against team (the team to
+    move maximizes, the other minimizes, i.e. negamax with alpha-beta pruning); max-n search lets every player
+    maximize its own score. Both use iterative deepening, a transposition table and move ordering (table move,
+    captures, killer moves, history), and stop at a depth or time limit or when stop() is called, e.g. from another
+    thread. Positions are searched on a copy, so the caller's position is not changed."""
+    def __init__(self, mode=PARANOID, tableSize=1 << 20):
+        super().__init__()
+        self.mode = mode
+        self.tableSize = tableSize  # Maximum number of entries; a full table is cleared
+        self.table = {}  # Position key -> (depth, bound, score, move)
+        self.history = [0] * SQUARES * SQUARES  # From square * SQUARES + to square -> cutoff count
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + QUIESCENCE_DEPTH + 1)]
+        self.nodes = 0
+        self.nodeLimit = None
+        self.deadline = None
+        self.stopped = False
+
+    # Notification hooks. They do nothing by default; the GUI adapter overrides them to emit Qt signals.
+    def infoEvent(self, depth, score, nodes, milliseconds, pv):
+        """Called after each completed iteration with the score (see search()) and principal variation (list of
+        compact move codes)."""
+        pass
+
+    def bestMoveEvent(self, code):
+        """Called when the search ends with the compact move code of the best move, or 0 if there is none."""
+        pass
+
+    def clear(self):
+        """Forgets everything learned in previous searches, e.g. for a new game."""
+        self.table = {}
+        self.history = [0] * SQUARES * SQUARES
+
+    def setMode(self, mode):
+        """Sets search mode (PARANOID or MAX_N). The transposition table is cleared if it changes, since the modes
+        store different scores."""
+        if mode != self.mode:
+            self.mode = mode
+            self.table = {}
+
+    def stop(self):
+        """Stops the search at the next check. The result of the last completed iteration is kept."""
+        self.stopped = True
+
+    def search(self, position, depth=MAX_DEPTH, timeLimit=None, nodeLimit=None):
+        """Searches position to depth plies, or until timeLimit seconds have passed or about nodeLimit nodes have been
+        searched. Returns (move, score, pv) of the deepest completed iteration. The score is that of the team to move
+        (paranoid) or of the player to move (max-n), in centipawns. The move is None if there is no legal move."""
+        position = position.copy()
+        start = time.perf_counter()
+        self.stopped = False
+        self.nodes = 0
+        self.nodeLimit = nodeLimit
+        self.deadline = start + timeLimit if timeLimit else None
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + QUIESCENCE_DEPTH + 1)]
+        self.history = [value >> 2 for value in self.history]  # Age the counts of previous searches
+        legalMoves = position.legalMoves()
+        move, score, pv = (legalMoves[0] if legalMoves else None), 0, []
+        for iteration in range(1, min(depth, MAX_DEPTH) + 1):
+            if len(legalMoves) < 2 and iteration > 1:
+                break  # Nothing to choose
+            try:
+                if self.mode == MAX_N:
+                    score = self.maxN(position, iteration, 0)[PLAYERS.index(position.player)]
+                else:
+                    score = self.alphaBeta(position, iteration, -INFINITY, INFINITY, 0)
+            except SearchStopped:
+                while position.stack:
+                    position.pop()  # Unwind the moves of the interrupted iteration
+                break
+            pv = self.principalVariation(position, iteration)
+            move = pv[0] if pv else move
+            seconds = time.perf_counter() - start
+            self.infoEvent(iteration, score, self.nodes, int(seconds * 1000),
+                           [code for code in self.pvCodes(position, pv)])
+            if abs(score) >= MATE - MAX_DEPTH:
+                break  # Forced mate found
+            if timeLimit and seconds > timeLimit / 2:
+                break  # The next iteration would not finish in time
+        self.bestMoveEvent(position.encodeMove(move) if move else 0)
+        return move, score, pv
+
+    def checkTime(self):
+        """Raises SearchStopped if the search was stopped or is out of time or nodes."""
+        if self.stopped or (self.deadline and time.perf_counter() > self.deadline):
+            raise SearchStopped
+        if self.nodeLimit and self.nodes >= self.nodeLimit:
+            raise SearchStopped
+
+    def legalChildren(self, position, moves):
+        """Yields each of the pseudo-legal moves that does not leave the own king attacked, with the move made. The
+        move is unmade when the next one is requested."""
+        player = position.player
+        opponents = OPPONENTS[player]
+        for move in moves:
+            position.push(move)
+            king = position.kingSquare(player)
+            if king < 0 or not position.board.isAttacked(king, opponents):
+                yield move
+            position.pop()
+
+    def orderMoves(self, position, moves, tableMove, ply):
+        """Sorts moves, best first: the transposition table move, captures (most valuable victim, least valuable
+        attacker first) and promotions, the killer moves of ply, then the other moves by history."""
+        squares = position.board.squares
+        killers = self.killers[ply]
+        history = self.history
+
+        def priority(move):
+            fromSquare, toSquare, flag, promotion = move
+            if move == tableMove:
+                return 1 << 30
+            captured = squares[toSquare]
+            if flag == EN_PASSANT:
+                captured = ' P'
+            if (captured != ' ' and flag != CASTLING) or promotion:
+                victim = PIECE_VALUES[captured[1]] if captured != ' ' and flag != CASTLING else 0
+                return (1 << 28) + (victim + PIECE_VALUES.get(promotion, 0)) * 16 - \
+                    PIECE_VALUES[squares[fromSquare][1]] // 100
+            if move == killers[0] or move == killers[1]:
+                return 1 << 27
+            return history[fromSquare * SQUARES + toSquare]
+
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def store(self, key, depth, bound, score, move):
+        """Stores search result in the transposition table."""
+        if len(self.table) >= self.tableSize:
+            self.table.clear()
+        self.table[key] = (depth, bound, score, move)
+
+    def alphaBeta(self, position, depth, alpha, beta, ply):
+        """Returns negamax score of position for the team to move, searched to depth plies within (alpha, beta)."""
+        self.nodes += 1
+        if not self.nodes & 0x3ff:
+            self.checkTime()
+        key = position.key()
+        entry = self.table.get(key)
+        tableMove = None
+        if entry:
+            tableDepth, bound, score, tableMove = entry
+            if tableDepth >= depth and ply:
+                # Mate scores are stored relative to the node, not to the root
+                score = score - ply if score >= MATE - 2 * MAX_DEPTH else score + ply \
+                    if score <= -MATE + 2 * MAX_DEPTH else score
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    return score
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta, ply, QUIESCENCE_DEPTH)
+
+        originalAlpha = alpha
+        bestScore = -INFINITY
+        bestMove = None
+        moves = self.orderMoves(position, position.pseudoLegalMoves(), tableMove, ply)
+        for move in self.legalChildren(position, moves):
+            score = -self.alphaBeta(position, depth - 1, -beta, -alpha, ply + 1)
+            if score > bestScore:
+                bestScore, bestMove = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        fromSquare, toSquare, flag, promotion = move
+                        captured = position.stack[-1][1]
+                        if (captured == ' ' or flag == CASTLING) and flag != EN_PASSANT and not promotion:
+                            # A quiet move caused the cutoff (the move is made, so the captured piece is taken from
+                            # the move stack)
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1], killers[0] = killers[0], move
+                            self.history[fromSquare * SQUARES + toSquare] += depth * depth
+                        position.pop()
+                        break
+        if bestMove is None:
+            return -(MATE - ply) if position.inCheck() else 0  # Checkmate or stalemate
+
+        bound = EXACT if originalAlpha < bestScore < beta else LOWER if bestScore >= beta else UPPER
+        stored = bestScore + ply if bestScore >= MATE - 2 * MAX_DEPTH else bestScore - ply \
+            if bestScore <= -MATE + 2 * MAX_DEPTH else bestScore
+        self.store(key, depth, bound, stored, bestMove)
+        return bestScore
+
+    def quiescence(self, position, alpha, beta, ply, depth):
+        """Returns score of position for the team to move, searching only captures and promotions, so that the
+        static evaluation is not taken in the middle of an exchange."""
+        self.nodes += 1
+        if not self.nodes & 0x3ff:
+            self.checkTime()
+        standPat = materialScore(position)
+        if alpha - LAZY_MARGIN < standPat < beta + LAZY_MARGIN:
+            standPat = evaluate(position)
+        if standPat >= beta or depth == 0:
+            return standPat
+        alpha = max(alpha, standPat)
+        squares = position.board.squares
+        moves = [move for move in position.pseudoLegalMoves()
+                 if (squares[move[1]] != ' ' and move[2] != CASTLING) or move[2] == EN_PASSANT or move[3]]
+        for move in self.legalChildren(position, self.orderMoves(position, moves, None, ply)):
+            score = -self.quiescence(position, -beta, -alpha, ply + 1, depth - 1)
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    position.pop()
+                    break
+        return alpha
+
+    def maxN(self, position, depth, ply):
+        """Returns tuple of the scores of position per player (in PLAYERS order), searched to depth plies, where the
+        player to move picks the move that maximizes its own score. Only exact results are stored in the table, and
+        there is no pruning."""
+        self.nodes += 1
+        if not self.nodes & 0x3ff:
+            self.checkTime()
+        key = position.key()
+        entry = self.table.get(key)
+        tableMove = None
+        if entry:
+            tableDepth, bound, scores, tableMove = entry
+            if tableDepth >= depth and ply and isinstance(scores, tuple):
+                return scores
+        if depth <= 0:
+            return evaluateAll(position)
+
+        index = PLAYERS.index(position.player)
+        bestScores = None
+        bestMove = None
+        moves = self.orderMoves(position, position.pseudoLegalMoves(), tableMove, ply)
+        for move in self.legalChildren(position, moves):
+            scores = self.maxN(position, depth - 1, ply + 1)
+            if bestScores is None or scores[index] > bestScores[index]:
+                bestScores, bestMove = scores, move
+        if bestMove is None:
+            if not position.inCheck():
+                return (0, 0, 0, 0)  # Stalemate
+            mated = MATE - ply
+            return tuple(-mated if PLAYERS[other] in (position.player, TEAMMATES[position.player]) else mated
+                         for other in range(4))
+        if max(bestScores) < MATE - 2 * MAX_DEPTH:
+            self.store(key, depth, EXACT, bestScores, bestMove)  # Mate scores depend on the ply
+        return bestScores
+
+    def principalVariation(self, position, depth):
+        """Returns the best line of position found by the last search, up to depth moves, from the transposition
+        table."""
+        pv = []
+        keys = set()
+        for _ in range(depth):
+            key = position.key()
+            entry = self.table.get(key)
+            if not entry or key in keys or entry[3] not in position.legalMoves():
+                break
+            keys.add(key)
+            pv.append(entry[3])
+            position.push(entry[3])
+        for _ in pv:
+            position.pop()
+        return pv
+
+    def pvCodes(self, position, pv):
+        """Returns the moves of pv, a line starting at position, as compact move codes."""
+        codes = []
+        for move in pv:
+            codes.append(position.encodeMove(move))
+            position.push(move)
+        for _ in pv:
+            position.pop()
+        return codes
+
+
+class SharedTable:
+    """Transposition table in shared memory, so that the processes of a parallel search share what they learn. Each
+    slot holds an entry packed into one 64-bit word, and that word XORed with the position key: an entry torn by
+    concurrent writes does not match the key and is ignored, so no locks are needed. New entries replace old ones.
+    Offers the dict methods used by Search. Only holds paranoid search results."""
+    def __init__(self, array):
+        self.array = array  # multiprocessing RawArray of 2 * slots unsigned 64-bit ints
+        self.words = memoryview(array).cast('B').cast('Q')
+        self.slots = len(self.words) // 2
+
+    def __len__(self):
+        return 0  # Never full, see Search.store()
+
+    def get(self, key):
+        """Returns (depth, bound, score, move) stored for key, or None."""
+        index = key % self.slots * 2
+        data = self.words[index + 1]
+        if not data or self.words[index] ^ data != key:
+            return None
+        return (data >> 42, data >> 40 & 3, (data >> 21 & 0x7ffff) - SCORE_OFFSET,
+                (data & 0xff, data >> 8 & 0xff, data >> 16 & 3, PROMOTIONS[data >> 18 & 7]))
+
+    def __setitem__(self, key, entry):
+        depth, bound, score, (fromSquare, toSquare, flag, promotion) = entry
+        data = (fromSquare | toSquare << 8 | flag << 16 | PROMOTIONS.index(promotion) << 18 |
+                (score + SCORE_OFFSET) << 21 | bound << 40 | depth << 42)
+        index = key % self.slots * 2
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    def clear(self):
+        """Removes all entries."""
+        ctypes.memset(self.array, 0, ctypes.sizeof(self.array))
+
+
+class Helper(Search):
+    """Paranoid search run by each process of a ParallelSearch, on the shared table. Helpers with an odd index
+    search one ply deeper, so that they fill the table ahead of the others (Lazy SMP). Only helper 0 reports its
+    lines."""
+    def __init__(self, array, stopFlag, nodeCounts, infoQueue):
+        super().__init__(PARANOID)
+        self.table = SharedTable(array)
+        self.stopFlag = stopFlag  # Set by the parent process to stop all helpers
+        self.nodeCounts = nodeCounts  # Nodes searched so far per helper
+        self.infoQueue = infoQueue
+        self.index = 0
+
+    def infoEvent(self, depth, score, nodes, milliseconds, pv):
+        """Overrides Search infoEvent() method. Sends the line of helper 0 with the nodes of all helpers."""
+        if self.index == 0:
+            self.nodeCounts[0] = self.nodes
+            self.infoQueue.put((depth, score, sum(self.nodeCounts), milliseconds, pv))
+
+    def checkTime(self):
+        """Overrides Search checkTime() method. Also publishes the node count and checks the shared stop flag."""
+        self.nodeCounts[self.index] = self.nodes
+        if self.stopFlag.value:
+            raise SearchStopped
+        super().checkTime()
+
+    def alphaBeta(self, position, depth, alpha, beta, ply):
+        """Overrides Search alphaBeta() method to add the depth offset at the root."""
+        return super().alphaBeta(position, depth + (self.index & 1 if not ply else 0), alpha, beta, ply)
+
+
+# Helper of the current process of a ParallelSearch pool, see _initHelper()
+_helper = None
+
+
+def _initHelper(array, stopFlag, nodeCounts, infoQueue):
+    global _helper
+    _helper = Helper(array, stopFlag, nodeCounts, infoQueue)
+
+
+def _helperSearch(fen4, depth, timeLimit, nodeLimit, index):
+    _helper.index = index
+    move, score, pv = _helper.search(Position.fromFen4(fen4), depth, timeLimit, nodeLimit)
+    _helper.nodeCounts[index] = _helper.nodes
+    return move, score, pv, _helper.nodes
+
+
+class ParallelSearch(Search):
+    """Search on several CPU cores (Lazy SMP): threads helper processes search the same position at the same time
+    and share a transposition table in shared memory, so that each profits from the subtrees the others have
+    searched. The result and lines are those of helper 0. The processes are started by the first parallel search
+    and kept until shutdown(). Max-n search and a single thread run in the calling process."""
+    def __init__(self, mode=PARANOID, tableSize=1 << 20, threads=1):
+        super().__init__(mode, tableSize)
+        self.threads = threads
+        self.pool = None
+        self.poolThreads = 0
+        self.sharedTable = None
+        self.stopFlag = None
+        self.nodeCounts = None
+        self.infoQueue = None
+
+    def startPool(self):
+        """Starts the helper processes, unless they are running with the current number of threads."""
+        if self.pool and self.poolThreads == self.threads:
+            return
+        self.shutdown()
+        # Spawned, not forked, since the caller may be a GUI with several threads
+        context = multiprocessing.get_context('spawn')
+        self.sharedTable = SharedTable(context.RawArray('Q', 2 * self.tableSize))
+        self.stopFlag = context.RawValue('b', 0)
+        self.nodeCounts = context.RawArray('Q', self.threads)
+        self.infoQueue = context.Queue()
+        self.pool = context.Pool(self.threads, _initHelper,
+                                 (self.sharedTable.array, self.stopFlag, self.nodeCounts, self.infoQueue))
+        self.poolThreads = self.threads
+
+    def shutdown(self):
+        """Stops the helper processes."""
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def clear(self):
+        """Overrides Search clear() method. Also clears the shared table."""
+        super().clear()
+        if self.sharedTable:
+            self.sharedTable.clear()
+
+    def stop(self):
+        """Overrides Search stop() method. Also stops the helpers."""
+        super().stop()
+        if self.stopFlag:
+            self.stopFlag.value = 1
+
+    def search(self, position, depth=MAX_DEPTH, timeLimit=None, nodeLimit=None):
+        """Overrides Search search() method. Searches with all helpers, if there is more than one thread; the node
+        limit then applies to each helper."""
+        if self.threads < 2 or self.mode != PARANOID:
+            return super().search(position, depth, timeLimit, nodeLimit)
+        self.startPool()
+        self.stopped = False
+        self.stopFlag.value = 0
+        for index in range(self.threads):
+            self.nodeCounts[index] = 0
+        fen4 = position.getFen4()
+        results = [self.pool.apply_async(_helperSearch, (fen4, depth, timeLimit, nodeLimit, index))
+                   for index in range(self.threads)]
+        while not results[0].ready():
+            if self.stopped:
+                self.stopFlag.value = 1
+            try:
+                self.infoEvent(*self.infoQueue.get(timeout=0.01))
+            except queue.Empty:
+                pass
+        self.stopFlag.value = 1  # Helper 0 is done, so are the others
+        move, score, pv, _ = results[0].get()
+        self.nodes = sum(result.get()[3] for result in results)
+        while not self.infoQueue.empty():
+            self.infoEvent(*self.infoQueue.get())
+        self.bestMoveEvent(position.encodeMove(move) if move else 0)
+        return move, score, pv
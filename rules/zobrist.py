@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+
+# Zobrist keys: 64-bit random numbers XORed together to identify a position. The generator is seeded with a fixed
+# value, so that keys are the same in every process and can be stored, e.g. in a game database.
+_random = random.Random(0x4bc)
+PIECE_KEYS = {player + pieceType: [_random.getrandbits(64) for _ in range(14 * 14)]
+              for player in 'rbyg' for pieceType in 'PNBRQK'}
+PLAYER_KEYS = {player: _random.getrandbits(64) for player in 'rbyg'}
+# Castling rights are an int of 8 bits (see movegen.CASTLING_RIGHTS). Keys of all combinations are precomputed.
+_castlingBitKeys = [_random.getrandbits(64) for _ in range(8)]
+CASTLING_KEYS = [0] * 256
+for _castling in range(256):
+    for _bit in range(8):
+        if _castling >> _bit & 1:
+            CASTLING_KEYS[_castling] ^= _castlingBitKeys[_bit]
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(14 * 14)]
+del _random, _castling, _bit
+
+
+def stateKey(player, castling, enPassant):
+    """Returns the part of the key for player to move, castling rights and en passant targets (one (target, pawn)
+    entry or None per player)."""
+    key = PLAYER_KEYS.get(player, 0) ^ CASTLING_KEYS[castling]
+    for entry in enPassant:
+        if entry:
+            key ^= EN_PASSANT_KEYS[entry[0]]
+    return key
+
+
+def boardKey(boardData):
+    """Returns the part of the key for the pieces on the board, computed from scratch from a list of squares."""
+    key = 0
+    for square, piece in enumerate(boardData):
+        if piece != ' ':
+            key ^= PIECE_KEYS[piece][square]
+    return key
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import sys
+import time
+from rules.archive import ArchiveWriter, GameArchive
+from rules.movegen import moveName, moveFromCode
+from rules.pgn4 import formatGame, readGames
+
+
+def pack(paths, output):
+    """Converts PGN4 files to archive output. Returns statistics dict. Games that could only be read partly are
+    stored with the moves before the error and counted."""
+    stats = {'games': 0, 'errors': 0, 'pgn4Bytes': sum(os.path.getsize(path) for path in paths)}
+    start = time.perf_counter()
+    with ArchiveWriter(output) as writer:
+        for path in paths:
+            for game in readGames(path):
+                writer.add(game)
+                stats['games'] += 1
+                stats['errors'] += game.error is not None
+    stats['archiveBytes'] = os.path.getsize(output)
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def unpack(path, output):
+    """Converts archive path to PGN4 file output (standard output if '-'). Returns number of games."""
+    file = sys.stdout if output == '-' else open(output, 'w', encoding='utf-8')
+    try:
+        with GameArchive(path) as archive:
+            for index, game in enumerate(archive):
+                file.write(('\n' if index else '') + formatGame(game))
+            return len(archive)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+def show(path, index):
+    """Returns game index of archive path as dict with tags, result and main line in coordinate notation."""
+    with GameArchive(path) as archive:
+        game = archive[index]
+        return {'game': index, 'tags': game.tags, 'result': game.result,
+                'moves': [moveName(moveFromCode(node.move)) for node in game.mainLine()]}
+
+
+def main(argv=None):
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Converts PGN4 files to a binary game archive (about 2 bytes per '
+                                                 'move, random access) and back, or prints one game of an archive.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    packParser = subparsers.add_parser('pack', help='PGN4 files to archive')
+    packParser.add_argument('paths', nargs='+', help='PGN4 files')
+    packParser.add_argument('--output', required=True, help='archive file')
+    unpackParser = subparsers.add_parser('unpack', help='archive to PGN4 file')
+    unpackParser.add_argument('archive', help='archive file')
+    unpackParser.add_argument('--output', default='-', help='PGN4 file (default: standard output)')
+    showParser = subparsers.add_parser('show', help='one game of an archive as JSON')
+    showParser.add_argument('archive', help='archive file')
+    showParser.add_argument('--game', type=int, default=0, help='game index, starting from 0 (default: 0)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        print(json.dumps(pack(args.paths, args.output)))
+    elif args.command == 'unpack':
+        games = unpack(args.archive, args.output)
+        if args.output != '-':
+            print(json.dumps({'games': games}))
+    else:
+        print(json.dumps(show(args.archive, args.game)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+from rules.algorithm import Algorithm, Teams
+from rules.analysis import GameAnalysis
+from rules.archive import ArchiveWriter, GameArchive
+from rules.board import Board
+from rules.evaluation import evaluateBatch, playerScores
+from rules.gameserver import Connection, Packet, ServerGame
+from rules.movegen import Position, decodeFen4s, encodeMove, fen4Sequence, moveName
+from rules.movelist import MoveList, flattenTree
+from rules.pgn4 import Game, formatGame, parseGame, readGames, splitGames
+from rules.search import MAX_N, PARANOID, ParallelSearch, Search
+
+MOVE = encodeMove(21, 35, 'rP')  # Any move will do for the tree benchmarks, e.g. h2-h3
+
+
+def bestOf(function, repeat):
+    """Returns the shortest run time of function in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def addNode(parent, move=MOVE):
+    """Adds a child to parent and returns it."""
+    node = Algorithm.Node(move, [], parent)
+    parent.add(node)
+    return node
+
+
+def mainLineTree(size):
+    """Returns root of a main line with a four-ply variation every ten plies."""
+    root = Algorithm.Node(0, [], None)
+    node = root
+    count = 0
+    while count < size:
+        node = addNode(node)
+        count += 1
+        if count % 10 == 0:
+            variation = addNode(node.parent)
+            for i in range(3):
+                variation = addNode(variation)
+            count += 4
+    return root
+
+
+def nestedTree(size):
+    """Returns root of a tree where every variation has a nested variation at its second move, i.e. the nesting depth
+    grows with the tree size."""
+    root = Algorithm.Node(0, [], None)
+    line = addNode(root)
+    count = 1
+    while count < size:
+        node = addNode(line)
+        addNode(node)
+        line = addNode(line)  # Variation of node
+        count += 3
+    return root
+
+
+def randomTree(size, seed=0):
+    """Returns root of a tree where each move continues the previous one or, with probability 0.2, branches off from a
+    random earlier move."""
+    generator = random.Random(seed)
+    root = Algorithm.Node(0, [], None)
+    nodes = [root]
+    for count in range(size):
+        parent = generator.choice(nodes) if generator.random() < 0.2 else nodes[-1]
+        nodes.append(addNode(parent))
+    return root
+
+
+def countNodes(root):
+    """Returns number of moves in the tree below root."""
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += len(node.children)
+        stack.extend(node.children)
+    return count
+
+
+def moveTree(size, repeat):
+    """Benchmarks flattening, the cached getMoves(), rebuilding the move list and adding moves to it."""
+    results = []
+    for name, build in (('mainLine', mainLineTree), ('nested', nestedTree), ('random', randomTree)):
+        root = build(size)
+        algorithm = Algorithm()
+        algorithm.currentMove = root
+        algorithm.treeVersion += 1
+        algorithm.getMoves()
+        moveList = MoveList()
+        moveList.reset(root)
+        leaf = root
+        while leaf.children:
+            leaf = leaf.children[0]
+
+        def append():
+            node = leaf
+            for i in range(1000):
+                node = addNode(node)
+                moveList.addNode(node)
+            del leaf.children[:]
+
+        moves = flattenTree(root)
+        results.append({'tree': name, 'nodes': countNodes(root), 'maxVar': max(move[3] for move in moves),
+                        'flattenMs': round(bestOf(lambda: flattenTree(root), repeat) * 1000, 3),
+                        'cachedGetMovesUs': round(bestOf(algorithm.getMoves, repeat) * 1e6, 3),
+                        'moveListResetMs': round(bestOf(lambda: moveList.reset(root), repeat) * 1000, 3),
+                        'moveListRows': moveList.rowCount(),
+                        'moveListAddUs': round(bestOf(append, 1) * 1000, 3)})
+    return results
+
+
+def randomGame(plies, seed=0):
+    """Returns a Teams game with a main line of random legal moves (a new game is started if one ends early)."""
+    generator = random.Random(seed)
+    game = Teams()
+    game.newGame()
+    while game.moveNumber < plies:
+        moves = game.legalMoves()
+        if not moves:
+            game.newGame()
+            continue
+        fromSquare, toSquare, flag, promotion = generator.choice(moves)
+        game.makeMove(fromSquare % 14, fromSquare // 14, toSquare % 14, toSquare // 14, promotion or 'Q')
+    return game
+
+
+def navigation(plies, repeat):
+    """Benchmarks stepping through a game, seeking random moves, exporting the game and the memory used per move tree
+    node."""
+    game = randomGame(plies)
+    nodes = []
+    node = game.currentMove
+    while node.parent is not None:
+        nodes.append(node)
+        node = node.parent
+    generator = random.Random(0)
+    targets = [generator.choice(nodes) for _ in range(1000)]
+
+    def walk():
+        while game.currentMove.parent is not None:
+            game.prevMove()
+        while game.currentMove.children:
+            game.nextMove()
+
+    def seek():
+        for target in targets:
+            game.seekNode(target)
+
+    root = game.currentMove.getRoot()
+    tracemalloc.start()
+    nodes = [addNode(root, root.children[0].move) for _ in range(100000)]
+    for node in nodes:
+        node.state = root.children[0].state
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del root.children[1:]
+    return [{'plies': plies, 'navigationUsPerPly': round(bestOf(walk, repeat) / (2 * plies) * 1e6, 3),
+             'seekUs': round(bestOf(seek, repeat) / len(targets) * 1e6, 3),
+             'getPgn4Ms': round(bestOf(game.getPgn4, repeat) * 1000, 3),
+             'bytesPerNode': round(size / len(nodes), 1)}]
+
+
+def fen4(plies, repeat):
+    """Benchmarks FEN4 export of every position of a game, FEN4 decoding and a board round trip."""
+    position = Position.fromFen4(Algorithm.StartingPosition)
+    generator = random.Random(0)
+    moves = []
+    while len(moves) < plies:
+        legalMoves = position.legalMoves()
+        if not legalMoves:
+            break
+        moves.append(generator.choice(legalMoves))
+        position.push(moves[-1])
+    start = Position.fromFen4(Algorithm.StartingPosition)
+    fen4s = fen4Sequence(start, moves)
+    board = Board(14, 14)
+
+    def roundTrip():
+        for fen4 in fen4s:
+            board.setFen4(fen4)
+            board.getFen4()
+
+    return [{'positions': len(fen4s),
+             'exportUsPerPosition': round(bestOf(lambda: fen4Sequence(start, moves), repeat) / len(fen4s) * 1e6, 3),
+             'getFen4Us': round(bestOf(lambda: [position.getFen4() for _ in fen4s], repeat) / len(fen4s) * 1e6, 3),
+             'fromFen4Us': round(bestOf(lambda: decodeFen4s(fen4s), repeat) / len(fen4s) * 1e6, 3),
+             'boardRoundTripUs': round(bestOf(roundTrip, repeat) / len(fen4s) * 1e6, 3)}]
+
+
+def evaluation(positions, repeat):
+    """Benchmarks evaluating the positions of random games one at a time and as one batch (with NumPy, if
+    installed)."""
+    generator = random.Random(0)
+    boards = []
+    while len(boards) < positions:
+        position = Position.fromFen4(Algorithm.StartingPosition)
+        for _ in range(300):
+            moves = position.legalMoves()
+            if not moves or len(boards) == positions:
+                break
+            position.push(generator.choice(moves))
+            boards.append(position.board.copy())
+    return [{'positions': positions,
+             'scalarUsPerPosition': round(bestOf(lambda: [playerScores(board) for board in boards], repeat) /
+                                          positions * 1e6, 3),
+             'batchUsPerPosition': round(bestOf(lambda: evaluateBatch(boards), repeat) / positions * 1e6, 3)}]
+
+
+def search(depth, repeat):
+    """Benchmarks paranoid and max-n search of the starting position to depth, with an empty transposition table."""
+    position = Position.fromFen4(Algorithm.StartingPosition)
+    results = []
+    for mode in (PARANOID, MAX_N):
+        engine = Search(mode)
+
+        def run():
+            engine.clear()
+            engine.search(position, depth)
+
+        seconds = bestOf(run, repeat)
+        results.append({'mode': mode, 'depth': depth, 'nodes': engine.nodes, 'seconds': round(seconds, 3),
+                        'nps': int(engine.nodes / seconds)})
+    return results
+
+
+def parallel(threadCounts, seconds):
+    """Benchmarks parallel search of the starting position for seconds per number of threads: nodes per second,
+    their scaling relative to one thread and the depth reached."""
+    position = Position.fromFen4(Algorithm.StartingPosition)
+    results = []
+    for threads in threadCounts:
+        engine = ParallelSearch(threads=threads)
+        depths = [0]
+        engine.infoEvent = lambda depth, *info: depths.append(depth)
+        if threads > 1:
+            engine.startPool()  # Not part of the measurement
+        start = time.perf_counter()
+        engine.search(position, timeLimit=seconds)
+        elapsed = time.perf_counter() - start
+        engine.shutdown()
+        results.append({'threads': threads, 'nodes': engine.nodes, 'seconds': round(elapsed, 3),
+                        'nps': int(engine.nodes / elapsed), 'depth': depths[-1]})
+        results[-1]['scaling'] = round(results[-1]['nps'] / results[0]['nps'], 2)
+    return results
+
+
+def analysis(plies, processCounts):
+    """Benchmarks whole-game analysis of a random game per number of worker processes: moves analyzed per second and
+    the time until the first annotation arrives."""
+    game = randomGame(plies)
+    root = game.currentMove.getRoot()
+    results = []
+    for processes in processCounts:
+        gameAnalysis = GameAnalysis(processes=processes)
+        gameAnalysis.startPool()  # Not part of the measurement
+        arrivals = []
+        gameAnalysis.annotationEvent = lambda node, annotation: arrivals.append(time.perf_counter())
+        start = time.perf_counter()
+        gameAnalysis.analyze(root, game.getRootPosition())
+        elapsed = time.perf_counter() - start
+        gameAnalysis.shutdown()
+        results.append({'processes': processes, 'moves': len(arrivals), 'seconds': round(elapsed, 3),
+                        'movesPerSecond': round(len(arrivals) / elapsed, 1),
+                        'firstAnnotationMs': round((arrivals[0] - start) * 1000, 1) if arrivals else None})
+        results[-1]['scaling'] = round(results[-1]['movesPerSecond'] / results[0]['movesPerSecond'], 2)
+    return results
+
+
+class CountingConnection(Connection):
+    """Spectator that only counts what it is sent."""
+    def __init__(self):
+        super().__init__()
+        self.bytes = 0
+
+    def send(self, packet):
+        """Overrides Connection send() method."""
+        self.bytes += len(packet.line)
+
+
+def spectators(subscriberCounts, plies, repeat):
+    """Benchmarks broadcasting the moves of a random game to spectators per number of subscribers: time per move
+    with deltas encoded once, compared to encoding a FEN4 state per subscriber, and the bytes sent per subscriber and
+    move for both."""
+    position = Position.fromFen4(Algorithm.StartingPosition)
+    generator = random.Random(0)
+    names = []
+    while len(names) < plies:
+        moves = position.legalMoves()
+        if not moves:
+            break
+        names.append(moveName(generator.choice(moves)))
+        position.push(position.findMoveName(names[-1]))
+    results = []
+    for subscribers in subscriberCounts:
+        connections = []
+
+        def deltas():
+            connections[:] = [CountingConnection() for _ in range(subscribers)]
+            game = ServerGame('benchmark', Algorithm.StartingPosition)
+            game.seats = dict.fromkeys(game.seats, Connection())  # Players are not part of the measurement
+            for connection in connections:
+                game.watch(connection)
+            start = time.perf_counter()
+            for name in names:
+                game.play(game.currentPlayer, name)
+            return time.perf_counter() - start
+
+        def states():
+            connections[:] = [CountingConnection() for _ in range(subscribers)]
+            game = ServerGame('benchmark', Algorithm.StartingPosition)
+            game.seats = dict.fromkeys(game.seats, Connection())  # Players are not part of the measurement
+            start = time.perf_counter()
+            for name in names:
+                game.play(game.currentPlayer, name)
+                for connection in connections:
+                    connection.send(Packet(game.state()))
+            return time.perf_counter() - start
+
+        deltaSeconds = min(deltas() for _ in range(repeat))
+        deltaBytes = connections[0].bytes
+        stateSeconds = min(states() for _ in range(repeat))
+        stateBytes = connections[0].bytes
+        results.append({'subscribers': subscribers, 'plies': len(names),
+                        'deltaUsPerMove': round(deltaSeconds / len(names) * 1e6, 1),
+                        'stateUsPerMove': round(stateSeconds / len(names) * 1e6, 1),
+                        'deltaBytesPerMove': round(deltaBytes / len(names), 1),
+                        'stateBytesPerMove': round(stateBytes / len(names), 1)})
+    return results
+
+
+def randomPgn4Game(plies, generator):
+    """Returns a rules.pgn4.Game with a main line of up to plies random legal moves and a variation of up to 4 moves
+    every 20 plies."""
+    position = Position.fromFen4(Algorithm.StartingPosition)
+    root = Algorithm.Node(0, [], None)
+    root.state = (position.castling, position.enPassant)
+    node = root
+    for ply in range(plies):
+        moves = position.legalMoves()
+        if not moves:
+            break
+        move = generator.choice(moves)
+        parent = node
+        node = addNode(parent, position.encodeMove(move))
+        alternatives = [other for other in moves if other != move] if ply % 20 == 19 else []
+        if alternatives:
+            branch = parent
+            variation = generator.choice(alternatives)
+            for _ in range(4):
+                branch = addNode(branch, position.encodeMove(variation))
+                position.push(variation)
+                branch.state = (position.castling, position.enPassant)
+                replies = position.legalMoves()
+                if not replies:
+                    break
+                variation = generator.choice(replies)
+            while len(position.stack) > ply:
+                position.pop()
+        position.push(move)
+        node.state = (position.castling, position.enPassant)
+    tags = {'Event': 'Four-Player Chess Teams', 'Site': 'benchmark', 'Date': '2018.06.08', 'Red': 'Red',
+            'Blue': 'Blue', 'Yellow': 'Yellow', 'Green': 'Green', 'Result': '*', 'PlyCount': str(position.ply)}
+    return Game(tags, root, Algorithm.StartingPosition)
+
+
+def archive(games, plies, repeat):
+    """Benchmarks the binary game archive against PGN4 on random games with variations: file size, bytes per move,
+    reading all games and reading one game (by index; PGN4 has to be split up to the game)."""
+    generator = random.Random(0)
+    texts = [formatGame(randomPgn4Game(plies, generator)) for _ in range(games)]
+    moves = sum(len(flattenTree(parseGame(text).root)) for text in texts)
+    targets = [generator.randrange(games) for _ in range(100)]
+    with tempfile.TemporaryDirectory() as directory:
+        pgn4Path = os.path.join(directory, 'games.pgn4')
+        archivePath = os.path.join(directory, 'games.4pca')
+        with open(pgn4Path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(texts))
+
+        def pack():
+            with ArchiveWriter(archivePath) as writer:
+                for game in readGames(pgn4Path):
+                    writer.add(game)
+
+        def pgn4Game(index):
+            with open(pgn4Path, encoding='utf-8') as file:
+                return parseGame(next(islice(splitGames(file), index, None)))
+
+        packSeconds = bestOf(pack, repeat)
+        gameArchive = GameArchive(archivePath)
+        result = {'games': games, 'moves': moves, 'pgn4Bytes': os.path.getsize(pgn4Path),
+                  'archiveBytes': os.path.getsize(archivePath),
+                  'moveBytesPerMove': round(sum(2 * len(gameArchive.words(index)) for index in range(games)) / moves,
+                                            3),
+                  'packSeconds': round(packSeconds, 3),
+                  'pgn4ReadAllMs': round(bestOf(lambda: list(readGames(pgn4Path)), repeat) * 1000, 1),
+                  'archiveReadAllMs': round(bestOf(lambda: list(gameArchive), repeat) * 1000, 1),
+                  'archiveTagsOnlyUs': round(bestOf(lambda: [gameArchive.tags(index) for index in range(games)],
+                                                    repeat) / games * 1e6, 1),
+                  'pgn4GameMs': round(bestOf(lambda: [pgn4Game(index) for index in targets], repeat) /
+                                      len(targets) * 1000, 3),
+                  'archiveGameMs': round(bestOf(lambda: [gameArchive[index] for index in targets], repeat) /
+                                         len(targets) * 1000, 3)}
+        gameArchive.close()
+    return [result]
+
+
+def render(repeat):
+    """Benchmarks painting the board view offscreen: whole board with cold and warm pixmap caches, and the squares
+    changed by one move. Needs PyQt5."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtGui import QIcon, QImage, QRegion
+    from gui.main import View, Teams as GuiTeams
+    application = QApplication.instance() or QApplication([])
+    game = GuiTeams()
+    game.newGame()
+    view = View()
+    view.setBoard(game.board)
+    for player in 'rbyg':
+        for pieceType in 'PNBRQK':
+            view.setPiece(player + pieceType, QIcon('resources/img/pieces/' + player + pieceType + '.svg'))
+    view.resize(view.sizeHint())
+    image = QImage(view.sizeHint(), QImage.Format_ARGB32_Premultiplied)
+
+    def cold():
+        view.piecePixmaps = {}
+        view.background = None
+        view.render(image)
+
+    region = QRegion(view.squareRect(7, 1)) + QRegion(view.squareRect(7, 3))  # h2-h4
+    results = [{'fullPaintColdMs': round(bestOf(cold, repeat) * 1000, 3),
+                'fullPaintMs': round(bestOf(lambda: view.render(image), repeat) * 1000, 3),
+                'movePaintMs': round(bestOf(lambda: view.render(image, sourceRegion=region), repeat) * 1000, 3)}]
+    application.processEvents()
+    return results
+
+
+def main(argv=None):
+    """Command line interface. Prints a JSON report to stdout."""
+    parser = argparse.ArgumentParser(description='Benchmarks of the rules core.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the fastest is reported')
+    movetree = subparsers.add_parser('movetree', help='move tree flattening and move list updates')
+    movetree.add_argument('--nodes', type=int, action='append', help='tree size (default: 10000 and 100000)')
+    navigate = subparsers.add_parser('navigation', help='stepping and seeking in a game, PGN4 export and node memory')
+    navigate.add_argument('--plies', type=int, default=300, help='length of the random game (default: 300)')
+    fen4Parser = subparsers.add_parser('fen4', help='FEN4 export and decoding')
+    fen4Parser.add_argument('--plies', type=int, default=300, help='length of the random game (default: 300)')
+    evaluationParser = subparsers.add_parser('evaluation', help='evaluation one at a time and in batches')
+    evaluationParser.add_argument('--positions', type=int, default=10000, help='number of positions (default: 10000)')
+    searchParser = subparsers.add_parser('search', help='paranoid and max-n search speed')
+    searchParser.add_argument('--depth', type=int, default=4, help='search depth in plies (default: 4)')
+    parallelParser = subparsers.add_parser('parallel', help='parallel search speed per number of threads')
+    parallelParser.add_argument('--threads', type=int, action='append',
+                                help='number of threads (default: 1, 2, 4, ... up to the number of CPUs)')
+    parallelParser.add_argument('--seconds', type=float, default=10, help='search time per run (default: 10)')
+    analysisParser = subparsers.add_parser('analysis', help='whole-game analysis speed per number of processes')
+    analysisParser.add_argument('--plies', type=int, default=40, help='length of the random game (default: 40)')
+    analysisParser.add_argument('--processes', type=int, action='append',
+                                help='number of worker processes (default: 1, 2, 4, ... up to the number of CPUs)')
+    spectatorsParser = subparsers.add_parser('spectators', help='move broadcast per number of spectators')
+    spectatorsParser.add_argument('--subscribers', type=int, action='append',
+                                  help='number of spectators (default: 10, 1000 and 10000)')
+    spectatorsParser.add_argument('--plies', type=int, default=200, help='length of the random game (default: 200)')
+    archiveParser = subparsers.add_parser('archive', help='binary game archive against PGN4: size and read speed')
+    archiveParser.add_argument('--games', type=int, default=1000, help='number of random games (default: 1000)')
+    archiveParser.add_argument('--plies', type=int, default=200, help='length of the main lines (default: 200)')
+    subparsers.add_parser('render', help='board view painting (needs PyQt5)')
+    args = parser.parse_args(argv)
+
+    report = {'benchmark': args.benchmark, 'python': platform.python_version(), 'platform': platform.platform()}
+    if args.benchmark == 'movetree':
+        report['results'] = [result for size in args.nodes or [10000, 100000] for result in moveTree(size, args.repeat)]
+    elif args.benchmark == 'navigation':
+        report['results'] = navigation(args.plies, args.repeat)
+    elif args.benchmark == 'fen4':
+        report['results'] = fen4(args.plies, args.repeat)
+    elif args.benchmark == 'evaluation':
+        report['results'] = evaluation(args.positions, args.repeat)
+    elif args.benchmark == 'search':
+        report['results'] = search(args.depth, args.repeat)
+    elif args.benchmark == 'parallel':
+        threadCounts = args.threads or [1 << exponent for exponent in range((os.cpu_count() or 1).bit_length())]
+        report['results'] = parallel(threadCounts, args.seconds)
+    elif args.benchmark == 'analysis':
+        processCounts = args.processes or [1 << exponent for exponent in range((os.cpu_count() or 1).bit_length())]
+        report['results'] = analysis(args.plies, processCounts)
+    elif args.benchmark == 'spectators':
+        report['results'] = spectators(args.subscribers or [10, 1000, 10000], args.plies, args.repeat)
+    elif args.benchmark == 'archive':
+        report['results'] = archive(args.games, args.plies, args.repeat)
+    elif args.benchmark == 'render':
+        report['results'] = render(args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
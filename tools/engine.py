@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import sys
+import threading
+from rules.algorithm import Algorithm
+from rules.movegen import Position, moveFromCode, moveName
+from rules.protocol import NULL_MOVE, PROTOCOL, infoLine, parseGo, parsePosition
+from rules.search import MAX_DEPTH, MAX_N, PARANOID, ParallelSearch
+
+
+class ProtocolSearch(ParallelSearch):
+    """ParallelSearch that reports its lines and best move as protocol output."""
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+        self.bestMove = 0
+
+    def infoEvent(self, depth, score, nodes, milliseconds, pv):
+        """Overrides Search infoEvent() method."""
+        self.send(infoLine(depth, score, nodes, milliseconds, [moveName(moveFromCode(code)) for code in pv]))
+
+    def bestMoveEvent(self, code):
+        """Overrides Search bestMoveEvent() method. The best move is sent by the engine, see ReferenceEngine.go()."""
+        self.bestMove = code
+
+
+class ReferenceEngine:
+    """The built-in search engine speaking the engine protocol (see rules.protocol) on text streams. Searches run in
+    a thread of their own, so that isready and stop are answered while the engine thinks."""
+    def __init__(self, output=sys.stdout, threads=1):
+        self.output = output
+        self.lock = threading.Lock()  # Serializes output lines of the search thread and the command loop
+        self.search = ProtocolSearch(self.send)
+        self.search.threads = threads
+        self.position = Position.fromFen4(Algorithm.StartingPosition)
+        self.thread = None
+        self.stopped = threading.Event()  # Set by stop; an unlimited search keeps its best move until then
+
+    def send(self, line):
+        """Writes output line."""
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line):
+        """Handles command line. Returns False after quit."""
+        command, _, arguments = line.strip().partition(' ')
+        if command == PROTOCOL:
+            self.send('id name Four-Player Chess reference engine')
+            self.send('id author GammaDeltaII')
+            self.send('option name Mode type combo default %s var %s var %s' % (PARANOID, PARANOID, MAX_N))
+            self.send('option name Threads type spin default %d min 1 max %d' % (self.search.threads,
+                                                                                 os.cpu_count() or 1))
+            self.send('option name Hash type spin default %d min 1024 max %d' % (self.search.tableSize, 1 << 26))
+            self.send(PROTOCOL + 'ok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.wait()
+            self.setOption(arguments)
+        elif command == 'newgame':
+            self.wait()
+            self.search.clear()
+        elif command == 'position':
+            self.wait()
+            try:
+                self.position = parsePosition(arguments)
+            except (ValueError, IndexError) as error:
+                self.send('info string %s' % error)
+        elif command == 'go':
+            self.wait()
+            try:
+                self.go(parseGo(arguments))
+            except ValueError as error:
+                self.send('info string %s' % error)
+        elif command == 'stop':
+            self.wait()
+        elif command == 'quit':
+            self.wait()
+            self.search.shutdown()
+            return False
+        elif command:
+            self.send('info string Unknown command: %s' % command)
+        return True
+
+    def setOption(self, arguments):
+        """Sets option from the arguments of a setoption command."""
+        name, _, value = arguments.partition(' value ')
+        name = name.replace('name', '', 1).strip()
+        try:
+            if name == 'Mode' and value in (PARANOID, MAX_N):
+                self.search.setMode(value)
+            elif name == 'Threads':
+                self.search.threads = max(int(value), 1)
+            elif name == 'Hash':
+                self.search.tableSize = max(int(value), 1024)
+                self.search.shutdown()  # The shared table is created again with the new size
+                self.search.clear()
+            else:
+                self.send('info string Invalid option: %s' % arguments)
+        except ValueError:
+            self.send('info string Invalid option value: %s' % arguments)
+
+    def go(self, limits):
+        """Starts a search of the current position in the search thread."""
+        if 'mode' in limits:
+            self.search.setMode(limits['mode'])
+        timeLimit = limits['movetime'] / 1000 if limits.get('movetime') else None
+        unlimited = not any(name in limits for name in ('depth', 'movetime', 'nodes'))
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(self.position.copy(), limits.get('depth', MAX_DEPTH),
+                                                              timeLimit, limits.get('nodes'), unlimited))
+        self.thread.start()
+
+    def run(self, position, depth, timeLimit, nodeLimit, unlimited):
+        """Searches position and sends the best move, in the search thread."""
+        self.search.search(position, depth, timeLimit, nodeLimit)
+        if unlimited:
+            self.stopped.wait()  # The best move of an unlimited search is only sent when it is stopped
+        code = self.search.bestMove
+        self.send('bestmove ' + (moveName(moveFromCode(code)) if code else NULL_MOVE))
+
+    def wait(self):
+        """Stops the running search, if any, and waits until its best move has been sent."""
+        if self.thread:
+            self.search.stop()
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+
+def main(argv=None):
+    """Command line interface. Reads commands from stdin and writes replies to stdout until quit or end of input."""
+    parser = argparse.ArgumentParser(description='Reference engine speaking the four-player chess engine protocol '
+                                                 '(see rules/protocol.py) on stdin and stdout.')
+    parser.add_argument('--threads', type=int, default=1, help='CPU cores to search on (default: 1)')
+    args = parser.parse_args(argv)
+
+    engine = ReferenceEngine(sys.stdout, args.threads)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.wait()
+        engine.search.shutdown()
+
+
+if __name__ == '__main__':
+    main()
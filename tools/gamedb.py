@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import time
+from rules.database import GameDatabase
+
+
+def main(argv=None):
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Looks up games in a game database created with tools.pgn4import '
+                                                 '--database. Prints JSON with the results and the query time.')
+    parser.add_argument('database', help='SQLite game database')
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--fen4', help='games that reached this position')
+    query.add_argument('--player', help='games of this player')
+    query.add_argument('--game', type=int, help='game with this id')
+    query.add_argument('--explore', metavar='FEN4', help='opening explorer statistics of the continuations')
+    query.add_argument('--rebuild-explorer', action='store_true', help='recompute the opening explorer statistics')
+    parser.add_argument('--color', help='with --player: only games as this color (red, blue, yellow or green)')
+    parser.add_argument('--limit', type=int, help='maximum number of games')
+    args = parser.parse_args(argv)
+
+    database = GameDatabase(args.database)
+    start = time.perf_counter()
+    if args.fen4:
+        result = [{'game': game, 'ply': ply} for game, ply in database.findPosition(args.fen4, args.limit)]
+    elif args.player:
+        result = database.findPlayer(args.player, args.color, args.limit)
+    elif args.explore:
+        result = database.explore(args.explore)[:args.limit]
+    elif args.rebuild_explorer:
+        database.rebuildExplorer()
+        result = database.connection.execute('SELECT COUNT(*) FROM explorer').fetchone()[0]
+    else:
+        result = database.getGame(args.game)
+    milliseconds = (time.perf_counter() - start) * 1000
+    database.close()
+    print(json.dumps({'result': result, 'milliseconds': round(milliseconds, 3)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from rules.algorithm import Algorithm
+from rules.bitboard import PLAYERS
+from rules.gameserver import MAX_LINE, encodeMessage
+from rules.movegen import Position, moveName
+from tools.server import raiseFileLimit
+
+
+def randomMove(position, generator):
+    """Returns a random legal move in coordinate notation, or None if there is none. Pseudo-legal moves are tried in
+    random order, which is faster than generating all legal moves."""
+    moves = list(position.pseudoLegalMoves())
+    generator.shuffle(moves)
+    return next((moveName(move) for move in moves if position.isLegal(move)), None)
+
+
+async def request(host, port, message):
+    """Sends message on a connection of its own and returns the first reply."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encodeMessage(message))
+    reply = json.loads(await reader.readline())
+    writer.close()
+    return reply
+
+
+async def seat(host, port, gameId, player, plies, think, latencies, generator):
+    """Simulates the client in the seat player of game gameId: plays random moves after think seconds when it is
+    its turn, until the game ends or has plies moves. Appends the seconds from sending each move to receiving its
+    broadcast to latencies. Returns the number of moves it played."""
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    writer.write(encodeMessage({'type': 'join', 'game': gameId, 'seat': player}))
+    position = Position.fromFen4(Algorithm.StartingPosition)
+    seated = set()
+    sent = None  # Time the pending move was sent
+    moves = 0
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        kind = message['type']
+        if kind == 'state':
+            seated.update(message['seats'])
+        elif kind == 'joined':
+            seated.add(message['seat'])
+        elif kind == 'move':
+            position.push(position.findMoveName(message['move']))
+            if message['player'] == player:
+                latencies.append(time.perf_counter() - sent)
+                sent = None
+                moves += 1
+            if message['result'] != Algorithm.NoResult or message['ply'] >= plies:
+                break
+        elif kind == 'error':
+            raise RuntimeError(message['message'])
+        if sent is None and len(seated) == len(PLAYERS) and position.player == player:
+            if think:
+                await asyncio.sleep(think)
+            move = randomMove(position, generator)
+            if move is None:
+                break
+            sent = time.perf_counter()
+            writer.write(encodeMessage({'type': 'move', 'game': gameId, 'move': move}))
+    writer.close()
+    return moves
+
+
+async def simulate(host, port, gameIds, plies, think, seed):
+    """Plays the games gameIds with four simulated clients each. Returns (latencies, moves)."""
+    generator = random.Random(seed)
+    latencies = []
+    moves = await asyncio.gather(*(seat(host, port, gameId, player, plies, think, latencies, generator)
+                                   for gameId in gameIds for player in PLAYERS))
+    return latencies, sum(moves)
+
+
+def _simulate(host, port, gameIds, plies, think, seed):
+    raiseFileLimit()
+    return asyncio.run(simulate(host, port, gameIds, plies, think, seed))
+
+
+def percentile(values, fraction):
+    """Returns the value at fraction (0 to 1) of the sorted values."""
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else None
+
+
+def startServer(port):
+    """Starts a server process on port and waits until it accepts connections."""
+    server = subprocess.Popen([sys.executable, '-m', 'tools.server', '--port', str(port)], stdout=subprocess.PIPE)
+    server.stdout.readline()  # Listening on ...
+    return server
+
+
+def run(host, port, games, plies, think, processes):
+    """Runs the load test against the server at host and port and returns report as dict."""
+    before = asyncio.run(request(host, port, {'type': 'stats'}))
+    gameIds = ['load%d' % index for index in range(games)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, raiseFileLimit) as pool:
+        results = pool.starmap(_simulate, [(host, port, gameIds[index::processes], plies, think, index)
+                                           for index in range(processes)])
+    seconds = time.perf_counter() - start
+    after = asyncio.run(request(host, port, {'type': 'stats'}))
+    latencies = sorted(latency for result in results for latency in result[0])
+    moves = sum(result[1] for result in results)
+    serverSeconds = after['cpuSeconds'] - before['cpuSeconds']
+    return {'games': games, 'clients': 4 * games, 'plies': plies, 'thinkMs': think * 1000,
+            'clientProcesses': processes, 'moves': moves, 'seconds': round(seconds, 3),
+            'movesPerSecond': round(moves / seconds, 1), 'serverCpuSeconds': round(serverSeconds, 3),
+            'serverUtilization': round(serverSeconds / seconds, 3),
+            'gamesPerCore': int(games * seconds / serverSeconds) if serverSeconds else None,
+            'movesPerCpuSecond': int(moves / serverSeconds) if serverSeconds else None,
+            'latencyMs': {name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+                          for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1))}}
+
+
+def main(argv=None):
+    """Command line interface. Prints the report as JSON to stdout."""
+    parser = argparse.ArgumentParser(description='Load test of the game server with simulated clients playing '
+                                                 'random moves. Reports move latency percentiles and the games one '
+                                                 'server core can host at the simulated pace.')
+    parser.add_argument('--games', type=int, default=1000, help='concurrent games (default: 1000)')
+    parser.add_argument('--plies', type=int, default=100, help='moves per game (default: 100)')
+    parser.add_argument('--think', type=float, default=1.0, help='seconds each client thinks per move '
+                                                                 '(default: 1.0)')
+    parser.add_argument('--processes', type=int, default=0, help='client processes (0 = number of CPUs)')
+    parser.add_argument('--host', default='127.0.0.1', help='server address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=4444, help='server port (default: 4444)')
+    parser.add_argument('--start-server', action='store_true', help='start a server process on the port for the '
+                                                                    'test')
+    args = parser.parse_args(argv)
+
+    raiseFileLimit()
+    server = startServer(args.port) if args.start_server else None
+    try:
+        report = run(args.host, args.port, args.games, args.plies, args.think, args.processes or os.cpu_count())
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    report['python'] = platform.python_version()
+    report['platform'] = platform.platform()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
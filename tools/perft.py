@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from rules.algorithm import Algorithm
+from rules.movegen import Position, OPPONENTS, moveName
+
+# Perft results of previously searched positions, per process: {(position key, depth): nodes}
+_table = None
+_tableSize = 0
+
+
+def perft(position, depth, table=None, tableSize=0):
+    """Returns number of leaf nodes of the legal move tree of position at depth. If table is a dict, subtree counts
+    are looked up in and stored to it (up to tableSize entries)."""
+    if depth == 0:
+        return 1
+    if table is not None:
+        key = (position.key(), depth)
+        nodes = table.get(key)
+        if nodes is not None:
+            return nodes
+    nodes = 0
+    player = position.player
+    opponents = OPPONENTS[player]
+    for move in position.pseudoLegalMoves():
+        position.push(move)
+        king = position.kingSquare(player)
+        if king < 0 or not position.board.isAttacked(king, opponents):
+            nodes += perft(position, depth - 1, table, tableSize) if depth > 1 else 1
+        position.pop()
+    if table is not None and len(table) < tableSize:
+        table[key] = nodes
+    return nodes
+
+
+def divide(position, depth, table=None, tableSize=0):
+    """Returns dict of leaf node counts at depth per legal root move (in coordinate notation)."""
+    counts = {}
+    for move in position.legalMoves():
+        position.push(move)
+        counts[moveName(move)] = perft(position, depth - 1, table, tableSize)
+        position.pop()
+    return counts
+
+
+def _initWorker(tableSize):
+    global _table, _tableSize
+    _table = {} if tableSize else None
+    _tableSize = tableSize
+
+
+def _perftMove(fen4, name, depth):
+    position = Position.fromFen4(fen4)
+    position.push(position.findMoveName(name))
+    return name, perft(position, depth - 1, _table, _tableSize)
+
+
+def parallelDivide(fen4, depth, jobs, tableSize=0, executor=None):
+    """Same as divide(), but the root moves are split across a pool of jobs processes, each with its own table."""
+    position = Position.fromFen4(fen4)
+    names = [moveName(move) for move in position.legalMoves()]
+    if executor is None:
+        with ProcessPoolExecutor(jobs, initializer=_initWorker, initargs=(tableSize,)) as executor:
+            return parallelDivide(fen4, depth, jobs, tableSize, executor)
+    futures = [executor.submit(_perftMove, fen4, name, depth) for name in names]
+    return dict(future.result() for future in futures)
+
+
+def run(fen4, depth, jobs=1, tableSize=0, showDivide=False):
+    """Runs perft for depths 1 to depth and returns report as dict."""
+    report = {'fen4': fen4, 'jobs': jobs, 'hash': tableSize, 'results': []}
+    executor = None
+    if jobs > 1:
+        executor = ProcessPoolExecutor(jobs, initializer=_initWorker, initargs=(tableSize,))
+    table = {} if tableSize else None
+    try:
+        for d in range(1, depth + 1):
+            start = time.perf_counter()
+            if d == 1:
+                counts = {moveName(move): 1 for move in Position.fromFen4(fen4).legalMoves()}
+            elif executor:
+                counts = parallelDivide(fen4, d, jobs, tableSize, executor)
+            else:
+                counts = divide(Position.fromFen4(fen4), d, table, tableSize)
+            seconds = time.perf_counter() - start
+            nodes = sum(counts.values())
+            result = {'depth': d, 'nodes': nodes, 'seconds': round(seconds, 6),
+                      'nps': int(nodes / seconds) if seconds > 0 else None}
+            if showDivide and d == depth:
+                result['divide'] = counts
+            report['results'].append(result)
+    finally:
+        if executor:
+            executor.shutdown()
+    return report
+
+
+def main(argv=None):
+    """Command line interface. Prints one JSON report per position to stdout."""
+    parser = argparse.ArgumentParser(description='Counts legal move paths (perft) of four-player chess positions.')
+    parser.add_argument('depth', type=int, help='maximum depth in plies')
+    parser.add_argument('--fen4', action='append', help='position to search (default: starting position); '
+                                                        'may be given more than once')
+    parser.add_argument('--fen4-file', help='file with one FEN4 per line')
+    parser.add_argument('--divide', action='store_true', help='report node counts per root move at maximum depth')
+    parser.add_argument('--jobs', type=int, default=1, help='number of processes to split root moves across '
+                                                            '(0 = number of CPUs)')
+    parser.add_argument('--hash', type=int, default=0, help='maximum number of cached perft results per process')
+    args = parser.parse_args(argv)
+
+    positions = list(args.fen4 or [])
+    if args.fen4_file:
+        with open(args.fen4_file) as file:
+            positions += [line.strip() for line in file if line.strip()]
+    if not positions:
+        positions = [Algorithm.StartingPosition]
+    jobs = args.jobs or os.cpu_count()
+    for fen4 in positions:
+        try:
+            Position.fromFen4(fen4)
+        except (ValueError, IndexError) as error:
+            print(json.dumps({'fen4': fen4, 'error': str(error)}))
+            continue
+        report = run(fen4, args.depth, jobs, args.hash, args.divide)
+        report['python'] = platform.python_version()
+        report['platform'] = platform.platform()
+        print(json.dumps(report))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from rules.database import GameDatabase
+from rules.movegen import moveName
+from rules.pgn4 import splitGames, parseGame, PGN4Error
+
+
+def findChunks(path, chunkSize, start=0, end=None):
+    """Returns list of (start, end) byte ranges of about chunkSize bytes that each contain whole games, covering byte
+    range [start, end) of path (default: up to the end of the file), which must start and end at game boundaries. A
+    chunk ends where a tag line follows movetext, i.e. at the start of the next game."""
+    end = os.path.getsize(path) if end is None else end
+    starts = [start]
+    with open(path, 'rb') as file:
+        position = start + chunkSize
+        while position < end:
+            file.seek(position)
+            file.readline()  # Skip the rest of a partial line
+            movetext = False
+            boundary = None
+            while True:
+                lineStart = file.tell()
+                line = file.readline()
+                if not line or lineStart >= end:
+                    break
+                stripped = line.strip()
+                if stripped.startswith(b'['):
+                    if movetext:
+                        boundary = lineStart
+                        break
+                elif stripped:
+                    movetext = True
+            if boundary is None:
+                break
+            starts.append(boundary)
+            position = boundary + chunkSize
+    ends = starts[1:] + [end]
+    return list(zip(starts, ends))
+
+
+def pendingChunks(path, chunkSize, done):
+    """Returns list of the chunks of path (see findChunks()) outside of the byte ranges done, which were imported
+    before, possibly with another chunk size. Done ranges start and end at game boundaries, so the chunks do too."""
+    size = os.path.getsize(path)
+    chunks = []
+    position = 0
+    for start, end in sorted(done) + [(size, size)]:
+        if start > position:
+            chunks += findChunks(path, chunkSize, position, start)
+        position = max(position, end)
+    return chunks
+
+
+def normalize(game, keys=False):
+    """Returns game as dict with tags, start FEN4, main line moves in coordinate notation, final FEN4 and error (None
+    if OK). If keys is True, the Zobrist keys of the positions of the main line are added, as needed by
+    GameDatabase."""
+    record = {'tags': game.tags, 'result': game.result, 'startFen4': game.startPosition, 'moves': [], 'fen4': None,
+              'error': game.error}
+    try:
+        position, moves = game.replay()
+        record['moves'] = [moveName(move) for move in moves]
+        record['fen4'] = position.getFen4()
+        if keys:
+            # Walk back to the start position
+            record['keys'] = [position.key()]
+            for _ in moves:
+                position.pop()
+                record['keys'].append(position.key())
+            record['keys'].reverse()
+    except (PGN4Error, ValueError, IndexError) as error:
+        record['error'] = record['error'] or str(error)
+    return record
+
+
+def importChunk(path, start, end, keys=False):
+    """Parses and replays the games in byte range [start, end) of path. Returns (path, start, end, records)."""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    records = []
+    for index, text in enumerate(splitGames(data.decode('utf-8', errors='replace').splitlines(True))):
+        record = normalize(parseGame(text), keys)
+        record['source'] = path
+        record['chunk'] = start
+        record['index'] = index
+        records.append(record)
+    return path, start, end, records
+
+
+class JsonLinesWriter:
+    """Writes normalized games as one JSON object per line. Keeps a progress file next to the output with the finished
+    chunks, so that an interrupted import can be resumed."""
+    needsKeys = False
+
+    def __init__(self, output, resume=False):
+        self.output = output
+        self.progressPath = output + '.progress'
+        self.done = {}  # Source -> list of the byte ranges written by previous runs
+        size = 0
+        if resume and os.path.exists(self.progressPath):
+            progressSize = 0  # End of the last complete entry
+            with open(self.progressPath, 'rb') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Last line was only partly written
+                    if not line.endswith(b'\n'):
+                        break
+                    progressSize += len(line)
+                    source = os.path.realpath(entry['source'])
+                    self.done.setdefault(source, []).append((entry['start'], entry['end']))
+                    size = entry['outputSize']
+            # Drop a partly written entry, so that the next one starts on a line of its own
+            os.truncate(self.progressPath, progressSize)
+        mode = 'r+' if resume and os.path.exists(output) else 'w'
+        self.file = open(output, mode, encoding='utf-8')
+        # Drop output of chunks that were not finished before the interruption
+        self.file.truncate(size)
+        self.file.seek(size)
+        self.progress = open(self.progressPath, 'a' if resume else 'w', encoding='utf-8')
+
+    def doneRanges(self, source):
+        """Returns list of the byte ranges of source written by previous runs."""
+        return self.done.get(source, [])
+
+    def write(self, source, start, end, records):
+        """Writes records of a chunk and marks the chunk as finished."""
+        for record in records:
+            self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.progress.write(json.dumps({'source': source, 'start': start, 'end': end,
+                                        'outputSize': self.file.tell()}) + '\n')
+        self.progress.flush()
+
+    def close(self):
+        self.file.close()
+        self.progress.close()
+
+
+class DatabaseWriter:
+    """Adds normalized games to a GameDatabase. Each chunk is added in one transaction together with its entry in the
+    imports table, so that an interrupted import can be resumed."""
+    needsKeys = True
+
+    def __init__(self, path, resume=False):
+        if not resume and os.path.exists(path):
+            raise FileExistsError('Database exists, use --resume to add to it: %s' % path)
+        self.database = GameDatabase(path)
+        self.database.beginBulkImport()
+
+    def doneRanges(self, source):
+        """Returns list of the byte ranges of source added by previous runs."""
+        return self.database.importedRanges(source)
+
+    def write(self, source, start, end, records):
+        """Adds records of a chunk and marks the chunk as finished."""
+        self.database.addGames(records, source, start, end)
+
+    def close(self):
+        self.database.endBulkImport()
+        self.database.close()
+
+
+def run(paths, writer, jobs=1, chunkSize=1 << 24, report=None):
+    """Imports PGN4 files with a pool of jobs processes and passes each finished chunk to writer. Calls report with a
+    statistics dict after every chunk. Returns the final statistics."""
+    chunks = []
+    for path in paths:
+        path = os.path.realpath(path)  # The same file is resumed under any name
+        chunks += [(path, start, end) for start, end in pendingChunks(path, chunkSize, writer.doneRanges(path))]
+    stats = {'chunks': len(chunks), 'chunksDone': 0, 'games': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0,
+             'gamesPerSecond': 0.0, 'megabytesPerSecond': 0.0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(jobs) as executor:
+        pending = set()
+        queue = iter(chunks)
+        while True:
+            # Keep a bounded number of chunks in flight, so that memory use does not depend on the input size
+            for chunk in queue:
+                pending.add(executor.submit(importChunk, *chunk, writer.needsKeys))
+                if len(pending) >= 2 * jobs:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, chunkStart, chunkEnd, records = future.result()
+                writer.write(path, chunkStart, chunkEnd, records)
+                stats['chunksDone'] += 1
+                stats['games'] += len(records)
+                stats['errors'] += sum(1 for record in records if record['error'])
+                stats['bytes'] += chunkEnd - chunkStart
+            stats['seconds'] = round(time.perf_counter() - start, 3)
+            if stats['seconds']:
+                stats['gamesPerSecond'] = round(stats['games'] / stats['seconds'], 1)
+                stats['megabytesPerSecond'] = round(stats['bytes'] / stats['seconds'] / 1e6, 3)
+            if report:
+                report(stats)
+    return stats
+
+
+def main(argv=None):
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Imports PGN4 files in parallel into normalized JSON lines '
+                                                 '(tags, moves, final FEN4, errors) or a game database.')
+    parser.add_argument('paths', nargs='+', help='PGN4 files')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--output', help='output file (JSON lines)')
+    output.add_argument('--database', help='SQLite game database (see rules/database.py)')
+    parser.add_argument('--jobs', type=int, default=0, help='number of processes (default: number of CPUs)')
+    parser.add_argument('--chunk-size', type=float, default=16, help='chunk size in MB')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted import into the same output')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        sys.stderr.write('\r%(chunksDone)d/%(chunks)d chunks, %(games)d games (%(errors)d errors), '
+                         '%(gamesPerSecond).1f games/s, %(megabytesPerSecond).2f MB/s' % stats)
+        sys.stderr.flush()
+
+    if args.database:
+        writer = DatabaseWriter(args.database, args.resume)
+    else:
+        writer = JsonLinesWriter(args.output, args.resume)
+    try:
+        stats = run(args.paths, writer, args.jobs or os.cpu_count(), int(args.chunk_size * (1 << 20)),
+                    None if args.quiet else report)
+    finally:
+        writer.close()
+    if not args.quiet:
+        sys.stderr.write('\n')
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import sys
+from rules.gameserver import GameServer, startServer
+
+
+def raiseFileLimit():
+    """Raises the limit of open files to the maximum, since every client takes a socket."""
+    try:
+        import resource
+    except ImportError:
+        return  # Not on Unix
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run(host, port, websocketPort):
+    """Serves until cancelled."""
+    servers = await startServer(GameServer(), host, port, websocketPort)
+    print('Listening on %s port %d%s' % (host, port, ' and WebSocket port %d' % websocketPort
+                                          if websocketPort is not None else ''))
+    sys.stdout.flush()
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def main(argv=None):
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Hosts Teams games for clients sending JSON messages over TCP (one '
+                                                 'per line) or WebSocket (see rules/gameserver.py).')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=4444, help='TCP port (default: 4444)')
+    parser.add_argument('--websocket-port', type=int, help='WebSocket port (default: none)')
+    args = parser.parse_args(argv)
+
+    raiseFileLimit()
+    try:
+        asyncio.run(run(args.host, args.port, args.websocket_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of the Four-Player Chess project, a four-player chess GUI.
+#
+# Copyright (C) 2018, GammaDeltaII
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+from rules.algorithm import Algorithm, Teams
+from rules.bitboard import FILES
+from rules.search import MAX_DEPTH, PARANOID, Search
+
+MAX_PLIES = 400  # Games still running after this many plies are adjudicated a draw
+REPETITIONS = 3  # A position occurring this often is a draw
+CONFIG_KEYS = {'mode': str, 'depth': int, 'nodes': int, 'movetime': int, 'hash': int}  # Keys of config strings
+
+# Searches of the configurations, per process: {config name: Search}
+_searches = {}
+
+
+def parseConfig(text):
+    """Returns engine configuration dict from 'name:key=value,...' (keys: mode, depth, nodes, movetime in
+    milliseconds, hash in table entries). Raises ValueError if it is invalid."""
+    name, _, settings = text.partition(':')
+    config = {'name': name.strip(), 'mode': PARANOID, 'depth': MAX_DEPTH, 'nodes': None, 'movetime': None,
+              'hash': 1 << 20}
+    if not config['name']:
+        raise ValueError('Configuration without name: %r' % text)
+    for setting in filter(None, settings.split(',')):
+        key, _, value = setting.partition('=')
+        key = key.strip()
+        if key not in CONFIG_KEYS:
+            raise ValueError('Unknown setting %r in configuration %r' % (key, text))
+        config[key] = CONFIG_KEYS[key](value.strip())
+    if config['depth'] == MAX_DEPTH and not config['nodes'] and not config['movetime']:
+        raise ValueError('Configuration %r needs a depth, nodes or movetime limit' % text)
+    return config
+
+
+def schedule(configs, rounds):
+    """Returns list of game jobs (index, seats, opening seed): every pair of configurations plays rounds pairs of
+    games. Both games of a pair start with the same opening, with the configurations changing sides, so that each
+    plays Red and Yellow in one and Blue and Green in the other."""
+    jobs = []
+    for first, second in combinations(configs, 2):
+        for _ in range(rounds):
+            seed = len(jobs)
+            for red, blue in ((first, second), (second, first)):
+                jobs.append((len(jobs), {'r': red, 'b': blue, 'y': red, 'g': blue}, seed))
+    return jobs
+
+
+def randomOpening(game, plies, seed):
+    """Plays plies random legal moves, so that the games of a tournament do not all follow the same line."""
+    generator = random.Random(seed)
+    for _ in range(plies):
+        moves = game.legalMoves()
+        if not moves or game.result != Algorithm.NoResult:
+            return
+        fromSquare, toSquare, flag, promotion = generator.choice(moves)
+        game.makeMove(fromSquare % FILES, fromSquare // FILES, toSquare % FILES, toSquare // FILES, promotion or 'Q')
+
+
+def _initWorker():
+    global _searches
+    _searches = {}
+
+
+def _playGame(index, seats, seed, openingPlies, maxPlies):
+    """Plays a game with the configurations of seats (player -> config) and returns its record as dict."""
+    start = time.process_time()
+    game = Teams()
+    game.newGame()
+    game.updatePlayerNames(*(seats[player]['name'] for player in 'rbyg'))
+    randomOpening(game, openingPlies, seed)
+    for config in seats.values():
+        search = _searches.setdefault(config['name'], Search(config['mode'], config['hash']))
+        search.clear()  # Games do not depend on the games played before by the process
+    nodes = {config['name']: 0 for config in seats.values()}
+    repetitions = {}
+    termination = 'checkmate or stalemate'
+    while game.result == Algorithm.NoResult:
+        key = game.getKey()
+        repetitions[key] = repetitions.get(key, 0) + 1
+        if repetitions[key] >= REPETITIONS:
+            game.setResult(Algorithm.Draw)
+            termination = 'repetition'
+            break
+        if game.moveNumber >= maxPlies:
+            game.setResult(Algorithm.Draw)
+            termination = 'adjudication'
+            break
+        config = seats[game.currentPlayer]
+        search = _searches[config['name']]
+        move = search.search(game.getPosition(), config['depth'],
+                             config['movetime'] / 1000 if config['movetime'] else None, config['nodes'])[0]
+        nodes[config['name']] += search.nodes
+        fromSquare, toSquare, flag, promotion = move
+        game.makeMove(fromSquare % FILES, fromSquare // FILES, toSquare % FILES, toSquare // FILES, promotion or 'Q')
+    return {'index': index, 'red': seats['r']['name'], 'blue': seats['b']['name'], 'result': game.result,
+            'termination': termination, 'plies': game.moveNumber, 'nodes': nodes,
+            'cpuSeconds': time.process_time() - start, 'pgn4': game.getPgn4()}
+
+
+def eloDifference(score):
+    """Returns Elo difference corresponding to score (fraction of the points), clamped to +-1000 at 0 and 1."""
+    score = min(max(score, 1e-3), 1 - 1e-3)
+    return -400 * math.log10(1 / score - 1)
+
+
+def standings(configs, games):
+    """Returns dict of results per configuration and per pair of configurations: points, games, score and Elo
+    difference with 95% error bars, from the normal approximation of the per-game points."""
+    points = {}  # (config, opponent) -> list of points per game (1, 0.5 or 0)
+    for record in games:
+        team1, team2 = record['red'], record['blue']
+        value = {Algorithm.Team1Wins: 1.0, Algorithm.Team2Wins: 0.0}.get(record['result'], 0.5)
+        points.setdefault((team1, team2), []).append(value)
+        points.setdefault((team2, team1), []).append(1 - value)
+
+    def summary(values):
+        count = len(values)
+        score = sum(values) / count
+        deviation = math.sqrt(sum((value - score) ** 2 for value in values) / count)
+        margin = 1.96 * deviation / math.sqrt(count)
+        elo = eloDifference(score)
+        return {'games': count, 'points': sum(values), 'score': round(score, 4), 'elo': round(elo, 1) + 0,
+                'eloError': round((eloDifference(score + margin) - eloDifference(score - margin)) / 2, 1)}
+
+    names = [config['name'] for config in configs]
+    report = {'configs': {}, 'pairs': []}
+    for name in names:
+        values = [value for (config, _), pair in points.items() if config == name for value in pair]
+        if values:
+            report['configs'][name] = summary(values)
+    for first, second in combinations(names, 2):
+        if (first, second) in points:
+            report['pairs'].append(dict(summary(points[(first, second)]), config=first, opponent=second))
+    return report
+
+
+def run(configs, rounds, jobs, openingPlies=4, maxPlies=MAX_PLIES, pgn4File=None):
+    """Plays the tournament in a pool of jobs processes and returns report as dict. Games are written to pgn4File
+    as they finish."""
+    gameJobs = schedule(configs, rounds)
+    games = []
+    start = time.perf_counter()
+    startTimes = os.times()
+    with ProcessPoolExecutor(jobs, initializer=_initWorker) as executor:
+        futures = [executor.submit(_playGame, index, seats, seed, openingPlies, maxPlies)
+                   for index, seats, seed in gameJobs]
+        for future in as_completed(futures):
+            record = future.result()
+            if pgn4File:
+                pgn4File.write(record['pgn4'] + '\n\n')
+                pgn4File.flush()
+            del record['pgn4']
+            games.append(record)
+    seconds = time.perf_counter() - start
+    endTimes = os.times()
+    cpuSeconds = endTimes.children_user + endTimes.children_system - startTimes.children_user - \
+        startTimes.children_system
+    if not cpuSeconds:
+        cpuSeconds = sum(record['cpuSeconds'] for record in games)  # Workers still running on this platform
+    games.sort(key=lambda record: record['index'])
+    report = {'configs': configs, 'rounds': rounds, 'jobs': jobs, 'games': len(games),
+              'seconds': round(seconds, 3), 'gamesPerSecond': round(len(games) / seconds, 3),
+              'cpuSeconds': round(cpuSeconds, 3), 'cpuUtilization': round(cpuSeconds / (seconds * jobs), 3),
+              'results': {result: sum(record['result'] == result for record in games)
+                          for result in (Algorithm.Team1Wins, Algorithm.Team2Wins, Algorithm.Draw)},
+              'plies': sum(record['plies'] for record in games)}
+    report.update(standings(configs, games))
+    report['configs'] = {config['name']: dict(config, **report['configs'].get(config['name'], {}))
+                         for config in configs}
+    return report
+
+
+def main(argv=None):
+    """Command line interface. Prints the tournament report as JSON to stdout."""
+    parser = argparse.ArgumentParser(description='Plays a self-play tournament of Teams games between engine '
+                                                 'configurations.')
+    parser.add_argument('--config', action='append', required=True,
+                        help="engine configuration 'name:key=value,...' with keys mode (paranoid or max-n), depth, "
+                             "nodes, movetime (milliseconds per move) and hash (table entries), e.g. "
+                             "'fast:nodes=2000'; give at least two")
+    parser.add_argument('--rounds', type=int, default=10, help='pairs of games per pair of configurations '
+                                                              '(default: 10)')
+    parser.add_argument('--jobs', type=int, default=0, help='number of processes playing games (0 = number of CPUs)')
+    parser.add_argument('--opening-plies', type=int, default=4, help='random moves at the start of each pair of '
+                                                                     'games (default: 4)')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='plies after which a game is a draw '
+                                                                         '(default: %d)' % MAX_PLIES)
+    parser.add_argument('--pgn4', help='file to write the games to in PGN4')
+    args = parser.parse_args(argv)
+
+    try:
+        configs = [parseConfig(text) for text in args.config]
+    except ValueError as error:
+        parser.error(str(error))
+    if len(configs) < 2 or len({config['name'] for config in configs}) < len(configs):
+        parser.error('at least two configurations with different names are needed')
+    pgn4File = open(args.pgn4, 'w') if args.pgn4 else None
+    try:
+        report = run(configs, args.rounds, args.jobs or os.cpu_count(), args.opening_plies, args.max_plies,
+                     pgn4File)
+    finally:
+        if pgn4File:
+            pgn4File.close()
+    report['python'] = platform.python_version()
+    report['platform'] = platform.platform()
+    print(json.dumps(report, indent=2))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -122,19 +122,27 @@ class Ui_mainWindow(object):
         self.lastMoveButton.setStyleSheet("background-color: rgb(180, 180, 180);")
         self.lastMoveButton.setObjectName("lastMoveButton")
         self.gridLayout_2.addWidget(self.lastMoveButton, 1, 3, 1, 1)
-        self.moveListWidget = QtWidgets.QListWidget(self.moveListTab)
-        self.moveListWidget.setMinimumSize(QtCore.QSize(300, 0))
+        self.moveListView = QtWidgets.QListView(self.moveListTab)
+        self.moveListView.setMinimumSize(QtCore.QSize(300, 0))
         font = QtGui.QFont()
         font.setBold(True)
         font.setWeight(75)
-        self.moveListWidget.setFont(font)
-        self.moveListWidget.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.moveListWidget.setStyleSheet("background-color: rgb(255, 255, 255);")
-        self.moveListWidget.setFrameShape(QtWidgets.QFrame.StyledPanel)
-        self.moveListWidget.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
-        self.moveListWidget.setProperty("showDropIndicator", False)
-        self.moveListWidget.setObjectName("moveListWidget")
-        self.gridLayout_2.addWidget(self.moveListWidget, 0, 0, 1, 4)
+        self.moveListView.setFont(font)
+        self.moveListView.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.moveListView.setStyleSheet("background-color: rgb(255, 255, 255);")
+        self.moveListView.setFrameShape(QtWidgets.QFrame.StyledPanel)
+        self.moveListView.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.moveListView.setProperty("showDropIndicator", False)
+        self.moveListView.setWordWrap(True)
+        self.moveListView.setObjectName("moveListView")
+        self.gridLayout_2.addWidget(self.moveListView, 0, 0, 1, 4)
+        self.explorer = Explorer(self.moveListTab)
+        self.explorer.setMinimumSize(QtCore.QSize(300, 0))
+        self.explorer.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.explorer.setStyleSheet("background-color: rgb(255, 255, 255);")
+        self.explorer.setRootIsDecorated(False)
+        self.explorer.setObjectName("explorer")
+        self.gridLayout_2.addWidget(self.explorer, 0, 4, 2, 1)
         self.tabWidget.addTab(self.moveListTab, "")
         self.pgnTab = QtWidgets.QWidget()
         self.pgnTab.setObjectName("pgnTab")
@@ -173,6 +181,8 @@ class Ui_mainWindow(object):
         self.menuEdit.setObjectName("menuEdit")
         self.menuView = QtWidgets.QMenu(self.menubar)
         self.menuView.setObjectName("menuView")
+        self.menuEngine = QtWidgets.QMenu(self.menubar)
+        self.menuEngine.setObjectName("menuEngine")
         mainWindow.setMenuBar(self.menubar)
         self.statusbar = QtWidgets.QStatusBar(mainWindow)
         self.statusbar.setObjectName("statusbar")
@@ -200,9 +210,26 @@ class Ui_mainWindow(object):
         self.actionFlip_Board.setObjectName("actionFlip_Board")
         self.actionNew_Game = QtWidgets.QAction(mainWindow)
         self.actionNew_Game.setObjectName("actionNew_Game")
+        self.actionOpen_Database = QtWidgets.QAction(mainWindow)
+        self.actionOpen_Database.setObjectName("actionOpen_Database")
+        self.actionEngine_Move = QtWidgets.QAction(mainWindow)
+        self.actionEngine_Move.setObjectName("actionEngine_Move")
+        self.actionAnalyze = QtWidgets.QAction(mainWindow)
+        self.actionAnalyze.setCheckable(True)
+        self.actionAnalyze.setObjectName("actionAnalyze")
+        self.actionMax_N = QtWidgets.QAction(mainWindow)
+        self.actionMax_N.setCheckable(True)
+        self.actionMax_N.setObjectName("actionMax_N")
+        self.actionSearch_Threads = QtWidgets.QAction(mainWindow)
+        self.actionSearch_Threads.setObjectName("actionSearch_Threads")
+        self.actionExternal_Engine = QtWidgets.QAction(mainWindow)
+        self.actionExternal_Engine.setObjectName("actionExternal_Engine")
+        self.actionAnalyze_Game = QtWidgets.QAction(mainWindow)
+        self.actionAnalyze_Game.setObjectName("actionAnalyze_Game")
         self.menuFile.addAction(self.actionNew_Game)
         self.menuFile.addAction(self.actionLoad_Game)
         self.menuFile.addAction(self.actionSave_Game_As)
+        self.menuFile.addAction(self.actionOpen_Database)
         self.menuFile.addSeparator()
         self.menuFile.addAction(self.actionQuit)
         self.menuEdit.addAction(self.actionCopy_FEN4)
@@ -210,9 +237,16 @@ class Ui_mainWindow(object):
         self.menuView.addAction(self.actionRotate_Board_Left)
         self.menuView.addAction(self.actionRotate_Board_Right)
         self.menuView.addAction(self.actionFlip_Board)
+        self.menuEngine.addAction(self.actionEngine_Move)
+        self.menuEngine.addAction(self.actionAnalyze)
+        self.menuEngine.addAction(self.actionMax_N)
+        self.menuEngine.addAction(self.actionSearch_Threads)
+        self.menuEngine.addAction(self.actionExternal_Engine)
+        self.menuEngine.addAction(self.actionAnalyze_Game)
         self.menubar.addAction(self.menuFile.menuAction())
         self.menubar.addAction(self.menuEdit.menuAction())
         self.menubar.addAction(self.menuView.menuAction())
+        self.menubar.addAction(self.menuEngine.menuAction())
 
         self.retranslateUi(mainWindow)
         self.tabWidget.setCurrentIndex(0)
@@ -240,6 +274,12 @@ class Ui_mainWindow(object):
         self.prevMoveButton.setText(_translate("mainWindow", "<"))
         self.firstMoveButton.setText(_translate("mainWindow", "<<"))
         self.lastMoveButton.setText(_translate("mainWindow", ">>"))
+        self.explorer.headerItem().setText(0, _translate("mainWindow", "Move"))
+        self.explorer.headerItem().setText(1, _translate("mainWindow", "Games"))
+        self.explorer.headerItem().setText(2, _translate("mainWindow", "1-0"))
+        self.explorer.headerItem().setText(3, _translate("mainWindow", "0-1"))
+        self.explorer.headerItem().setText(4, _translate("mainWindow", "1/2"))
+        self.explorer.headerItem().setText(5, _translate("mainWindow", "Rating"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.moveListTab), _translate("mainWindow", "Move List"))
         self.getPgnButton.setText(_translate("mainWindow", "Get"))
         self.savePgnButton.setText(_translate("mainWindow", "Save"))
@@ -248,6 +288,7 @@ class Ui_mainWindow(object):
         self.menuFile.setTitle(_translate("mainWindow", "File"))
         self.menuEdit.setTitle(_translate("mainWindow", "Edit"))
         self.menuView.setTitle(_translate("mainWindow", "View"))
+        self.menuEngine.setTitle(_translate("mainWindow", "Engine"))
         self.actionLoad_Game.setText(_translate("mainWindow", "Load Game..."))
         self.actionLoad_Game.setToolTip(_translate("mainWindow", "Load Game..."))
         self.actionLoad_Game.setShortcut(_translate("mainWindow", "Ctrl+O"))
@@ -272,4 +313,19 @@ class Ui_mainWindow(object):
         self.actionNew_Game.setText(_translate("mainWindow", "New Game"))
         self.actionNew_Game.setStatusTip(_translate("mainWindow", "Start new game"))
         self.actionNew_Game.setShortcut(_translate("mainWindow", "Ctrl+N"))
-
+        self.actionOpen_Database.setText(_translate("mainWindow", "Open Game Database..."))
+        self.actionOpen_Database.setStatusTip(_translate("mainWindow", "Open game database for the opening explorer"))
+        self.actionEngine_Move.setText(_translate("mainWindow", "Play Engine Move"))
+        self.actionEngine_Move.setStatusTip(_translate("mainWindow", "Let the engine play a move for the current player"))
+        self.actionEngine_Move.setShortcut(_translate("mainWindow", "Ctrl+E"))
+        self.actionAnalyze.setText(_translate("mainWindow", "Analyze"))
+        self.actionAnalyze.setStatusTip(_translate("mainWindow", "Analyze the current position continuously"))
+        self.actionMax_N.setText(_translate("mainWindow", "Max-n Search"))
+        self.actionMax_N.setStatusTip(_translate("mainWindow", "Search with max-n instead of paranoid"))
+        self.actionSearch_Threads.setText(_translate("mainWindow", "Search Threads..."))
+        self.actionSearch_Threads.setStatusTip(_translate("mainWindow", "Set number of search threads"))
+        self.actionExternal_Engine.setText(_translate("mainWindow", "External Engine..."))
+        self.actionExternal_Engine.setStatusTip(_translate("mainWindow", "Use an external engine process"))
+        self.actionAnalyze_Game.setText(_translate("mainWindow", "Analyze Game"))
+        self.actionAnalyze_Game.setStatusTip(_translate("mainWindow", "Annotate the moves of the current game"))
+from gui.explorer import Explorer